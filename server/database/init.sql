@@ -57,6 +57,7 @@ CREATE TABLE IF NOT EXISTS problems (
     answer TEXT,                             -- Ответ на задачу
     url TEXT,                                -- URL задачи на сайте СДАМ ГИА
     source TEXT DEFAULT 'sdamgia',          -- Источник данных (sdamgia, manual и т.д.)
+    content_hash TEXT,                      -- SHA-256 условия, решения, ответа и изображений (scripts/content_hash.py)
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
@@ -152,6 +153,85 @@ CREATE TABLE IF NOT EXISTS test_problems (
 CREATE INDEX IF NOT EXISTS idx_test_problems_test_id ON test_problems(test_id);
 CREATE INDEX IF NOT EXISTS idx_test_problems_problem_id ON test_problems(problem_id);
 
+-- Таблица связи изображений задач с файлами хранилища (image_tasksdb/blobs)
+CREATE TABLE IF NOT EXISTS problem_image_blobs (
+    image_table TEXT NOT NULL,              -- problem_condition_images или problem_solution_images
+    image_id INTEGER NOT NULL,              -- id строки в этой таблице
+    blob_hash TEXT NOT NULL,                -- SHA-256 файла в image_tasksdb/blobs
+    PRIMARY KEY (image_table, image_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_problem_image_blobs_hash ON problem_image_blobs(blob_hash);
+
+CREATE TRIGGER IF NOT EXISTS delete_condition_image_blob
+    AFTER DELETE ON problem_condition_images
+    FOR EACH ROW
+BEGIN
+    DELETE FROM problem_image_blobs WHERE image_table = 'problem_condition_images' AND image_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_solution_image_blob
+    AFTER DELETE ON problem_solution_images
+    FOR EACH ROW
+BEGIN
+    DELETE FROM problem_image_blobs WHERE image_table = 'problem_solution_images' AND image_id = OLD.id;
+END;
+
+-- Аналоги задач по ID СДАМ ГИА со страниц задач (связи problem_analogs создает scripts/analog_links.py)
+CREATE TABLE IF NOT EXISTS pending_analogs (
+    subject_id INTEGER NOT NULL,            -- Предмет (ID задач СДАМ ГИА уникальны в пределах предмета)
+    problem_id TEXT NOT NULL,               -- ID задачи из СДАМ ГИА
+    analog_problem_id TEXT NOT NULL,        -- ID аналога из СДАМ ГИА (может быть еще не загружен)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, problem_id, analog_problem_id)
+);
+
+-- Состав категорий по ID СДАМ ГИА из get_category_by_id (связи category_problems создает scripts/category_index.py)
+CREATE TABLE IF NOT EXISTS category_index (
+    subject_id INTEGER NOT NULL,            -- Предмет (ID категорий и задач СДАМ ГИА уникальны в пределах предмета)
+    category_id TEXT NOT NULL,              -- ID категории из СДАМ ГИА
+    problem_id TEXT NOT NULL,               -- ID задачи из СДАМ ГИА (может быть еще не загружена)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, category_id, problem_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_index_problem ON category_index(subject_id, problem_id);
+
+-- Журнал обхода каталога для возобновления загрузки (scripts/crawl_journal.py, --resume)
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    run_id TEXT PRIMARY KEY,
+    loader TEXT NOT NULL,                   -- Скрипт загрузки (load_tasks_batch, load_tasks)
+    subject_code TEXT NOT NULL,
+    exam_type TEXT NOT NULL,
+    target_count INTEGER,                   -- Сколько задач нужно загрузить
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME                    -- NULL - запуск не завершен
+);
+
+CREATE TABLE IF NOT EXISTS crawl_journal_categories (
+    run_id TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    problem_count INTEGER NOT NULL,         -- Сколько задач категории вошло в план
+    PRIMARY KEY (run_id, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS crawl_journal (
+    run_id TEXT NOT NULL,
+    subject_code TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    position INTEGER NOT NULL,              -- Порядок задачи в плане
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, category_id, problem_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_crawl_journal_state ON crawl_journal(run_id, state);
+
 -- Триггеры для автоматического обновления updated_at
 CREATE TRIGGER IF NOT EXISTS update_subjects_timestamp 
     AFTER UPDATE ON subjects
@@ -3,24 +3,37 @@
 """
 Скрипт для загрузки заданий из СДАМ ГИА в БД
 Загружает по 20 заданий для биологии ОГЭ и математики базы ОГЭ
+
+--refresh перепроверяет уже загруженные задачи этих предметов и переписывает
+только те, у которых изменился хэш содержимого (scripts/content_hash.py)
 """
 
 import sys
-import os
 import json
-import sqlite3
+import argparse
 from pathlib import Path
 
-# Исправляем кодировку для Windows
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
-
 # Добавляем путь к модулю sdamgia-api
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'sdamgia-api'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
 
 from sdamgia import SdamGIA
+from rate_limiter import api_host
+from http_client import use_base_url
+from http_cache import cached_call
+from image_store import get_image_store, ensure_schema, link_image_row
+from id_cache import IdCache
+from known_problems import KnownProblems
+from analog_links import ensure_schema as ensure_analog_schema, record_analogs, resolve_analogs
+from category_index import ensure_schema as ensure_category_schema, record_category, link_categories
+from content_hash import (ensure_schema as ensure_content_hash_schema, problem_content_hash, stored_hash,
+                          stored_hashes, refresh_stats, CHANGED, UNCHANGED, REMOVED)
+from catalog_service import get_catalog, catalog_service
+from bulk_ingest import connect_for_ingest, add_bulk_arguments, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SECONDS
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+log = get_logger(__name__)
 
 # Пути
 DB_PATH = Path(__file__).parent.parent / 'tasksbd.db'
@@ -29,105 +42,58 @@ IMAGES_DIR = Path(__file__).parent.parent / 'image_tasksdb'
 # Создаем папку для изображений
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-sdamgia = SdamGIA()
+sdamgia = use_base_url(SdamGIA())
+_id_caches = {}
 
 def init_db_if_needed():
     """Проверяет существование БД и создает таблицы если нужно"""
     if not DB_PATH.exists():
-        print("❌ База данных не найдена! Сначала создайте БД: npm run db:init")
+        log.error("База данных не найдена! Сначала создайте БД: npm run db:init")
         sys.exit(1)
 
-def get_db_connection():
-    """Возвращает подключение к БД"""
-    return sqlite3.connect(str(DB_PATH))
+def get_db_connection(bulk=False, batch_size=DEFAULT_BATCH_SIZE, batch_seconds=DEFAULT_BATCH_SECONDS):
+    """Возвращает подключение к БД (в пакетном режиме commit() откладывается до конца пакета)"""
+    db = connect_for_ingest(DB_PATH, bulk, batch_size, batch_seconds)
+    ensure_schema(db)
+    ensure_content_hash_schema(db)
+    ensure_analog_schema(db)
+    ensure_category_schema(db)
+    get_id_cache(db)
+    return db
+
+def get_id_cache(db):
+    """Кэш ID предметов/тем/категорий для подключения (прогревается один раз)"""
+    ids = _id_caches.get(db)
+    if ids is None:
+        ids = _id_caches[db] = IdCache(db)
+        ids.warm()
+    return ids
 
 def upsert_subject(db, code, name, exam_type='oge'):
     """Добавляет или обновляет предмет"""
-    cursor = db.cursor()
-    cursor.execute(
-        'SELECT id FROM subjects WHERE code = ? AND exam_type = ?',
-        (code, exam_type)
-    )
-    existing = cursor.fetchone()
-    
-    if existing:
-        return existing[0]
-    
-    cursor.execute(
-        'INSERT INTO subjects (code, name, exam_type) VALUES (?, ?, ?)',
-        (code, name, exam_type)
-    )
-    db.commit()
-    return cursor.lastrowid
+    return get_id_cache(db).subject(code, exam_type, name)
 
 def upsert_topic(db, subject_id, topic_number, topic_name, topic_line=None):
-    """Добавляет или обновляет задание"""
-    cursor = db.cursor()
-    cursor.execute(
-        'SELECT id FROM topics WHERE subject_id = ? AND topic_number = ?',
-        (subject_id, topic_number)
-    )
-    existing = cursor.fetchone()
-    
-    if existing:
-        cursor.execute(
-            'UPDATE topics SET topic_name = ?, topic_line = ? WHERE id = ?',
-            (topic_name, topic_line, existing[0])
-        )
-        db.commit()
-        return existing[0]
-    
-    cursor.execute(
-        'INSERT INTO topics (subject_id, topic_number, topic_name, topic_line) VALUES (?, ?, ?, ?)',
-        (subject_id, topic_number, topic_name, topic_line)
-    )
-    db.commit()
-    return cursor.lastrowid
+    """Добавляет или обновляет задание (UPDATE только если название изменилось)"""
+    return get_id_cache(db).topic(subject_id, topic_number, topic_name, topic_line, update=True)
 
 def upsert_category(db, topic_id, category_id, category_name):
-    """Добавляет или обновляет категорию"""
-    cursor = db.cursor()
-    cursor.execute(
-        'SELECT id FROM categories WHERE topic_id = ? AND category_id = ?',
-        (topic_id, category_id)
-    )
-    existing = cursor.fetchone()
-    
-    if existing:
-        cursor.execute(
-            'UPDATE categories SET category_name = ? WHERE id = ?',
-            (category_name, existing[0])
-        )
-        db.commit()
-        return existing[0]
-    
-    cursor.execute(
-        'INSERT INTO categories (topic_id, category_id, category_name) VALUES (?, ?, ?)',
-        (topic_id, category_id, category_name)
-    )
-    db.commit()
-    return cursor.lastrowid
+    """Добавляет или обновляет категорию (UPDATE только если название изменилось)"""
+    return get_id_cache(db).category(topic_id, category_id, category_name, update=True)
 
-def download_image(url, save_path):
-    """Скачивает изображение по URL"""
-    import urllib.request
+def download_image(url):
+    """
+    Скачивает изображение в хранилище (уже известные URL повторно не скачиваются)
+    
+    Returns:
+        (путь к файлу, хэш файла) или None
+    """
     try:
-        urllib.request.urlretrieve(url, save_path)
-        return True
+        rel_path, blob_hash = get_image_store(IMAGES_DIR).fetch(url, timeout=30)
+        return IMAGES_DIR / rel_path, blob_hash
     except Exception as e:
-        print(f"⚠️  Ошибка загрузки изображения {url}: {e}")
-        return False
-
-def get_image_path(subject_code, problem_id, image_type, image_index, image_url):
-    """Возвращает путь для сохранения изображения"""
-    subject_dir = IMAGES_DIR / subject_code / problem_id
-    subject_dir.mkdir(parents=True, exist_ok=True)
-    
-    # Определяем расширение из URL
-    ext = os.path.splitext(image_url.split('?')[0])[1] or '.png'
-    filename = f"{image_type}_{image_index}{ext}"
-    
-    return subject_dir / filename
+        log.warning(f"Ошибка загрузки изображения {url}: {e}")
+        return None
 
 def format_text_with_images(text, images):
     """Форматирует текст с изображениями"""
@@ -145,71 +111,76 @@ def format_text_with_images(text, images):
     
     return result
 
+@run_metrics.timed('db_write')
 def upsert_problem(db, subject_id, topic_id, problem_id, line, condition_text, 
-                   solution_text, answer, url):
-    """Добавляет или обновляет задачу"""
+                   solution_text, answer, url, content_hash=None):
+    """
+    Добавляет или обновляет задачу (content_hash - см. content_hash.problem_content_hash).
+    UPSERT сохраняет id строки, поэтому изображения и связи задачи не удаляются каскадом;
+    неизменившаяся задача не переписывается (иначе триггер сдвинул бы updated_at)
+    """
     cursor = db.cursor()
-    cursor.execute(
-        'SELECT id FROM problems WHERE subject_id = ? AND problem_id = ?',
-        (subject_id, problem_id)
-    )
-    existing = cursor.fetchone()
-    
-    if existing:
-        cursor.execute(
-            '''UPDATE problems 
-               SET topic_id = ?, line = ?, condition_text = ?, solution_text = ?, 
-                   answer = ?, url = ?, updated_at = CURRENT_TIMESTAMP
-               WHERE id = ?''',
-            (topic_id, line, condition_text, solution_text, answer, url, existing[0])
-        )
-        db.commit()
-        return existing[0]
-    
     cursor.execute(
         '''INSERT INTO problems 
-           (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, source)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'sdamgia')''',
-        (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url)
+           (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, source, content_hash)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'sdamgia', ?)
+           ON CONFLICT(subject_id, problem_id) DO UPDATE SET
+               topic_id = excluded.topic_id, line = excluded.line, condition_text = excluded.condition_text,
+               solution_text = excluded.solution_text, answer = excluded.answer, url = excluded.url,
+               source = excluded.source, content_hash = excluded.content_hash
+           WHERE excluded.content_hash IS NULL
+              OR problems.content_hash IS NOT excluded.content_hash
+              OR problems.topic_id IS NOT excluded.topic_id
+              OR problems.line IS NOT excluded.line
+              OR problems.url IS NOT excluded.url
+              OR problems.source IS NOT excluded.source''',
+        (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, content_hash)
     )
     db.commit()
-    return cursor.lastrowid
+    cursor.execute(
+        'SELECT id FROM problems WHERE subject_id = ? AND problem_id = ?',
+        (subject_id, problem_id)
+    )
+    return cursor.fetchone()[0]
 
 def insert_images(db, problem_id, images, image_type):
-    """Сохраняет изображения в БД"""
+    """
+    Сохраняет изображения в БД. Строки сравниваются с уже сохраненными по порядку:
+    совпавшие не трогаются, изменившиеся обновляются, лишние удаляются
+    """
     cursor = db.cursor()
     table = 'problem_condition_images' if image_type == 'condition' else 'problem_solution_images'
-    cursor.execute(f'DELETE FROM {table} WHERE problem_id = ?', (problem_id,))
-    
-    for index, (url, path) in enumerate(images):
-        cursor.execute(
-            f'INSERT INTO {table} (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)',
-            (problem_id, url, str(path.relative_to(DB_PATH.parent)).replace('\\', '/'), index)
+    existing = {
+        order: (image_id, url, path)
+        for image_id, order, url, path in cursor.execute(
+            f'SELECT id, image_order, image_url, image_path FROM {table} WHERE problem_id = ?', (problem_id,)
         )
-    db.commit()
-
-def link_problem_to_categories(db, problem_id, topic_id):
-    """Связывает задачу со всеми категориями из topic"""
-    if not topic_id:
-        return
+    }
     
-    cursor = db.cursor()
-    cursor.execute('SELECT id FROM categories WHERE topic_id = ?', (topic_id,))
-    categories = cursor.fetchall()
+    for index, (url, path, blob_hash) in enumerate(images):
+        rel_path = str(path.relative_to(DB_PATH.parent)).replace('\\', '/')
+        row = existing.pop(index, None)
+        if row is None:
+            cursor.execute(
+                f'INSERT INTO {table} (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)',
+                (problem_id, url, rel_path, index)
+            )
+            link_image_row(cursor, table, cursor.lastrowid, blob_hash)
+        elif row[1:] != (url, rel_path):
+            cursor.execute(f'UPDATE {table} SET image_url = ?, image_path = ? WHERE id = ?', (url, rel_path, row[0]))
+            link_image_row(cursor, table, row[0], blob_hash)
     
-    for category_id, in categories:
-        cursor.execute(
-            'INSERT OR IGNORE INTO category_problems (category_id, problem_id) VALUES (?, ?)',
-            (category_id, problem_id)
-        )
+    # Изображений стало меньше (строки problem_image_blobs удалит триггер)
+    if existing:
+        cursor.executemany(f'DELETE FROM {table} WHERE id = ?', [(row[0],) for row in existing.values()])
     db.commit()
 
 def load_catalog(db, subject_code, subject_name, exam_type='oge'):
     """Загружает каталог предмета"""
-    print(f'📚 Загружаем каталог для {subject_name}...')
+    log.info(f'Загружаем каталог для {subject_name}...')
     
     try:
-        catalog = sdamgia.get_catalog(subject_code)
+        catalog = get_catalog(sdamgia, subject_code)
         subject_id = upsert_subject(db, subject_code, subject_name, exam_type)
         
         for topic in catalog:
@@ -221,13 +192,17 @@ def load_catalog(db, subject_code, subject_name, exam_type='oge'):
             for category in topic.get('categories', []):
                 upsert_category(db, topic_id, category['category_id'], category['category_name'])
         
-        print(f'✅ Каталог для {subject_name} загружен')
+        log.info(f'Каталог для {subject_name} загружен')
     except Exception as e:
-        print(f'❌ Ошибка загрузки каталога {subject_name}: {e}')
+        log.error(f'Ошибка загрузки каталога {subject_name}: {e}')
 
-def get_problem_ids(subject_code, count=20):
-    """Получает список ID задач для загрузки"""
-    catalog = sdamgia.get_catalog(subject_code)
+def get_problem_ids(db, subject_code, subject_name, count=20, known=None, exam_type='oge'):
+    """
+    Получает список ID задач для загрузки (known - уже загруженные задачи, они пропускаются).
+    Списки задач просмотренных категорий запоминаются в category_index (с еще не загруженными задачами)
+    """
+    catalog = get_catalog(sdamgia, subject_code)
+    subject_id = upsert_subject(db, subject_code, subject_name, exam_type)
     problem_ids = []
     
     for topic in catalog[:5]:  # Первые 5 заданий
@@ -239,26 +214,40 @@ def get_problem_ids(subject_code, count=20):
                 break
             
             try:
-                category_problems = sdamgia.get_category_by_id(
+                category_problems = cached_call(
+                    'category', api_host(subject_code), sdamgia.get_category_by_id,
                     subject_code, category['category_id'], 1
                 )
+                record_category(db.cursor(), subject_id, category['category_id'], category_problems)
+                db.commit()
+                if known is not None:
+                    category_problems = known.unseen(category_problems)
                 to_add = min(4, count - len(problem_ids), len(category_problems))
                 problem_ids.extend(category_problems[:to_add])
             except Exception as e:
-                print(f'⚠️  Не удалось получить задачи из категории {category["category_id"]}: {e}')
+                log.warning(f'Не удалось получить задачи из категории {category["category_id"]}: {e}')
     
     return problem_ids[:count]
 
-def import_problem(db, subject_code, subject_name, problem_id, exam_type='oge'):
-    """Импортирует задачу"""
+@run_metrics.timed('problem')
+def import_problem(db, subject_code, subject_name, problem_id, exam_type='oge', refresh=False):
+    """
+    Импортирует задачу (True - задача сохранена или не изменилась).
+    refresh - задача запрашивается заново мимо кэша и пишется, только если изменился хэш содержимого
+    """
     try:
-        print(f'📥 Загружаем задачу {problem_id} ({subject_code})...')
+        log.debug(f'[{problem_id}] Загружаем задачу ({subject_code})...')
         
-        problem_data = sdamgia.get_problem_by_id(subject_code, problem_id)
+        problem_data = cached_call('problem', api_host(subject_code), sdamgia.get_problem_by_id, subject_code, problem_id,
+                                   max_age=0 if refresh else None)
         
         if not problem_data:
-            print(f'⚠️  Задача {problem_id} не найдена')
-            return
+            if refresh:
+                log.warning(f'[{problem_id}] Задача удалена с сайта', extra={'problem_id': problem_id})
+                refresh_stats.add(REMOVED, problem_id)
+                return True
+            log.warning(f'[{problem_id}] Задача не найдена', extra={'problem_id': problem_id})
+            return False
         
         subject_id = upsert_subject(db, subject_code, subject_name, exam_type)
         
@@ -268,8 +257,7 @@ def import_problem(db, subject_code, subject_name, problem_id, exam_type='oge'):
         
         if problem_data.get('topic'):
             try:
-                catalog = sdamgia.get_catalog(subject_code)
-                topic_info = next((t for t in catalog if t['topic_id'] == problem_data['topic']), None)
+                topic_info = get_catalog(sdamgia, subject_code).topic(problem_data['topic'])
                 
                 if topic_info:
                     topic_id = upsert_topic(
@@ -285,22 +273,29 @@ def import_problem(db, subject_code, subject_name, problem_id, exam_type='oge'):
         # Скачиваем изображения условий
         condition_images = []
         condition_image_paths = []
+        failed_images = 0
         if problem_data.get('condition', {}).get('images'):
-            for i, url in enumerate(problem_data['condition']['images']):
-                img_path = get_image_path(subject_code, problem_id, 'condition', i, url)
-                if download_image(url, str(img_path)):
-                    condition_images.append((url, img_path))
+            for url in problem_data['condition']['images']:
+                downloaded = download_image(url)
+                if downloaded:
+                    img_path, blob_hash = downloaded
+                    condition_images.append((url, img_path, blob_hash))
                     condition_image_paths.append(img_path)
+                else:
+                    failed_images += 1
         
         # Скачиваем изображения решений
         solution_images = []
         solution_image_paths = []
         if problem_data.get('solution', {}).get('images'):
-            for i, url in enumerate(problem_data['solution']['images']):
-                img_path = get_image_path(subject_code, problem_id, 'solution', i, url)
-                if download_image(url, str(img_path)):
-                    solution_images.append((url, img_path))
+            for url in problem_data['solution']['images']:
+                downloaded = download_image(url)
+                if downloaded:
+                    img_path, blob_hash = downloaded
+                    solution_images.append((url, img_path, blob_hash))
                     solution_image_paths.append(img_path)
+                else:
+                    failed_images += 1
         
         # Форматируем текст с изображениями
         condition_text = format_text_with_images(
@@ -312,73 +307,105 @@ def import_problem(db, subject_code, subject_name, problem_id, exam_type='oge'):
             solution_image_paths
         )
         
+        # Неизменившаяся задача не переписывается (изображения с известными URL уже не скачивались)
+        answer = problem_data.get('answer', '')
+        content_hash = problem_content_hash(condition_text, solution_text, answer)
+        known_hash = stored_hash(db, subject_id, problem_id)
+        if content_hash == known_hash:
+            log.debug(f'[{problem_id}] Без изменений', extra={'problem_id': problem_id})
+            if refresh:
+                refresh_stats.add(UNCHANGED)
+            return True
+        if known_hash and failed_images:
+            # Без части изображений хэш изменится, а сохраненная версия полнее - оставляем ее
+            log.error(f'[{problem_id}] Не скачаны изображения: {failed_images}, задача не обновлена',
+                      extra={'problem_id': problem_id})
+            return False
+        
         # Сохраняем задачу
         db_problem_id = upsert_problem(
             db, subject_id, topic_id, problem_id, line,
             condition_text, solution_text,
-            problem_data.get('answer', ''),
-            problem_data.get('url', '')
+            answer,
+            problem_data.get('url', ''),
+            content_hash
         )
         
-        # Сохраняем изображения
-        if condition_images:
-            insert_images(db, db_problem_id, condition_images, 'condition')
-        if solution_images:
-            insert_images(db, db_problem_id, solution_images, 'solution')
+        # Сохраняем изображения (строки сверяются с уже сохраненными)
+        insert_images(db, db_problem_id, condition_images, 'condition')
+        insert_images(db, db_problem_id, solution_images, 'solution')
         
-        # Связываем с категориями
-        if topic_id:
-            link_problem_to_categories(db, db_problem_id, topic_id)
-        
-        # Сохраняем аналогичные задачи (если они уже есть в БД)
-        if problem_data.get('analogs'):
-            cursor = db.cursor()
-            for analog_id in problem_data['analogs']:
-                cursor.execute(
-                    '''INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id)
-                       SELECT ?, p.id FROM problems p
-                       WHERE p.subject_id = ? AND p.problem_id = ?''',
-                    (db_problem_id, subject_id, analog_id)
-                )
+        # Аналоги запоминаются по ID, связи в обе стороны создаст resolve_analogs в конце запуска
+        if problem_data.get('analogs') is not None:
+            record_analogs(db.cursor(), subject_id, problem_id, problem_data['analogs'])
             db.commit()
         
-        print(f'✅ Задача {problem_id} успешно импортирована')
+        if refresh:
+            refresh_stats.add(CHANGED)
+        log.debug(f'[{problem_id}] Задача успешно импортирована', extra={'problem_id': problem_id})
+        return True
         
     except Exception as e:
-        print(f'❌ Ошибка при импорте задачи {problem_id}: {e}')
-        import traceback
-        traceback.print_exc()
+        log.exception(f'[{problem_id}] Ошибка при импорте задачи: {e}', extra={'problem_id': problem_id})
+        return False
 
 def main():
     """Основная функция"""
-    print('🚀 Начинаем загрузку заданий в БД...\n')
+    parser = argparse.ArgumentParser(description='Загрузка заданий из СДАМ ГИА в БД')
+    add_bulk_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    parser.add_argument('--refresh', action='store_true',
+                        help='Перепроверить загруженные задачи и переписать только изменившиеся')
+    args = parser.parse_args()
+    setup_logging(args)
+    
+    log.info('Начинаем загрузку заданий в БД...')
     
     init_db_if_needed()
-    db = get_db_connection()
+    db = get_db_connection(args.bulk, args.batch_size, args.batch_seconds)
     
     try:
         # 1. Загружаем каталоги
         load_catalog(db, 'bio', 'Биология', 'oge')
         load_catalog(db, 'mathb', 'Математика база', 'oge')
-        print()
         
-        # 2. Загружаем задачи по биологии
-        print('🔬 Загружаем задачи по биологии ОГЭ (20 заданий)...')
-        bio_problem_ids = get_problem_ids('bio', 20)
-        print(f'Найдено {len(bio_problem_ids)} задач для загрузки\n')
+        if args.refresh:
+            # 2-3. Перепроверяем уже загруженные задачи
+            for subject_code, subject_name, label in (('bio', 'Биология', 'Биология ОГЭ'),
+                                                      ('mathb', 'Математика база', 'Математика база ОГЭ')):
+                problem_ids = list(stored_hashes(db, subject_code, 'oge'))
+                log.info(f'Обновляем задачи: {label} ({len(problem_ids)})')
+                with Progress(len(problem_ids), label) as progress:
+                    for problem_id in problem_ids:
+                        with db.problem():
+                            progress.advance(import_problem(db, subject_code, subject_name, problem_id, 'oge',
+                                                            refresh=True))
+            log.info(refresh_stats.summary())
+        else:
+            # 2. Загружаем задачи по биологии
+            log.info('Загружаем задачи по биологии ОГЭ (20 заданий)...')
+            bio_problem_ids = get_problem_ids(db, 'bio', 'Биология', 20, KnownProblems(db, 'bio', 'oge'))
+            log.info(f'Найдено {len(bio_problem_ids)} задач для загрузки')
+        
+            with Progress(len(bio_problem_ids), 'Биология ОГЭ') as progress:
+                for problem_id in bio_problem_ids:
+                    with db.problem():
+                        progress.advance(import_problem(db, 'bio', 'Биология', problem_id, 'oge'))
         
-        for problem_id in bio_problem_ids:
-            import_problem(db, 'bio', 'Биология', problem_id, 'oge')
-        print()
+            # 3. Загружаем задачи по математике базе
+            log.info('Загружаем задачи по математике базе ОГЭ (20 заданий)...')
+            mathb_problem_ids = get_problem_ids(db, 'mathb', 'Математика база', 20, KnownProblems(db, 'mathb', 'oge'))
+            log.info(f'Найдено {len(mathb_problem_ids)} задач для загрузки')
         
-        # 3. Загружаем задачи по математике базе
-        print('🔢 Загружаем задачи по математике базе ОГЭ (20 заданий)...')
-        mathb_problem_ids = get_problem_ids('mathb', 20)
-        print(f'Найдено {len(mathb_problem_ids)} задач для загрузки\n')
+            with Progress(len(mathb_problem_ids), 'Математика база ОГЭ') as progress:
+                for problem_id in mathb_problem_ids:
+                    with db.problem():
+                        progress.advance(import_problem(db, 'mathb', 'Математика база', problem_id, 'oge'))
         
-        for problem_id in mathb_problem_ids:
-            import_problem(db, 'mathb', 'Математика база', problem_id, 'oge')
-        print()
+        # Связи аналогов и категорий всех загруженных задач - одним запросом
+        log.info('Связей аналогов добавлено: {}, удалено лишних: {}'.format(*resolve_analogs(db)))
+        log.info('Связей с категориями добавлено: {}, удалено лишних: {}'.format(*link_categories(db)))
         
         # 4. Статистика
         cursor = db.cursor()
@@ -394,15 +421,16 @@ def main():
         )
         mathb_count = cursor.fetchone()[0]
         
-        print('\n📊 Статистика загрузки:')
-        print(f'   Биология ОГЭ: {bio_count} задач')
-        print(f'   Математика база ОГЭ: {mathb_count} задач')
-        print(f'   Всего: {bio_count + mathb_count} задач')
+        log.info(f'Статистика загрузки: биология ОГЭ: {bio_count}, математика база ОГЭ: {mathb_count}, '
+                 f'всего: {bio_count + mathb_count} задач')
+        db.flush()
+        log.info(db.summary())
+        log.info(get_id_cache(db).summary())
+        log.info(catalog_service.summary())
+        write_run_report(args, 'database_load_tasks')
         
     except Exception as e:
-        print(f'❌ Критическая ошибка: {e}')
-        import traceback
-        traceback.print_exc()
+        log.exception(f'Критическая ошибка: {e}')
         sys.exit(1)
     finally:
         db.close()
@@ -1,37 +1,72 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Скрипт для перезагрузки изображений для всех заданий в БД
-Проверяет и скачивает изображения из СДАМ ГИА API
+Скрипт для проверки и перезагрузки изображений всех заданий в БД
+
+Файлы проверяются только по диску (наличие, размер, магические байты, SHA-256),
+заново через HTTP кэш скачиваются лишь отсутствующие и испорченные.
+
+Использование:
+    python reload-images.py                 # проверить и восстановить
+    python reload-images.py --check         # только проверить (без сети)
+    python reload-images.py --quick         # без SHA-256 (размер и начало файла)
+    python reload-images.py --refetch       # и получить изображения задач, у которых их нет
 """
 
 import sys
 import os
-import json
-import sqlite3
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-import requests
-from urllib.parse import urlparse
-
-# Исправляем кодировку для Windows
-if sys.platform == 'win32':
-    import io
-    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 # Добавляем путь к модулю sdamgia-api
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'sdamgia-api'))
+sys.path.insert(0, str(Path(__file__).parent.parent / 'scripts'))
 
 from sdamgia import SdamGIA
+from rate_limiter import api_host
+from http_client import http_get, use_base_url
+from http_cache import cached_get, cached_call
+from image_store import (get_image_store, ensure_schema, link_image_row, looks_like_image, verify_file,
+                         MAGIC_BYTES, BLOB_NAME_RE, BLOB_REF_RE)
+from sqlite_conn import connect
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+log = get_logger(__name__)
+
+# Пути (image_path в таблицах изображений - относительно папки server)
+SERVER_DIR = Path(__file__).parent.parent
+DB_PATH = SERVER_DIR / 'tasksbd.db'
+IMAGES_DIR = SERVER_DIR / 'image_tasksdb'
+
+DEFAULT_WORKERS = 8
 
-# Пути
-DB_PATH = Path(__file__).parent.parent / 'tasksbd.db'
-IMAGES_DIR = Path(__file__).parent.parent / 'image_tasksdb'
+IMAGE_TABLES = {'condition': 'problem_condition_images', 'solution': 'problem_solution_images'}
+
+# Все задачи и их изображения одним запросом: строки таблиц изображений (хэш файла - его имя),
+# а для задач со ссылками на хранилище в тексте (kind = 'markdown') - сам текст в image_path
+STATE_SQL = """
+SELECT p.id, p.problem_id, s.code, i.kind, i.id, i.image_url, i.image_path
+FROM problems p
+JOIN subjects s ON s.id = p.subject_id
+LEFT JOIN (
+    SELECT 'condition' AS kind, id, problem_id, image_url, image_path, image_order FROM problem_condition_images
+    UNION ALL
+    SELECT 'solution', id, problem_id, image_url, image_path, image_order FROM problem_solution_images
+    UNION ALL
+    SELECT 'markdown', NULL, id, NULL, COALESCE(condition_text, '') || char(10) || COALESCE(solution_text, ''), 0
+    FROM problems
+    WHERE condition_text LIKE '%blobs/%' OR solution_text LIKE '%blobs/%'
+) i ON i.problem_id = p.id
+ORDER BY s.code, p.problem_id, i.kind, i.image_order
+"""
 
 # Создаем папку для изображений
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
-sdamgia = SdamGIA()
+sdamgia = use_base_url(SdamGIA())
 
 def get_oge_base_url(subject_code):
     """Получает базовый URL для ОГЭ по коду предмета"""
@@ -55,19 +90,21 @@ def get_oge_base_url(subject_code):
 
 def get_problem_data_oge(subject_code, problem_id):
     """Получает данные задачи для ОГЭ напрямую с сайта"""
-    import requests
     from bs4 import BeautifulSoup
+    from html_backend import strainer, PROB_MAINDIV
     
     base_url = get_oge_base_url(subject_code)
     url = f'{base_url}/problem?id={problem_id}'
     
     try:
-        response = requests.get(url, timeout=30)
+        response = cached_get(url, timeout=30)
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
+        # Строим только блок задачи, остальная страница не разбирается
+        soup = BeautifulSoup(response.content, 'html.parser', parse_only=strainer(PROB_MAINDIV))
         prob_block = soup.find('div', {'class': 'prob_maindiv'})
         
         if prob_block is None:
+            soup.decompose()
             return None
         
         # Парсим изображения из условия
@@ -91,210 +128,280 @@ def get_problem_data_oge(subject_code, problem_id):
                         src = base_url + src
                     solution_images.append(src)
         
+        soup.decompose()
         return {
             'condition': {'images': condition_images},
             'solution': {'images': solution_images}
         }
     except Exception as e:
-        print(f'  ⚠️  Ошибка получения данных с сайта: {e}')
+        log.warning(f'[{problem_id}] Ошибка получения данных с сайта: {e}', extra={'problem_id': problem_id})
         return None
 
-def download_image(image_url, save_path):
-    """Скачивает изображение по URL"""
+@run_metrics.timed('image')
+def download_image(image_url):
+    """
+    Скачивает изображение в хранилище (если его там еще нет)
+    
+    Returns:
+        (путь к файлу, хэш файла) или None
+    """
+    store = get_image_store(IMAGES_DIR)
     try:
-        # Создаем директорию, если её нет
-        save_path.parent.mkdir(parents=True, exist_ok=True)
+        known = store.lookup(image_url)
+        if known:
+            rel_path, blob_hash = known
+            return IMAGES_DIR / rel_path, blob_hash
         
         # Скачиваем изображение
-        response = requests.get(image_url, timeout=30, stream=True)
+        response = http_get(image_url, timeout=30)
         response.raise_for_status()
+        content = response.content
         
-        # Сохраняем файл
-        with open(save_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        # Проверяем, что файл не пустой и является изображением
-        if save_path.stat().st_size == 0:
-            print(f'  ⚠️  Файл пустой: {save_path}')
-            return False
+        # Проверяем, что файл не пустой и является изображением (магические байты PNG/JPEG/GIF/SVG)
+        if not content:
+            log.warning(f'Пустой ответ: {image_url}')
+            return None
+        if not looks_like_image(content[:MAGIC_BYTES]):
+            log.warning(f'Файл не является изображением: {image_url}')
+            return None
         
-        # Проверяем первые байты файла (магические числа изображений)
-        with open(save_path, 'rb') as f:
-            header = f.read(8)
-            # PNG: 89 50 4E 47
-            # JPEG: FF D8 FF
-            # GIF: 47 49 46 38
-            # SVG: <svg или <?xml
-            if header.startswith(b'\x89PNG') or \
-               header.startswith(b'\xff\xd8\xff') or \
-               header.startswith(b'GIF8') or \
-               header.startswith(b'<svg') or \
-               header.startswith(b'<?xml'):
-                return True
-            else:
-                print(f'  ⚠️  Файл не является изображением: {save_path}')
-                return False
+        rel_path, blob_hash = store.store_bytes(content, response.headers.get('content-type', ''), image_url)
+        return IMAGES_DIR / rel_path, blob_hash
                 
     except Exception as e:
-        print(f'  ❌ Ошибка скачивания {image_url}: {e}')
-        if save_path.exists():
-            save_path.unlink()
-        return False
+        log.warning(f'Ошибка скачивания {image_url}: {e}')
+        return None
 
-def get_image_path(subject_code, problem_id, image_type, index, image_url):
-    """Определяет путь для сохранения изображения"""
-    subject_dir = IMAGES_DIR / subject_code
-    problem_dir = subject_dir / str(problem_id)
-    problem_dir.mkdir(parents=True, exist_ok=True)
+class ImageRef:
+    """Изображение задачи: строка таблицы изображений или ссылка на файл хранилища в тексте"""
     
-    # Определяем расширение из URL или по умолчанию
-    parsed_url = urlparse(image_url)
-    ext = Path(parsed_url.path).suffix
-    if not ext:
-        # Определяем по Content-Type или используем .png по умолчанию
-        ext = '.png'
+    __slots__ = ('kind', 'image_id', 'url', 'path')
     
-    filename = f'{image_type}_{index}{ext}'
-    return problem_dir / filename
+    def __init__(self, kind, image_id, url, path):
+        self.kind = kind            # condition, solution или markdown
+        self.image_id = image_id    # id строки (у markdown - None)
+        self.url = url              # откуда скачать заново
+        self.path = path            # абсолютный путь файла
 
-def reload_images_for_problem(db, problem_id, subject_code, problem_id_str):
-    """Перезагружает изображения для одной задачи"""
-    try:
-        print(f'📥 Обрабатываем задачу {problem_id_str} ({subject_code})...')
-        
-        # Получаем данные задачи из СДАМ ГИА
-        # API использует ЕГЭ домены, но у нас ОГЭ, поэтому используем прямой запрос
-        problem_data = get_problem_data_oge(subject_code, problem_id_str)
-        
-        if not problem_data:
-            # Пробуем через API (может быть ЕГЭ задача)
-            try:
-                problem_data = sdamgia.get_problem_by_id(subject_code, problem_id_str)
-            except:
-                pass
-        
-        if not problem_data:
-            print(f'  ⚠️  Задача {problem_id_str} не найдена в СДАМ ГИА')
-            return False
-        
-        # Получаем ID задачи в БД
-        cursor = db.cursor()
-        cursor.execute(
-            'SELECT p.id FROM problems p JOIN subjects s ON p.subject_id = s.id WHERE p.problem_id = ? AND s.code = ?',
-            (problem_id_str, subject_code)
-        )
-        db_problem_row = cursor.fetchone()
-        
-        if not db_problem_row:
-            print(f'  ⚠️  Задача {problem_id_str} не найдена в БД')
-            return False
-        
-        db_problem_id = db_problem_row[0]
-        
-        # Удаляем старые изображения из БД
-        cursor.execute('DELETE FROM problem_condition_images WHERE problem_id = ?', (db_problem_id,))
-        cursor.execute('DELETE FROM problem_solution_images WHERE problem_id = ?', (db_problem_id,))
-        
-        downloaded_count = 0
-        
-        # Скачиваем изображения условий
-        if problem_data.get('condition', {}).get('images'):
-            print(f'  📷 Найдено {len(problem_data["condition"]["images"])} изображений условий')
-            for i, image_url in enumerate(problem_data['condition']['images']):
-                img_path = get_image_path(subject_code, problem_id_str, 'condition', i, image_url)
-                
-                if download_image(image_url, img_path):
-                    # Сохраняем относительный путь от папки server
-                    relative_path = img_path.relative_to(Path(__file__).parent.parent)
-                    relative_path_str = str(relative_path).replace('\\', '/')
-                    
-                    cursor.execute(
-                        'INSERT INTO problem_condition_images (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)',
-                        (db_problem_id, image_url, relative_path_str, i)
-                    )
-                    downloaded_count += 1
-                    print(f'    ✅ Скачано: {relative_path_str}')
-                else:
-                    print(f'    ❌ Не удалось скачать: {image_url}')
+def load_state(db, store):
+    """
+    Состояние всех задач и их изображений одним запросом.
+    
+    Returns:
+        {id задачи в БД: (problem_id, код предмета, [ImageRef])}
+    """
+    source_urls = None
+    problems = {}
+    for db_id, problem_id, subject_code, kind, image_id, image_url, value in db.execute(STATE_SQL):
+        refs = problems.setdefault(db_id, (str(problem_id), subject_code, []))[2]
+        if kind is None:
+            continue
+        if kind != 'markdown':
+            path = SERVER_DIR / value.replace('\\', '/')
+            refs.append(ImageRef(kind, image_id, image_url, path))
+            continue
+        # Ссылки на файлы хранилища в markdown условия и решения (load_html_parser не пишет строки изображений)
+        if source_urls is None:
+            source_urls = store.source_urls()
+        for rel_path, ref_hash in dict.fromkeys(BLOB_REF_RE.findall(value)):
+            refs.append(ImageRef(kind, None, source_urls.get(ref_hash), IMAGES_DIR / rel_path))
+    return problems
+
+def blob_name(path):
+    """Хэш файла хранилища по его имени (у файлов старой раскладки - None)"""
+    return path.stem if BLOB_NAME_RE.match(path.stem) else None
+
+def verify_files(paths, sizes, check_hash, executor):
+    """Проверяет файлы параллельно (только локальный диск). Returns: {путь: причина} для плохих файлов"""
+    bad = {}
+    with Progress(len(paths), 'Проверено файлов') as progress:
+        def check(path):
+            return path, verify_file(path, sizes.get(blob_name(path)), check_hash)
+        for path, reason in executor.map(check, paths):
+            if reason:
+                bad[path] = reason
+            progress.advance(reason is None)
+    return bad
+
+@run_metrics.timed('image')
+def repair_file(store, path, urls, expected_hash):
+    """
+    Скачивает заново одно отсутствующее или испорченное изображение.
+    Запрос идет через HTTP кэш: свежая запись берется с диска, устаревшая
+    перепроверяется условным запросом (If-None-Match / If-Modified-Since).
+    
+    Returns:
+        (путь относительно папки изображений, хэш, URL) или None
+    """
+    for url in urls:
+        try:
+            response = cached_get(url, timeout=30, url_class='image')
+            response.raise_for_status()
+            content = response.content
+            if response.from_cache and not looks_like_image(content[:MAGIC_BYTES]):
+                # В кэше тоже испорченная копия - скачиваем без него
+                response = http_get(url, timeout=30)
+                response.raise_for_status()
+                content = response.content
+            if not content or not looks_like_image(content[:MAGIC_BYTES]):
+                log.warning(f'Файл не является изображением: {url}')
+                continue
+            if expected_hash and hashlib.sha256(content).hexdigest() != expected_hash:
+                log.warning(f'Содержимое изменилось: {url} (ожидался {expected_hash[:12]})')
+            # store_bytes не перезаписывает существующий файл - испорченный удаляем сначала
+            path.unlink(missing_ok=True)
+            rel_path, blob_hash = store.store_bytes(content, response.headers.get('content-type', ''), url)
+            run_metrics.count('images_repaired')
+            return rel_path, blob_hash, url
+        except Exception as e:
+            log.warning(f'Ошибка скачивания {url}: {e}')
+    return None
+
+def repair_images(db, store, refs_by_path, bad, executor):
+    """Скачивает заново плохие файлы (пул потоков) и обновляет пути строк изображений. Returns: (восстановлено, нет)"""
+    repaired = failed = 0
+    cursor = db.cursor()
+    with Progress(len(bad), 'Восстановлено изображений') as progress:
+        futures = {}
+        for path, reason in bad.items():
+            refs = refs_by_path[path]
+            urls = list(dict.fromkeys(ref.url for ref in refs if ref.url))
+            log.debug(f'{path.name}: {reason}, источников: {len(urls)}')
+            futures[executor.submit(repair_file, store, path, urls, blob_name(path))] = path
         
-        # Скачиваем изображения решений
-        if problem_data.get('solution', {}).get('images'):
-            print(f'  📷 Найдено {len(problem_data["solution"]["images"])} изображений решений')
-            for i, image_url in enumerate(problem_data['solution']['images']):
-                img_path = get_image_path(subject_code, problem_id_str, 'solution', i, image_url)
-                
-                if download_image(image_url, img_path):
-                    # Сохраняем относительный путь от папки server
-                    relative_path = img_path.relative_to(Path(__file__).parent.parent)
-                    relative_path_str = str(relative_path).replace('\\', '/')
-                    
+        for future in as_completed(futures):
+            path = futures[future]
+            result = future.result()
+            if result is None:
+                failed += 1
+                log.warning(f'Не удалось восстановить {path} ({bad[path]})')
+                progress.advance(ok=False)
+                continue
+            rel_path, blob_hash, url = result
+            new_path = IMAGES_DIR / rel_path
+            image_path = os.path.relpath(new_path, SERVER_DIR).replace('\\', '/')
+            for ref in refs_by_path[path]:
+                if ref.kind == 'markdown':
+                    if new_path != path:
+                        log.warning(f'{path.name}: на сайте другое изображение ({url}) - '
+                                    f'обновите задачу (load_html_parser.py --refresh)')
+                    continue
+                table = IMAGE_TABLES[ref.kind]
+                if new_path != path:
+                    cursor.execute(f'UPDATE {table} SET image_path = ? WHERE id = ?', (image_path, ref.image_id))
+                link_image_row(cursor, table, ref.image_id, blob_hash)
+            repaired += 1
+            progress.advance()
+    db.commit()
+    return repaired, failed
+
+def fetch_problem_images(subject_code, problem_id):
+    """Список изображений задачи со страницы ОГЭ (или через API) и их скачивание - для задач без изображений в БД"""
+    problem_data = get_problem_data_oge(subject_code, problem_id)
+    if not problem_data:
+        # Пробуем через API (может быть ЕГЭ задача)
+        try:
+            problem_data = cached_call('problem', api_host(subject_code), sdamgia.get_problem_by_id, subject_code, problem_id)
+        except Exception:
+            pass
+    if not problem_data:
+        log.warning(f'[{problem_id}] Задача не найдена в СДАМ ГИА', extra={'problem_id': problem_id})
+        return None
+    return {
+        kind: [(image_url, download_image(image_url)) for image_url in problem_data.get(kind, {}).get('images') or []]
+        for kind in IMAGE_TABLES
+    }
+
+def refetch_images(db, problems, executor):
+    """Получает изображения задач, у которых их нет в БД (страница задачи - сеть). Returns: добавлено строк"""
+    added = 0
+    cursor = db.cursor()
+    with Progress(len(problems), 'Задачи без изображений') as progress:
+        futures = {executor.submit(fetch_problem_images, subject_code, problem_id): (db_id, problem_id)
+                   for db_id, problem_id, subject_code in problems}
+        for future in as_completed(futures):
+            db_id, problem_id = futures[future]
+            images = future.result()
+            if images is None:
+                progress.advance(ok=False)
+                continue
+            for kind, items in images.items():
+                table = IMAGE_TABLES[kind]
+                for order, (image_url, downloaded) in enumerate(items):
+                    if not downloaded:
+                        log.warning(f'[{problem_id}] Не удалось скачать: {image_url}', extra={'problem_id': problem_id})
+                        continue
+                    img_path, blob_hash = downloaded
                     cursor.execute(
-                        'INSERT INTO problem_solution_images (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)',
-                        (db_problem_id, image_url, relative_path_str, i)
+                        f'INSERT INTO {table} (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)',
+                        (db_id, image_url, os.path.relpath(img_path, SERVER_DIR).replace('\\', '/'), order)
                     )
-                    downloaded_count += 1
-                    print(f'    ✅ Скачано: {relative_path_str}')
-                else:
-                    print(f'    ❌ Не удалось скачать: {image_url}')
-        
-        db.commit()
-        
-        if downloaded_count > 0:
-            print(f'  ✅ Загружено {downloaded_count} изображений для задачи {problem_id_str}')
-            return True
-        else:
-            print(f'  ⚠️  Нет изображений для задачи {problem_id_str}')
-            return False
-            
-    except Exception as e:
-        print(f'  ❌ Ошибка при обработке задачи {problem_id_str}: {e}')
-        import traceback
-        traceback.print_exc()
-        return False
+                    link_image_row(cursor, table, cursor.lastrowid, blob_hash)
+                    added += 1
+            db.commit()
+            progress.advance()
+    return added
 
 def main():
     """Основная функция"""
-    print('🚀 Начинаем перезагрузку изображений...\n')
+    parser = argparse.ArgumentParser(description='Проверка и восстановление изображений задач')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Потоков проверки файлов и скачивания (по умолчанию {DEFAULT_WORKERS})')
+    parser.add_argument('--check', action='store_true',
+                        help='Только проверить файлы и вывести итог (без сети и записи в БД)')
+    parser.add_argument('--quick', action='store_true',
+                        help='Проверять только наличие, размер и начало файла (без SHA-256 содержимого)')
+    parser.add_argument('--refetch', action='store_true',
+                        help='Для задач без изображений в БД заново получить их со страницы задачи')
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args)
+    
+    log.info('Проверяем изображения задач...')
     
     if not DB_PATH.exists():
-        print(f'❌ База данных не найдена: {DB_PATH}')
+        log.error(f'База данных не найдена: {DB_PATH}')
         return
     
-    db = sqlite3.connect(DB_PATH)
-    db.row_factory = sqlite3.Row
+    db = connect(DB_PATH, ingest=True)
+    ensure_schema(db)
+    store = get_image_store(IMAGES_DIR)
     
     try:
-        # Получаем все задачи из БД
-        cursor = db.cursor()
-        cursor.execute('''
-            SELECT p.problem_id, s.code as subject_code
-            FROM problems p
-            JOIN subjects s ON p.subject_id = s.id
-            ORDER BY s.code, p.problem_id
-        ''')
-        
-        problems = cursor.fetchall()
-        print(f'📚 Найдено {len(problems)} задач в БД\n')
-        
-        success_count = 0
-        fail_count = 0
+        # 1. Задачи и их изображения - одним запросом
+        problems = load_state(db, store)
+        refs_by_path = {}
+        for _, _, refs in problems.values():
+            for ref in refs:
+                refs_by_path.setdefault(ref.path, []).append(ref)
+        without_images = [(db_id, problem_id, subject_code)
+                          for db_id, (problem_id, subject_code, refs) in problems.items() if not refs]
+        log.info(f'Задач: {len(problems)}, ссылок на изображения: {sum(len(r) for r in refs_by_path.values())}, '
+                 f'файлов: {len(refs_by_path)}, задач без изображений: {len(without_images)}')
         
-        for problem in problems:
-            problem_id = problem['problem_id']
-            subject_code = problem['subject_code']
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+            # 2. Проверка файлов на диске (сеть не используется)
+            bad = verify_files(list(refs_by_path), store.blob_sizes(), not args.quick, executor)
+            reasons = {}
+            for reason in bad.values():
+                reasons[reason] = reasons.get(reason, 0) + 1
+            log.info(f'Файлов в порядке: {len(refs_by_path) - len(bad)}, требуют загрузки: {len(bad)}'
+                     + (f' ({", ".join(f"{r}: {n}" for r, n in sorted(reasons.items()))})' if reasons else ''))
+            run_metrics.count('images_ok', len(refs_by_path) - len(bad))
+            run_metrics.count('images_bad', len(bad))
             
-            if reload_images_for_problem(db, problem_id, subject_code, str(problem_id)):
-                success_count += 1
-            else:
-                fail_count += 1
-            
-            print()  # Пустая строка для читаемости
+            if not args.check:
+                # 3. Скачиваем заново только отсутствующие и испорченные
+                if bad:
+                    repaired, failed = repair_images(db, store, refs_by_path, bad, executor)
+                    log.info(f'Восстановлено: {repaired}, не удалось: {failed}')
+                
+                # 4. Задачи без изображений - только по запросу (страница каждой задачи)
+                if args.refetch and without_images:
+                    log.info(f'Добавлено строк изображений: {refetch_images(db, without_images, executor)}')
         
-        print('\n📊 Статистика:')
-        print(f'   ✅ Успешно обработано: {success_count}')
-        print(f'   ❌ Ошибок: {fail_count}')
-        print(f'   📷 Всего изображений загружено для {success_count} задач')
+        write_run_report(args, 'reload_images')
         
     finally:
         db.close()
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенное связывание аналогичных задач (problem_analogs)
+
+load_problem и import_problem связывали задачу с аналогом, только если аналог
+уже был в БД, поэтому граф аналогов зависел от порядка загрузки и большая
+часть связей терялась. Чтобы их восстановить, приходилось загружать все заново.
+
+Теперь загрузчики записывают все ID аналогов со страницы задачи в таблицу
+pending_analogs (по ID СДАМ ГИА, без поиска строк), а связи в обе стороны
+создает один проход INSERT ... SELECT с JOIN на problems - в конце запуска
+или по запросу. Строки, аналог которых еще не загружен, ждут следующего
+прохода. Разрешенные строки не удаляются: повторная загрузка задачи с тем же
+списком ничего не пишет, проход идемпотентен, а граф можно пересобрать,
+если problem_analogs очищена.
+
+Повторная загрузка задачи заменяет ее список аналогов, а проход удаляет
+связи, которые не подтверждены списком ни одной из двух задач (если список
+хотя бы одной из них известен) - так же, как link_categories удаляет
+связи по теме. Связи задач, загруженных до pending_analogs, не трогаются.
+
+Использование:
+    from analog_links import ensure_schema, record_analogs, resolve_analogs
+
+    ensure_schema(conn)
+    record_analogs(cursor, subject_id, problem_id, ['4612', '4613'])   # при сохранении задачи
+    linked, removed = resolve_analogs(conn)                          # в конце запуска
+
+    python analog_links.py --db ../tasksbd.db                          # по запросу
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+from run_log import get_logger, setup_logging, add_logging_arguments
+
+log = get_logger(__name__)
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS pending_analogs (
+    subject_id INTEGER NOT NULL,            -- Предмет (ID задач СДАМ ГИА уникальны в пределах предмета)
+    problem_id TEXT NOT NULL,               -- ID задачи из СДАМ ГИА
+    analog_problem_id TEXT NOT NULL,        -- ID аналога из СДАМ ГИА (может быть еще не загружен)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, problem_id, analog_problem_id)
+);
+"""
+
+# Связи в обе стороны для всех пар, обе задачи которых уже есть в БД
+RESOLVE_SQL = """
+INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id)
+SELECT p.id, a.id
+FROM pending_analogs pa
+JOIN problems p ON p.subject_id = pa.subject_id AND p.problem_id = pa.problem_id
+JOIN problems a ON a.subject_id = pa.subject_id AND a.problem_id = pa.analog_problem_id
+WHERE p.id != a.id {subject_filter}
+UNION
+SELECT a.id, p.id
+FROM pending_analogs pa
+JOIN problems p ON p.subject_id = pa.subject_id AND p.problem_id = pa.problem_id
+JOIN problems a ON a.subject_id = pa.subject_id AND a.problem_id = pa.analog_problem_id
+WHERE p.id != a.id {subject_filter}
+"""
+
+# Связи, не подтвержденные списком аналогов ни одной из двух задач (список хотя бы одной известен)
+PRUNE_SQL = """
+DELETE FROM problem_analogs WHERE id IN (
+    SELECT pl.id
+    FROM problem_analogs pl
+    JOIN problems p ON p.id = pl.problem_id
+    JOIN problems a ON a.id = pl.analog_problem_id
+    WHERE (EXISTS (SELECT 1 FROM pending_analogs pa
+                   WHERE pa.subject_id = p.subject_id AND pa.problem_id = p.problem_id)
+           OR EXISTS (SELECT 1 FROM pending_analogs pa
+                      WHERE pa.subject_id = a.subject_id AND pa.problem_id = a.problem_id))
+      AND NOT EXISTS (SELECT 1 FROM pending_analogs pa
+                      WHERE pa.subject_id = p.subject_id AND pa.problem_id = p.problem_id
+                        AND pa.analog_problem_id = a.problem_id)
+      AND NOT EXISTS (SELECT 1 FROM pending_analogs pa
+                      WHERE pa.subject_id = a.subject_id AND pa.problem_id = a.problem_id
+                        AND pa.analog_problem_id = p.problem_id)
+      {subject_filter}
+)
+"""
+
+# Связи пары, удаленной из списка задачи, если обратная пара не подтверждает их (ID СДАМ ГИА)
+UNLINK_SQL = """
+DELETE FROM problem_analogs WHERE id IN (
+    SELECT pl.id
+    FROM problem_analogs pl
+    JOIN problems p ON p.id = pl.problem_id
+    JOIN problems a ON a.id = pl.analog_problem_id
+    WHERE p.subject_id = :subject_id AND a.subject_id = :subject_id
+      AND ((p.problem_id = :problem_id AND a.problem_id = :analog_id)
+           OR (p.problem_id = :analog_id AND a.problem_id = :problem_id))
+      AND NOT EXISTS (SELECT 1 FROM pending_analogs pa
+                      WHERE pa.subject_id = :subject_id AND pa.problem_id = :analog_id
+                        AND pa.analog_problem_id = :problem_id)
+)
+"""
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Создает таблицу аналогов по ID СДАМ ГИА"""
+    conn.executescript(SCHEMA_SQL)
+
+
+def record_analogs(cursor, subject_id: int, problem_id, analog_ids):
+    """
+    Запоминает аналоги задачи (связи создаст resolve_analogs). Прежний список
+    задачи заменяется: аналоги, которых больше нет на странице, удаляются
+    вместе со связями, если их не подтверждает список аналога (пустой
+    список - у задачи нет аналогов)
+    """
+    problem_id = str(problem_id)
+    analog_ids = {str(analog_id) for analog_id in analog_ids} - {problem_id}
+    cursor.execute("SELECT analog_problem_id FROM pending_analogs WHERE subject_id = ? AND problem_id = ?",
+                   (subject_id, problem_id))
+    known = {row[0] for row in cursor.fetchall()}
+    removed = [{'subject_id': subject_id, 'problem_id': problem_id, 'analog_id': analog_id}
+               for analog_id in sorted(known - analog_ids)]
+    cursor.executemany(
+        "DELETE FROM pending_analogs WHERE subject_id = :subject_id AND problem_id = :problem_id "
+        "AND analog_problem_id = :analog_id", removed
+    )
+    cursor.executemany(UNLINK_SQL, removed)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO pending_analogs (subject_id, problem_id, analog_problem_id) VALUES (?, ?, ?)",
+        [(subject_id, problem_id, analog_id) for analog_id in sorted(analog_ids - known)]
+    )
+
+
+def resolve_analogs(conn: sqlite3.Connection, subject_id: int = None) -> tuple:
+    """
+    Создает все разрешимые связи problem_analogs одним запросом и удаляет
+    связи, не подтвержденные списками аналогов (subject_id - только один
+    предмет). Возвращает (добавлено, удалено)
+    """
+    before = conn.total_changes
+    conn.execute(PRUNE_SQL.format(subject_filter='AND p.subject_id = ?' if subject_id else ''),
+                 (subject_id,) if subject_id else ())
+    removed = conn.total_changes - before
+    subject_filter, params = ('AND pa.subject_id = ?', (subject_id, subject_id)) if subject_id else ('', ())
+    conn.execute(RESOLVE_SQL.format(subject_filter=subject_filter), params)
+    linked = conn.total_changes - before - removed
+    # В пакетном режиме (bulk_ingest) commit() отложен - связи должны попасть в БД сейчас
+    getattr(conn, 'flush', conn.commit)()
+    return linked, removed
+
+
+def pending_count(conn: sqlite3.Connection) -> int:
+    """Сколько аналогов еще не загружено (связь создать не из чего)"""
+    return conn.execute("""
+        SELECT COUNT(*) FROM pending_analogs pa
+        WHERE NOT EXISTS (SELECT 1 FROM problems a WHERE a.subject_id = pa.subject_id
+                                                     AND a.problem_id = pa.analog_problem_id)
+    """).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Связывание аналогичных задач по таблице pending_analogs')
+    parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
+    parser.add_argument('--subject', help='Код предмета (по умолчанию все)')
+    parser.add_argument('--exam-type', default='oge', choices=['oge', 'ege'], help='Тип экзамена')
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args)
+
+    conn = connect(Path(__file__).parent / args.db)
+    ensure_schema(conn)
+    subject_id = None
+    if args.subject:
+        row = conn.execute("SELECT id FROM subjects WHERE code = ? AND exam_type = ?",
+                           (args.subject, args.exam_type)).fetchone()
+        if row is None:
+            log.error(f"Предмет {args.subject} ({args.exam_type}) не найден в БД")
+            sys.exit(1)
+        subject_id = row[0]
+
+    linked, removed = resolve_analogs(conn, subject_id)
+    log.info(f"Связей аналогов добавлено: {linked}, удалено лишних: {removed}, "
+             f"ждут загрузки аналога: {pending_count(conn)}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
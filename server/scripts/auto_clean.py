@@ -11,23 +11,24 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from clean_db import clean_database, clean_images
+from run_log import get_logger, setup_logging
+
+setup_logging()
+log = get_logger(__name__)
 
 # Пути
 script_dir = Path(__file__).parent
 db_path = script_dir / '../tasksbd.db'
 images_dir = script_dir / '../image_tasksdb'
 
-print("=" * 60)
-print("ОЧИСТКА БАЗЫ ДАННЫХ И ИЗОБРАЖЕНИЙ")
-print("=" * 60)
-print(f"БД: {db_path}")
-print(f"Папка изображений: {images_dir}")
-print("=" * 60)
+log.info("Очистка базы данных и изображений")
+log.info(f"БД: {db_path}")
+log.info(f"Папка изображений: {images_dir}")
 
 # Очистка
 clean_database(str(db_path), None)
 clean_images(str(images_dir), None)
 
-print("\nОчистка завершена!")
+log.info("Очистка завершена!")
 
 
@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк связей задач с категориями: по теме против состава категорий
+
+На временной копии схемы из database/init.sql строится предмет: темы по
+нескольку категорий, в каждой категории свои задачи. Затем category_problems
+заполняется двумя способами:
+
+- topic - как раньше load_problem и link_problem_to_categories: задача
+  связывается со всеми категориями своей темы;
+- index - состав категорий (category_index.record_category) и один проход
+  category_index.link_categories; он же удаляет связи по теме, оставшиеся
+  в БД от прежних загрузок (строка "index после topic").
+
+Показывает число связей, время связывания, долю чужих задач в выборке
+категории и время запросов сервера (tasks.service.ts): задачи категории
+(findAll с categoryId) и список непустых категорий (getCategories).
+
+Использование:
+    python bench_category_links.py                            # 20000 задач, 5 категорий в теме
+    python bench_category_links.py --problems 50000 --categories 8
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+from category_index import ensure_schema as ensure_category_schema, record_category, link_categories
+
+INIT_SQL = Path(__file__).parent.parent / 'database' / 'init.sql'
+
+SUBJECT = 'bio'
+EXAM_TYPE = 'oge'
+TOPICS = 20
+QUERY_REPEAT = 20
+
+# tasks.service.ts: findAll(subject, undefined, categoryId)
+CATEGORY_PROBLEMS_SQL = """
+SELECT DISTINCT p.id, p.problem_id, p.subject_id, p.topic_id, p.line, p.condition_text, p.solution_text,
+       p.answer, p.url, p.created_at, s.code, s.name, t.topic_number, t.topic_name, t.topic_line
+FROM problems p
+LEFT JOIN subjects s ON p.subject_id = s.id
+LEFT JOIN topics t ON p.topic_id = t.id
+INNER JOIN category_problems cp ON p.id = cp.problem_id
+WHERE s.code = ? AND cp.category_id = ?
+ORDER BY p.created_at DESC
+"""
+
+# tasks.service.ts: getCategories (прежний вариант - DISTINCT по всем связям)
+CATEGORIES_JOIN_SQL = """
+SELECT DISTINCT c.id, c.category_id, c.category_name
+FROM categories c
+INNER JOIN category_problems cp ON c.id = cp.category_id
+WHERE c.category_name IS NOT NULL
+ORDER BY c.category_name
+"""
+
+CATEGORIES_EXISTS_SQL = """
+SELECT c.id, c.category_id, c.category_name
+FROM categories c
+WHERE c.category_name IS NOT NULL
+  AND EXISTS (SELECT 1 FROM category_problems cp WHERE cp.category_id = c.id)
+ORDER BY c.category_name
+"""
+
+
+def create_db(db_path: Path, problems: int, categories: int):
+    """Предмет без связей с категориями; состав категорий - в category_index"""
+    conn = connect(db_path, ingest=True)
+    conn.executescript(INIT_SQL.read_text(encoding='utf-8'))
+    ensure_category_schema(conn)
+    conn.execute("INSERT INTO subjects (code, name, exam_type) VALUES (?, 'Биология', ?)", (SUBJECT, EXAM_TYPE))
+    subject_id = conn.execute("SELECT id FROM subjects").fetchone()[0]
+    topic_ids = []
+    for topic in range(1, TOPICS + 1):
+        topic_ids.append(conn.execute(
+            "INSERT INTO topics (subject_id, topic_number, topic_name, topic_line) VALUES (?, ?, ?, ?)",
+            (subject_id, str(topic), f'Задание {topic}', str(topic))
+        ).lastrowid)
+        conn.executemany(
+            "INSERT INTO categories (topic_id, category_id, category_name) VALUES (?, ?, ?)",
+            [(topic_ids[-1], f'{topic}{c:02d}', f'Категория {topic}.{c}') for c in range(categories)]
+        )
+
+    listings = {}
+    rows = []
+    for number in range(1, problems + 1):
+        topic = number % TOPICS + 1
+        listings.setdefault(f'{topic}{number // TOPICS % categories:02d}', []).append(str(number))
+        rows.append((subject_id, topic_ids[topic - 1], str(number), str(topic),
+                     f"Условие задачи {number}. " * 8, f"Решение задачи {number}. " * 20, str(number % 100)))
+    conn.executemany(
+        "INSERT INTO problems (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+    )
+    cursor = conn.cursor()
+    for category_id, problem_ids in listings.items():
+        record_category(cursor, subject_id, category_id, problem_ids)
+    conn.commit()
+    conn.close()
+
+
+def link_by_topic(conn):
+    """Прежнее связывание: задача - во всех категориях своей темы"""
+    conn.execute("""
+        INSERT OR IGNORE INTO category_problems (category_id, problem_id)
+        SELECT c.id, p.id FROM problems p JOIN categories c ON c.topic_id = p.topic_id
+    """)
+    conn.commit()
+
+
+def timed_query(conn, sql: str, params_list: list) -> float:
+    """Среднее время запроса, мс (по всем параметрам, QUERY_REPEAT раз)"""
+    started = time.perf_counter()
+    for _ in range(QUERY_REPEAT):
+        for params in params_list:
+            conn.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) * 1000 / (QUERY_REPEAT * len(params_list))
+
+
+def run(source_db: Path, tmp: Path, label: str, steps) -> dict:
+    db_path = tmp / f'{label.replace(" ", "_")}.db'
+    shutil.copyfile(source_db, db_path)
+    conn = connect(db_path, ingest=True)
+    started = time.perf_counter()
+    for step in steps:
+        step(conn)
+    elapsed = time.perf_counter() - started
+
+    category_ids = [(SUBJECT, row[0]) for row in conn.execute("SELECT id FROM categories ORDER BY id")]
+    foreign = conn.execute("""
+        SELECT COUNT(*) FROM category_problems cp
+        JOIN categories c ON c.id = cp.category_id
+        JOIN problems p ON p.id = cp.problem_id
+        WHERE NOT EXISTS (SELECT 1 FROM category_index ci WHERE ci.subject_id = p.subject_id
+                          AND ci.category_id = c.category_id AND ci.problem_id = p.problem_id)
+    """).fetchone()[0]
+    result = {
+        'seconds': elapsed,
+        'links': conn.execute("SELECT COUNT(*) FROM category_problems").fetchone()[0],
+        'foreign': foreign,
+        'category_ms': timed_query(conn, CATEGORY_PROBLEMS_SQL, category_ids[:10]),
+        'join_ms': timed_query(conn, CATEGORIES_JOIN_SQL, [()]),
+        'exists_ms': timed_query(conn, CATEGORIES_EXISTS_SQL, [()]),
+    }
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк связей задач с категориями: по теме и по составу')
+    parser.add_argument('--problems', type=int, default=20000, help='Задач в предмете')
+    parser.add_argument('--categories', type=int, default=5, help='Категорий в теме')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source_db = tmp / 'subject.db'
+        create_db(source_db, args.problems, args.categories)
+
+        print(f"{args.problems} задач, {TOPICS} тем по {args.categories} категорий\n")
+        print(f"{'Связи':<18}{'время':>9}{'связей':>10}{'чужих':>10}"
+              f"{'задачи категории':>18}{'getCategories: JOIN':>21}{'EXISTS':>9}")
+        for label, steps in (('topic', (link_by_topic,)),
+                             ('index', (link_categories,)),
+                             ('index после topic', (link_by_topic, link_categories))):
+            result = run(source_db, tmp, label, steps)
+            share = result['foreign'] / result['links'] if result['links'] else 0.0
+            print(f"{label:<18}{result['seconds']:>7.2f} с{result['links']:>10}{share:>10.0%}"
+                  f"{result['category_ms']:>15.2f} мс{result['join_ms']:>18.2f} мс{result['exists_ms']:>6.2f} мс")
+
+
+if __name__ == '__main__':
+    main()
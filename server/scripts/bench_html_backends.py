@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение HTML парсеров (html_backend.py) на сохраненных страницах задач
+
+Для каждой страницы и каждого доступного парсера строит то же, что и
+load_html_parser.load_problem: markdown условия и решения, ответ, номер
+задания и аналоги. Результат каждого парсера побайтно сравнивается с
+эталонным html.parser, а время разбора усредняется по страницам.
+
+Страницы берутся из папки с *.html (--pages) или из дискового кэша
+http_cache (страницы задач, уже скачанные загрузчиками). Перед ними
+проверяются короткие блоки с пробельными узлами между тегами (WHITESPACE_CASES):
+BeautifulSoup сжимает такие узлы, и остальные парсеры должны делать так же.
+Затем - случайные блоки (--random, с фиксированным --seed): вложенные
+абзацы, строчные теги, изображения, переносы, правила и пробелы между тегами.
+Код возврата 1 - хотя бы на одной странице или блоке результат отличается.
+
+Использование:
+    python bench_html_backends.py                      # страницы из кэша
+    python bench_html_backends.py --pages bench_fixtures --repeat 5
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from html_backend import parse_document, available_backends
+from http_cache import CACHE_DIR, classify_url
+from load_html_parser import parse_html_block, extract_answer, extract_topic_number, extract_analogs
+
+REFERENCE_BACKEND = 'html.parser'
+
+# Блоки условия с пробельными узлами между элементами (как в сверстанных с отступами страницах)
+WHITESPACE_CASES = [
+    ('пустые строки между абзацами', '<p>a</p>\n    \n<p>b</p>  <p>c</p>'),
+    ('отступы вокруг изображений', '<p>\n  <img src="/formula/1.png">\n  <img src="/formula/2.png">\n</p>'),
+    ('пробелы в строчных тегах', '<span> x <b>\t</b>y</span>\n<br>\n<i> </i>z'),
+    ('таблица с отступами', '<table>\n  <tr>\n    <td>1</td>\n    <td> 2 </td>\n  </tr>\n</table>'),
+    ('pre', '<pre>  1\n  <b>  </b> 2</pre>\n  <p>c</p>'),
+    ('комментарий', '<p>a</p>\n  <!--  -->  \n<p>b</p>'),
+]
+
+
+def recorded_pages(pages_dir: Path = None, cache_dir: Path = CACHE_DIR, limit: int = None) -> list:
+    """[(имя, содержимое)] - страницы задач из папки или из кэша http_cache"""
+    pages = []
+    if pages_dir:
+        for path in sorted(Path(pages_dir).glob('*.html')):
+            pages.append((path.name, path.read_bytes()))
+    else:
+        for meta_path in sorted(Path(cache_dir).glob('*/*.meta.json')):
+            try:
+                meta = json.loads(meta_path.read_text(encoding='utf-8'))
+            except (OSError, ValueError):
+                continue
+            if classify_url(meta.get('url', '')) != 'problem':
+                continue
+            body_path = meta_path.with_name(meta_path.name[:-len('.meta.json')] + '.body')
+            if body_path.exists():
+                pages.append((meta['url'], body_path.read_bytes()))
+    return pages[:limit] if limit else pages
+
+
+def fake_image_saver(url, subject_code, problem_id, img_type, index, images_dir):
+    """Путь изображения без сети: зависит только от URL"""
+    digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+    return f"blobs/{digest[:2]}/{digest[2:4]}/{digest}.svg"
+
+
+def extract(content: bytes, backend: str, only=None):
+    """То же, что load_problem сохраняет в БД, для одной страницы (only - см. parse_document)"""
+    root = parse_document(content, backend, only)
+    try:
+        prob_div = root.find('div', 'prob_maindiv')
+        if prob_div is None:
+            return None
+        pbody_blocks = prob_div.find_all('div', 'pbody')
+        if not pbody_blocks:
+            return None
+        condition = parse_html_block(pbody_blocks[0], 'bio', '0', 'condition', Path('.'), fake_image_saver)
+        solution = ''
+        if len(pbody_blocks) > 1:
+            solution = parse_html_block(pbody_blocks[1], 'bio', '0', 'solution', Path('.'), fake_image_saver)
+        return {
+            'condition': condition,
+            'solution': solution,
+            'answer': extract_answer(prob_div, pbody_blocks),
+            'topic': extract_topic_number(prob_div),
+            'analogs': extract_analogs(prob_div),
+        }
+    finally:
+        root.release()
+
+
+def first_difference(expected, actual) -> str:
+    if expected is None or actual is None:
+        return f"блок задачи: {'нет' if expected is None else 'есть'} / {'нет' if actual is None else 'есть'}"
+    for field in expected:
+        a, b = expected[field], actual[field]
+        if a != b:
+            if isinstance(a, str) and isinstance(b, str):
+                pos = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), min(len(a), len(b)))
+                return f"{field}, позиция {pos}: {a[pos:pos + 40]!r} != {b[pos:pos + 40]!r}"
+            return f"{field}: {a!r} != {b!r}"
+    return ''
+
+
+def check_whitespace_cases(backends: list) -> int:
+    """Сравнивает блоки WHITESPACE_CASES с эталонным парсером, возвращает число расхождений"""
+    mismatches = 0
+    for name, body in WHITESPACE_CASES:
+        page = f'<div class="prob_maindiv"><div class="pbody">{body}</div></div>'.encode('utf-8')
+        expected = extract(page, REFERENCE_BACKEND)
+        for backend in backends:
+            difference = first_difference(expected, extract(page, backend))
+            if difference:
+                mismatches += 1
+                print(f"  {backend}: {name}: {difference}")
+    return mismatches
+
+
+def random_block(rng: random.Random, depth: int = 0, inline: bool = False) -> str:
+    """
+    Случайный HTML блока задачи со случайными пробелами и переносами между тегами.
+    Вложенность допустимая (в <p> и строчных тегах - только строчное): иначе
+    html.parser и lxml по-разному исправляют дерево, и это не ошибка обхода
+    """
+    kinds = ('text', 'text', 'img', 'br', 'comment', 'inline', 'inline')
+    if not inline:
+        kinds += ('block', 'block', 'p', 'rule', 'pre', 'table')
+    parts = []
+    for _ in range(rng.randint(1, 6)):
+        parts.append(rng.choice(('', ' ', '\n', '\n    ', '  \n\n  ', '\t')))
+        kind = rng.choice(kinds)
+        if kind == 'text':
+            parts.append(rng.choice(('Клетка', ' ядро ', 'АТФ,\n  синтез', '2 + 2', '&nbsp;x', 'a  b')))
+        elif kind == 'img':
+            parts.append(f'<img src="/formula/{rng.randint(1, 9)}.png">')
+        elif kind == 'br':
+            parts.append('<br>')
+        elif kind == 'comment':
+            parts.append(rng.choice(('<!-- x -->', '<!--  -->')))
+        elif kind == 'rule':
+            parts.append('<div class="rule_info">Правило: <span class="rule_body">текст</span></div>')
+        elif kind == 'pre':
+            parts.append('<pre>  1\n  <b> </b> 2 </pre>')
+        elif kind == 'table':
+            parts.append('<table>\n  <tr>\n    <td>1</td>  <td>\n 2 </td>\n  </tr>\n</table>')
+        elif depth < 3:
+            tag = rng.choice(('span', 'b', 'i')) if kind == 'inline' else kind.replace('block', 'div')
+            parts.append(f'<{tag}>{random_block(rng, depth + 1, inline or tag in ("p", "span", "b", "i"))}</{tag}>')
+    return ''.join(parts)
+
+
+def check_random_blocks(backends: list, count: int, seed: int) -> int:
+    """Сравнивает count случайных блоков с эталонным парсером, возвращает число расхождений"""
+    rng = random.Random(seed)
+    mismatches = 0
+    for number in range(count):
+        body = random_block(rng)
+        page = f'<div class="prob_maindiv"><div class="pbody">{body}</div></div>'.encode('utf-8')
+        expected = extract(page, REFERENCE_BACKEND)
+        for backend in backends:
+            difference = first_difference(expected, extract(page, backend))
+            if difference:
+                mismatches += 1
+                print(f"  {backend}: случайный блок {number}: {difference}\n    {body!r}")
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сравнение HTML парсеров на сохраненных страницах задач')
+    parser.add_argument('--pages', help='Папка со страницами *.html (по умолчанию - кэш http_cache)')
+    parser.add_argument('--limit', type=int, help='Максимум страниц')
+    parser.add_argument('--repeat', type=int, default=3, help='Повторов разбора каждой страницы')
+    parser.add_argument('--random', type=int, default=500, help='Случайных блоков (0 - не проверять)')
+    parser.add_argument('--seed', type=int, default=1, help='Начальное значение генератора случайных блоков')
+    args = parser.parse_args()
+
+    backends = available_backends()
+    mismatches = check_whitespace_cases(backends)
+    print(f"Блоки с пробельными узлами: {len(WHITESPACE_CASES)}, расхождений: {mismatches}")
+    if args.random:
+        random_mismatches = check_random_blocks(backends, args.random, args.seed)
+        mismatches += random_mismatches
+        print(f"Случайные блоки: {args.random}, расхождений: {random_mismatches}")
+
+    pages = recorded_pages(args.pages, limit=args.limit)
+    if not pages:
+        print("Нет сохраненных страниц задач (запустите загрузчик или укажите --pages)")
+        return 1
+
+    print(f"Страниц: {len(pages)}, парсеры: {', '.join(backends)}\n")
+
+    expected = {name: extract(content, REFERENCE_BACKEND) for name, content in pages}
+
+    print(f"{'Парсер':<14}{'мс/страница':>14}{'совпадает':>12}")
+    for backend in backends:
+        elapsed = 0.0
+        same = 0
+        for name, content in pages:
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                result = extract(content, backend)
+            elapsed += time.perf_counter() - started
+            difference = first_difference(expected[name], result) if result != expected[name] else ''
+            if difference:
+                mismatches += 1
+                print(f"  {backend}: {name}: {difference}")
+            else:
+                same += 1
+        per_page = elapsed / (len(pages) * args.repeat) * 1000
+        print(f"{backend:<14}{per_page:>14.2f}{f'{same}/{len(pages)}':>12}")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
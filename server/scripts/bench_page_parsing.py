@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Время разбора и пиковая память: вся страница против только div.prob_maindiv
+
+Прогоняет N страниц задач (сохраненные страницы повторяются по кругу) через
+тот же разбор, что load_html_parser.load_problem, в двух режимах:
+
+- full   - дерево строится для всей страницы (как раньше);
+- strain - строится только блок задачи (html_backend.PROB_MAINDIV).
+
+Каждый режим запускается в отдельном процессе, чтобы пиковая память (RSS)
+не смешивалась. Результаты режимов сравниваются побайтно.
+
+Использование:
+    python bench_page_parsing.py --count 10000
+    python bench_page_parsing.py --pages ./pages --backend lxml
+"""
+
+import argparse
+import hashlib
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from html_backend import BACKENDS, PROB_MAINDIV
+from bench_html_backends import recorded_pages, extract
+
+MODES = ('full', 'strain')
+
+
+def peak_rss_mb():
+    """Пиковый RSS процесса в МБ (None, если модуль resource недоступен, например на Windows)"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux - килобайты, macOS - байты
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_worker(mode: str, backend: str, count: int, pages_dir: str = None):
+    pages = recorded_pages(pages_dir)
+    only = PROB_MAINDIV if mode == 'strain' else None
+    digest = hashlib.sha256()
+    baseline = peak_rss_mb()
+
+    started = time.perf_counter()
+    for index in range(count):
+        _, content = pages[index % len(pages)]
+        result = extract(content, backend, only)
+        if index < len(pages):
+            digest.update(json.dumps(result, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': peak_rss_mb(),
+        'baseline_rss_mb': baseline,
+        'digest': digest.hexdigest(),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Разбор всей страницы против только блока задачи')
+    parser.add_argument('--pages', help='Папка со страницами *.html (по умолчанию - кэш http_cache)')
+    parser.add_argument('--count', type=int, default=10000, help='Сколько страниц разобрать в каждом режиме')
+    parser.add_argument('--backend', default='html.parser', choices=BACKENDS, help='HTML парсер')
+    parser.add_argument('--worker', choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker, args.backend, args.count, args.pages)
+        return 0
+
+    pages = recorded_pages(args.pages)
+    if not pages:
+        print("Нет сохраненных страниц задач (запустите загрузчик или укажите --pages)")
+        return 1
+
+    print(f"Страниц: {args.count} (уникальных {len(pages)}), парсер: {args.backend}\n")
+    print(f"{'Режим':<10}{'мс/страница':>14}{'пик RSS, МБ':>14}{'прирост RSS, МБ':>18}")
+
+    results = {}
+    for mode in MODES:
+        command = [sys.executable, __file__, '--worker', mode, '--count', str(args.count), '--backend', args.backend]
+        if args.pages:
+            command += ['--pages', args.pages]
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        result = results[mode] = json.loads(output.strip().splitlines()[-1])
+
+        per_page = result['seconds'] / args.count * 1000
+        if result['peak_rss_mb'] is None:
+            print(f"{mode:<10}{per_page:>14.2f}{'н/д':>14}{'н/д':>18}")
+        else:
+            growth = result['peak_rss_mb'] - result['baseline_rss_mb']
+            print(f"{mode:<10}{per_page:>14.2f}{result['peak_rss_mb']:>14.1f}{growth:>18.1f}")
+
+    if results['full']['digest'] != results['strain']['digest']:
+        print("\nРезультаты режимов различаются!")
+        return 1
+    print("\nРезультаты режимов совпадают")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
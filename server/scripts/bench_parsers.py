@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Микробенчмарк разбора страниц задач на сохраненных страницах (полностью офлайн)
+
+Замеряет горячий код загрузчиков на корпусе bench_fixtures/*.html (страницы
+problem?id= СДАМ ГИА: формулы, таблицы, длинные решения, много изображений):
+
+- parse_html_block[<парсер>]          - load_html_parser, для каждого HTML парсера;
+- format_text_with_images             - load_with_images (текст и изображения как из API);
+- TasksLoader.extract_text_with_images - load_tasks.
+
+Для каждой цели и страницы считает страниц/с, мс на блок (условие или
+решение) и пик выделенной памяти на страницу (tracemalloc). Изображения не
+скачиваются: путь строится из URL. Если sdamgia-api не установлен, вместо него
+подставляется заглушка - загрузчикам нужен только символ SdamGIA, сеть в
+замерах не используется.
+
+Результат сохраняется в JSON (по умолчанию bench_results/parsers_<дата>.json),
+--compare сравнивает его с прошлым запуском: код возврата 1, если какая-то цель
+стала медленнее больше чем на --threshold процентов.
+
+Использование:
+    python bench_parsers.py
+    python bench_parsers.py --repeat 50 --compare bench_results/parsers_20240101_120000.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from html_backend import parse_document, available_backends, PROB_MAINDIV
+from fetch_context import ProblemFetchContext
+from bench_html_backends import fake_image_saver
+
+SCRIPT_DIR = Path(__file__).parent
+FIXTURES_DIR = SCRIPT_DIR / 'bench_fixtures'
+RESULTS_DIR = SCRIPT_DIR / 'bench_results'
+FIXTURE_URL = 'https://bio-ege.sdamgia.ru/problem?id={}'
+
+
+def load_fixtures(fixtures_dir: Path = FIXTURES_DIR) -> list:
+    """[(имя, содержимое)] страниц корпуса"""
+    return [(path.stem, path.read_bytes()) for path in sorted(Path(fixtures_dir).glob('*.html'))]
+
+
+def pbody_blocks(content: bytes, backend: str = 'html.parser'):
+    """(корень, блоки pbody) страницы"""
+    root = parse_document(content, backend, only=PROB_MAINDIV)
+    return root, root.find('div', 'prob_maindiv').find_all('div', 'pbody')
+
+
+# ---------- цели ----------
+
+def ensure_sdamgia():
+    """Подставляет заглушку модуля sdamgia, если sdamgia-api не импортируется"""
+    sys.path.insert(0, str(SCRIPT_DIR / '../../sdamgia-api'))
+    try:
+        import sdamgia  # noqa: F401
+    except ImportError:
+        stub = types.ModuleType('sdamgia')
+
+        class SdamGIA:
+            """Заглушка: в офлайн замерах API не вызывается"""
+
+        stub.SdamGIA = SdamGIA
+        sys.modules.setdefault('sdamgia', stub)
+
+
+def parse_html_block_target(backend: str):
+    from load_html_parser import parse_html_block
+
+    def run(content: bytes) -> int:
+        root, blocks = pbody_blocks(content, backend)
+        for block, block_type in zip(blocks, ('condition', 'solution')):
+            parse_html_block(block, 'bio', '0', block_type, Path('.'), fake_image_saver)
+        root.release()
+        return min(len(blocks), 2)
+    return run
+
+
+def format_text_with_images_target():
+    import load_with_images
+
+    # Вход как из SdamGIA API: текст блока и список URL изображений
+    prepared = {}
+
+    def prepare(content: bytes):
+        root, blocks = pbody_blocks(content)
+        inputs = [(block.get_text(), [img.get('src') for img in block.find_all('img')]) for block in blocks[:2]]
+        root.release()
+        return inputs
+
+    def run(content: bytes) -> int:
+        inputs = prepared.get(content)
+        if inputs is None:
+            inputs = prepared[content] = prepare(content)
+        saver, load_with_images.save_image = load_with_images.save_image, fake_image_saver
+        try:
+            for (text, images), block_type in zip(inputs, ('condition', 'solution')):
+                load_with_images.format_text_with_images(text, images, 'bio', '0', block_type, Path('.'))
+        finally:
+            load_with_images.save_image = saver
+        return len(inputs)
+    return run
+
+
+class FixtureContext(ProblemFetchContext):
+    """Контекст задачи, который берет страницу из корпуса, а изображения не скачивает"""
+
+    def __init__(self, content: bytes, images_dir: Path):
+        super().__init__(images_dir)
+        self.content = content
+
+    def soup(self, url: str):
+        if url not in self._soups:
+            self._soups[url] = pbody_blocks(self.content)[0]._node
+        return self._soups[url]
+
+    def image(self, url: str, base_url: str = None):
+        rel_path = fake_image_saver(url, 'bio', '0', '', 0, self.images_dir)
+        return rel_path, rel_path.rsplit('/', 1)[-1]
+
+    def finish(self):
+        for soup in self._soups.values():
+            soup.decompose()
+        self._soups.clear()
+
+
+def extract_text_with_images_target(workdir: Path):
+    from load_tasks import TasksLoader
+
+    loader = TasksLoader(str(workdir / 'bench.db'), str(workdir / 'images'))
+
+    def run(content: bytes) -> int:
+        ctx = FixtureContext(content, loader.images_dir)
+        url = FIXTURE_URL.format(0)
+        for block_type in ('condition', 'solution'):
+            loader.extract_text_with_images(url, 'bio', '0', block_type, ctx)
+        ctx.finish()
+        return 2
+    return run
+
+
+def collect_targets(workdir: Path) -> dict:
+    """{имя цели: функция(страница) -> число блоков}; недоступные цели - строка с причиной"""
+    ensure_sdamgia()
+    targets = {}
+    for backend in available_backends():
+        targets[f'parse_html_block[{backend}]'] = lambda backend=backend: parse_html_block_target(backend)
+    targets['format_text_with_images'] = format_text_with_images_target
+    targets['TasksLoader.extract_text_with_images'] = lambda: extract_text_with_images_target(workdir)
+
+    result = {}
+    for name, factory in targets.items():
+        try:
+            result[name] = factory()
+        except ImportError as e:
+            result[name] = f"пропущено: {e}"
+    return result
+
+
+# ---------- замеры ----------
+
+def measure(run, content: bytes, repeat: int) -> dict:
+    run(content)  # прогрев (импорты, кэши)
+
+    times = []
+    blocks = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        blocks = run(content)
+        times.append(time.perf_counter() - started)
+    per_page = statistics.median(times)
+
+    # Память - отдельным прогоном: tracemalloc сильно замедляет код
+    tracemalloc.start()
+    run(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'pages_per_sec': 1 / per_page if per_page > 0 else 0.0,
+        'ms_per_block': per_page / max(blocks, 1) * 1000,
+        'peak_kb': peak / 1024,
+        'blocks': blocks,
+    }
+
+
+def total(fixtures: dict) -> dict:
+    """Итог цели по корпусу: страниц/с по суммарному времени, мс на блок и максимум памяти"""
+    seconds = sum(1 / item['pages_per_sec'] for item in fixtures.values() if item['pages_per_sec'])
+    blocks = sum(item['blocks'] for item in fixtures.values())
+    block_ms = sum(item['ms_per_block'] * item['blocks'] for item in fixtures.values())
+    return {
+        'pages_per_sec': len(fixtures) / seconds if seconds else 0.0,
+        'ms_per_block': block_ms / blocks if blocks else 0.0,
+        'peak_kb': max((item['peak_kb'] for item in fixtures.values()), default=0.0),
+        'blocks': blocks,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> int:
+    """Печатает изменение времени на блок по целям; число целей, ставших медленнее порога"""
+    print(f"\nСравнение с {baseline.get('revision') or '?'} ({baseline.get('created', '?')}):")
+    regressions = 0
+    for name, current in report['results'].items():
+        before = baseline.get('results', {}).get(name)
+        if not before or '_total' not in before:
+            continue
+        old_ms, new_ms = before['_total']['ms_per_block'], current['_total']['ms_per_block']
+        change = (new_ms - old_ms) / old_ms * 100 if old_ms else 0.0
+        mark = ''
+        if change > threshold:
+            regressions += 1
+            mark = '  <-- медленнее'
+        print(f"  {name:<40}{old_ms:>10.3f} -> {new_ms:>8.3f} мс/блок ({change:+.1f}%){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Микробенчмарк разбора страниц задач (офлайн)')
+    parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Папка со страницами *.html')
+    parser.add_argument('--repeat', type=int, default=20, help='Повторов на страницу (берется медиана)')
+    parser.add_argument('--only', help='Только цели, в имени которых есть эта строка')
+    parser.add_argument('--output', help='Файл JSON (по умолчанию bench_results/parsers_<дата>.json)')
+    parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help='Замедление в процентах, которое считается регрессией (по умолчанию 10)')
+    args = parser.parse_args()
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"Нет страниц в {args.fixtures}")
+        return 1
+
+    report = {
+        'revision': git_revision(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'fixtures': [name for name, _ in fixtures],
+        'results': {},
+        'skipped': {},
+    }
+
+    print(f"Страниц: {len(fixtures)}, повторов: {args.repeat}\n")
+    print(f"{'Цель / страница':<44}{'стр/с':>10}{'мс/блок':>10}{'пик, КБ':>10}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, run in collect_targets(Path(workdir)).items():
+            if args.only and args.only not in name:
+                continue
+            if isinstance(run, str):
+                report['skipped'][name] = run
+                print(f"{name:<44}{run}")
+                continue
+
+            results = {}
+            for fixture, content in fixtures:
+                results[fixture] = measure(run, content, args.repeat)
+            results['_total'] = total(results)
+            report['results'][name] = results
+
+            print(name)
+            for fixture, item in results.items():
+                label = 'итого' if fixture == '_total' else fixture
+                print(f"  {label:<42}{item['pages_per_sec']:>10.1f}{item['ms_per_block']:>10.3f}{item['peak_kb']:>10.1f}")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"parsers_{datetime.now():%Y%m%d_%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding='utf-8')
+    print(f"\nРезультат: {output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        if compare(report, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк повторной загрузки предмета: INSERT OR REPLACE против UPSERT
+
+На временной копии схемы из database/init.sql строится "загруженный предмет":
+задачи с темами и категориями, аналогами, строками изображений условий и
+вхождениями в тесты. Затем все задачи сохраняются еще раз (часть - с
+измененным условием), как при повторном запуске load_html_parser:
+
+- replace - прежний save_problem (INSERT OR REPLACE: строка удаляется и
+  вставляется с новым id, зависимые строки удаляются каскадом);
+- upsert  - load_html_parser.save_problem (ON CONFLICT DO UPDATE) и связывание
+  аналогов и категорий одним запросом в конце (analog_links.resolve_analogs,
+  category_index.link_categories).
+
+Показывает время, задач/с, изменения строк SQLite (total_changes), сколько
+задач сменили id и сколько зависимых строк потеряно.
+
+Использование:
+    python bench_problem_upsert.py                        # 3000 задач, 2% изменены
+    python bench_problem_upsert.py --problems 20000 --changed 0.01
+"""
+
+import argparse
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+from content_hash import problem_content_hash
+from load_html_parser import save_problem
+from analog_links import ensure_schema as ensure_analog_schema, resolve_analogs
+from category_index import ensure_schema as ensure_category_schema, record_category, link_categories
+
+INIT_SQL = Path(__file__).parent.parent / 'database' / 'init.sql'
+
+SUBJECT = 'bio'
+EXAM_TYPE = 'oge'
+TOPICS = 20
+CATEGORIES_PER_TOPIC = 5
+IMAGES_PER_PROBLEM = 3
+ANALOGS_PER_PROBLEM = 4
+PROBLEMS_PER_TEST = 20
+
+DEPENDENT_TABLES = ('problem_condition_images', 'category_problems', 'problem_analogs', 'test_problems')
+
+
+def problem_data(number: int, total: int, revision: int = 0) -> dict:
+    topic = number % TOPICS + 1
+    images = ''.join(f"![img](http://localhost:3001/tasks/images/blobs/{number:06x}{i}.svg)"
+                     for i in range(IMAGES_PER_PROBLEM))
+    return {
+        'condition': f"Условие задачи {number} (редакция {revision}). " * 8 + images,
+        'solution': f"Решение задачи {number}. " * 20,
+        'answer': str(number % 100),
+        'topic_number': str(topic),
+        'analogs': [str((number + step * TOPICS) % total + 1) for step in range(1, ANALOGS_PER_PROBLEM + 1)],
+    }
+
+
+def problem_category(number: int) -> str:
+    """Категория задачи (ID СДАМ ГИА) - одна из категорий ее темы"""
+    return f'{number % TOPICS + 1}{number // TOPICS % CATEGORIES_PER_TOPIC:02d}'
+
+
+def finish_upsert(conn):
+    resolve_analogs(conn)
+    link_categories(conn)
+
+
+def create_db(db_path: Path, problems: int):
+    """Загруженный предмет: задачи, категории, аналоги, изображения и тесты"""
+    conn = connect(db_path, ingest=True)
+    conn.executescript(INIT_SQL.read_text(encoding='utf-8'))
+    ensure_analog_schema(conn)
+    ensure_category_schema(conn)
+    conn.execute("INSERT INTO subjects (code, name, exam_type) VALUES (?, 'Биология', ?)", (SUBJECT, EXAM_TYPE))
+    subject_id = conn.execute("SELECT id FROM subjects").fetchone()[0]
+    for topic in range(1, TOPICS + 1):
+        topic_id = conn.execute(
+            "INSERT INTO topics (subject_id, topic_number, topic_name, topic_line) VALUES (?, ?, ?, ?)",
+            (subject_id, str(topic), f'Задание {topic}', str(topic))
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO categories (topic_id, category_id, category_name) VALUES (?, ?, ?)",
+            [(topic_id, f'{topic}{c:02d}', f'Категория {topic}.{c}') for c in range(CATEGORIES_PER_TOPIC)]
+        )
+    conn.commit()
+
+    for number in range(1, problems + 1):
+        save_problem(conn, SUBJECT, EXAM_TYPE, str(number), f'https://{SUBJECT}-oge.sdamgia.ru/problem?id={number}',
+                     problem_data(number, problems))
+        record_category(conn.cursor(), subject_id, problem_category(number), [number])
+    finish_upsert(conn)
+
+    rows = conn.execute("SELECT id, problem_id FROM problems").fetchall()
+    conn.executemany(
+        "INSERT INTO problem_condition_images (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)",
+        [(db_id, f'https://{SUBJECT}-oge.sdamgia.ru/formula/{problem_id}_{i}.svg',
+          f'blobs/{int(problem_id):06x}{i}.svg', i)
+         for db_id, problem_id in rows for i in range(IMAGES_PER_PROBLEM)]
+    )
+    for start in range(0, len(rows), PROBLEMS_PER_TEST):
+        test_id = conn.execute("INSERT INTO tests (subject_id, test_id) VALUES (?, ?)",
+                               (subject_id, str(start))).lastrowid
+        conn.executemany(
+            "INSERT INTO test_problems (test_id, problem_id, problem_order) VALUES (?, ?, ?)",
+            [(test_id, db_id, order) for order, (db_id, _) in enumerate(rows[start:start + PROBLEMS_PER_TEST])]
+        )
+    conn.commit()
+    conn.close()
+
+
+def replace_save_problem(conn, subject_code: str, exam_type: str, problem_id: str, url: str, data: dict):
+    """Прежний save_problem: INSERT OR REPLACE и связи по одной строке"""
+    cursor = conn.cursor()
+    cursor.execute("INSERT OR IGNORE INTO subjects (code, name, exam_type) VALUES (?, ?, ?)",
+                   (subject_code, subject_code, exam_type))
+    conn.commit()
+    subject_id = cursor.execute("SELECT id FROM subjects WHERE code = ? AND exam_type = ?",
+                                (subject_code, exam_type)).fetchone()[0]
+    topic_id = cursor.execute("SELECT id FROM topics WHERE subject_id = ? AND topic_number = ?",
+                              (subject_id, data['topic_number'])).fetchone()[0]
+    cursor.execute("""
+        INSERT OR REPLACE INTO problems
+        (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, source, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'sdamgia', ?)
+    """, (subject_id, topic_id, problem_id, data['topic_number'], data['condition'], data['solution'],
+          data['answer'], url, problem_content_hash(data['condition'], data['solution'], data['answer'])))
+    problem_db_id = cursor.lastrowid
+    for analog_id in data['analogs']:
+        analog_row = cursor.execute("SELECT id FROM problems WHERE subject_id = ? AND problem_id = ?",
+                                    (subject_id, analog_id)).fetchone()
+        if analog_row:
+            cursor.execute("INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id) VALUES (?, ?)",
+                           (problem_db_id, analog_row[0]))
+            cursor.execute("INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id) VALUES (?, ?)",
+                           (analog_row[0], problem_db_id))
+    for cat_db_id, in cursor.execute("SELECT id FROM categories WHERE topic_id = ?", (topic_id,)).fetchall():
+        cursor.execute("INSERT OR IGNORE INTO category_problems (category_id, problem_id) VALUES (?, ?)",
+                       (cat_db_id, problem_db_id))
+    conn.commit()
+
+
+def table_counts(conn: sqlite3.Connection) -> dict:
+    return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in DEPENDENT_TABLES}
+
+
+def run(source_db: Path, tmp: Path, save, problems: int, changed: float, seed: int, finish=None) -> dict:
+    db_path = tmp / f'{save.__name__}.db'
+    shutil.copyfile(source_db, db_path)
+    conn = connect(db_path, ingest=True)
+    ids_before = dict(conn.execute("SELECT problem_id, id FROM problems").fetchall())
+    counts_before = table_counts(conn)
+    changes_before = conn.total_changes
+
+    rnd = random.Random(seed)
+    started = time.perf_counter()
+    for number in range(1, problems + 1):
+        revision = 1 if rnd.random() < changed else 0
+        save(conn, SUBJECT, EXAM_TYPE, str(number), f'https://{SUBJECT}-oge.sdamgia.ru/problem?id={number}',
+             problem_data(number, problems, revision))
+    if finish is not None:
+        finish(conn)
+    elapsed = time.perf_counter() - started
+
+    ids_after = dict(conn.execute("SELECT problem_id, id FROM problems").fetchall())
+    counts_after = table_counts(conn)
+    result = {
+        'seconds': elapsed,
+        'per_sec': problems / elapsed,
+        'changes': conn.total_changes - changes_before,
+        'moved_ids': sum(1 for problem_id, db_id in ids_before.items() if ids_after.get(problem_id) != db_id),
+        'lost': {table: counts_before[table] - counts_after[table] for table in DEPENDENT_TABLES},
+    }
+    conn.close()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк повторной загрузки предмета: INSERT OR REPLACE и UPSERT')
+    parser.add_argument('--problems', type=int, default=3000, help='Задач в предмете')
+    parser.add_argument('--changed', type=float, default=0.02, help='Доля задач с измененным условием')
+    parser.add_argument('--seed', type=int, default=1, help='Зерно выбора измененных задач')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        source_db = tmp / 'subject.db'
+        create_db(source_db, args.problems)
+
+        print(f"Повторная загрузка {args.problems} задач ({args.changed:.0%} изменены)\n")
+        print(f"{'Запись':<10}{'время':>10}{'задач/с':>10}{'изменений':>12}{'сменили id':>12}"
+              f"{'потеряно: изобр.':>18}{'категории':>11}{'аналоги':>10}{'тесты':>8}")
+        for label, save, finish in (('replace', replace_save_problem, None),
+                                    ('upsert', save_problem, finish_upsert)):
+            result = run(source_db, tmp, save, args.problems, args.changed, args.seed, finish)
+            lost = result['lost']
+            print(f"{label:<10}{result['seconds']:>8.2f} с{result['per_sec']:>10.0f}{result['changes']:>12}"
+                  f"{result['moved_ids']:>12}{lost['problem_condition_images']:>18}"
+                  f"{lost['category_problems']:>11}{lost['problem_analogs']:>10}{lost['test_problems']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк одновременной записи и чтения tasksbd.db
+
+Моделирует загрузчик (писатель: задача + изображения, коммит на задачу)
+и сервер (читатели: запросы как в tasks.service.ts) на временной копии схемы
+из database/init.sql. Сравнивает подключения по умолчанию (sqlite3.connect)
+и настроенные через sqlite_conn.connect.
+
+Использование:
+    python bench_sqlite_concurrency.py                    # 10 секунд, 4 читателя
+    python bench_sqlite_concurrency.py --seconds 30 --readers 8
+"""
+
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+
+INIT_SQL = Path(__file__).parent.parent / 'database' / 'init.sql'
+
+# Ожидание блокировки как у better-sqlite3 по умолчанию
+DEFAULT_TIMEOUT = 5.0
+
+
+def create_db(db_path: Path):
+    conn = sqlite3.connect(str(db_path))
+    conn.executescript(INIT_SQL.read_text(encoding='utf-8'))
+    conn.execute("INSERT INTO subjects (code, name, exam_type) VALUES ('bio', 'Биология', 'oge')")
+    conn.commit()
+    conn.close()
+
+
+def open_connection(db_path: Path, tuned: bool, ingest: bool):
+    if tuned:
+        return connect(db_path, ingest=ingest)
+    return sqlite3.connect(str(db_path), timeout=DEFAULT_TIMEOUT)
+
+
+def writer(db_path: Path, tuned: bool, stop: threading.Event, stats: dict):
+    conn = open_connection(db_path, tuned, ingest=True)
+    cursor = conn.cursor()
+    subject_id = cursor.execute("SELECT id FROM subjects").fetchone()[0]
+    problem_id = 0
+    while not stop.is_set():
+        problem_id += 1
+        try:
+            cursor.execute(
+                "INSERT INTO problems (subject_id, problem_id, line, condition_text, solution_text, answer, url) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (subject_id, str(problem_id), str(problem_id % 20 + 1), 'условие ' * 50, 'решение ' * 100, '42', '')
+            )
+            db_problem_id = cursor.lastrowid
+            cursor.executemany(
+                "INSERT INTO problem_condition_images (problem_id, image_url, image_path, image_order) VALUES (?, ?, ?, ?)",
+                [(db_problem_id, f'img{i}', f'blobs/{i}.svg', i) for i in range(3)]
+            )
+            conn.commit()
+            stats['writes'] += 1
+        except sqlite3.OperationalError:
+            conn.rollback()
+            stats['write_errors'] += 1
+    conn.close()
+
+
+def reader(db_path: Path, tuned: bool, stop: threading.Event, stats: dict, lock: threading.Lock):
+    conn = open_connection(db_path, tuned, ingest=False)
+    latencies = []
+    errors = 0
+    while not stop.is_set():
+        line = str(random.randint(1, 20))
+        started = time.perf_counter()
+        try:
+            conn.execute("""
+                SELECT p.id, p.problem_id, p.condition_text, p.answer,
+                       (SELECT COUNT(*) FROM problem_condition_images ci WHERE ci.problem_id = p.id)
+                FROM problems p
+                JOIN subjects s ON s.id = p.subject_id
+                WHERE s.code = 'bio' AND p.line = ?
+                ORDER BY p.id DESC
+                LIMIT 20
+            """, (line,)).fetchall()
+            latencies.append(time.perf_counter() - started)
+        except sqlite3.OperationalError:
+            errors += 1
+    conn.close()
+    with lock:
+        stats['read_latencies'].extend(latencies)
+        stats['read_errors'] += errors
+
+
+def run(tuned: bool, seconds: float, readers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / 'bench.db'
+        create_db(db_path)
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {'writes': 0, 'write_errors': 0, 'read_latencies': [], 'read_errors': 0}
+        threads = [threading.Thread(target=writer, args=(db_path, tuned, stop, stats))]
+        threads += [threading.Thread(target=reader, args=(db_path, tuned, stop, stats, lock)) for _ in range(readers)]
+
+        for thread in threads:
+            thread.start()
+        time.sleep(seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+    latencies = sorted(stats['read_latencies'])
+    p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+    return {
+        'writes_per_sec': stats['writes'] / seconds,
+        'reads_per_sec': len(latencies) / seconds,
+        'read_p95_ms': p95,
+        'write_errors': stats['write_errors'],
+        'read_errors': stats['read_errors'],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк одновременной записи и чтения SQLite')
+    parser.add_argument('--seconds', type=float, default=10, help='Длительность каждого прогона')
+    parser.add_argument('--readers', type=int, default=4, help='Количество потоков-читателей')
+    args = parser.parse_args()
+
+    print(f"Писатель: 1, читателей: {args.readers}, по {args.seconds:g} с на прогон\n")
+    print(f"{'Подключение':<14}{'записей/с':>12}{'чтений/с':>12}{'p95 чтения':>14}{'ошибок записи':>16}{'ошибок чтения':>16}")
+    for label, tuned in (('по умолчанию', False), ('sqlite_conn', True)):
+        result = run(tuned, args.seconds, args.readers)
+        print(f"{label:<14}{result['writes_per_sec']:>12.1f}{result['reads_per_sec']:>12.1f}"
+              f"{result['read_p95_ms']:>11.2f} мс{result['write_errors']:>16}{result['read_errors']:>16}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Пакетная запись задач в SQLite (bulk-ingest)
+
+Функции загрузчиков (upsert_*, get_or_create_*, insert_images, ...) вызывают
+commit() после каждого изменения, поэтому импорт одной задачи стоил 5-10 fsync.
+IngestConnection - подключение, у которого в пакетном режиме commit()
+ничего не делает, а настоящий COMMIT выполняется раз
+в batch_size задач или раз в batch_seconds секунд. При сбое теряется не
+больше одного пакета.
+
+Каждая задача пишется внутри SAVEPOINT: rollback() во время записи задачи
+откатывает только эту задачу, а не весь пакет.
+
+Использование:
+    conn = connect_for_ingest(db_path, bulk=True, batch_size=100, batch_seconds=5)
+    with conn.problem():
+        ...                  # запись одной задачи, commit() внутри откладывается
+    conn.flush()             # дописать последний пакет
+    print(conn.summary())
+"""
+
+import sqlite3
+import time
+from contextlib import contextmanager
+
+from sqlite_conn import connect
+from run_metrics import run_metrics
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_BATCH_SECONDS = 5.0
+
+
+class IngestConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bulk = False
+        self.batch_size = DEFAULT_BATCH_SIZE
+        self.batch_seconds = DEFAULT_BATCH_SECONDS
+        self._in_problem = False
+        self._pending = 0
+        self._batch_started = time.perf_counter()
+        self.stats = {'problems': 0, 'commits': 0, 'commit_time': 0.0, 'started': time.perf_counter()}
+
+    def configure_batch(self, bulk: bool = True, batch_size: int = DEFAULT_BATCH_SIZE,
+                        batch_seconds: float = DEFAULT_BATCH_SECONDS):
+        self.bulk = bulk
+        self.batch_size = max(1, batch_size)
+        self.batch_seconds = batch_seconds
+
+    # ---------- транзакции ----------
+
+    def commit(self):
+        """В пакетном режиме коммит откладывается до конца пакета"""
+        if self.bulk:
+            return
+        self._real_commit()
+
+    def rollback(self):
+        """В пакетном режиме внутри задачи откатывает только текущую задачу"""
+        if self.bulk and self._in_problem:
+            self.execute("ROLLBACK TO SAVEPOINT ingest_problem")
+            return
+        super().rollback()
+
+    def _real_commit(self):
+        started = time.perf_counter()
+        super().commit()
+        elapsed = time.perf_counter() - started
+        self.stats['commit_time'] += elapsed
+        run_metrics.observe('db_commit', elapsed)
+        self.stats['commits'] += 1
+        self._pending = 0
+        self._batch_started = time.perf_counter()
+
+    @contextmanager
+    def problem(self):
+        """Граница записи одной задачи"""
+        if not self.bulk:
+            yield self
+            self.stats['problems'] += 1
+            return
+
+        if not self.in_transaction:
+            self.execute("BEGIN")
+        self.execute("SAVEPOINT ingest_problem")
+        self._in_problem = True
+        try:
+            yield self
+        except BaseException:
+            self.execute("ROLLBACK TO SAVEPOINT ingest_problem")
+            raise
+        finally:
+            self._in_problem = False
+            self.execute("RELEASE SAVEPOINT ingest_problem")
+
+        self.stats['problems'] += 1
+        self._pending += 1
+        if (self._pending >= self.batch_size
+                or time.perf_counter() - self._batch_started >= self.batch_seconds):
+            self._real_commit()
+
+    def flush(self):
+        """Коммитит незавершенный пакет"""
+        if self.in_transaction:
+            self._real_commit()
+
+    def close(self):
+        if self.bulk:
+            self.flush()
+        super().close()
+
+    # ---------- статистика ----------
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.stats['started']
+        problems = self.stats['problems']
+        rate = problems / elapsed if elapsed > 0 else 0.0
+        mode = f"пакеты по {self.batch_size} задач / {self.batch_seconds:g} с" if self.bulk else "коммит на каждое изменение"
+        return (f"Запись в БД: {problems} задач, коммитов: {self.stats['commits']} "
+                f"({self.stats['commit_time']:.2f} с на коммиты, {rate:.1f} задач/с, {mode})")
+
+
+def connect_for_ingest(db_path, bulk: bool = False, batch_size: int = DEFAULT_BATCH_SIZE,
+                       batch_seconds: float = DEFAULT_BATCH_SECONDS) -> IngestConnection:
+    """Подключение к БД для загрузчиков (с пакетным режимом или без)"""
+    conn = connect(db_path, ingest=True, factory=IngestConnection)
+    conn.configure_batch(bulk, batch_size, batch_seconds)
+    return conn
+
+
+def add_bulk_arguments(parser):
+    """Добавляет в argparse параметры пакетной записи"""
+    parser.add_argument('--bulk', action='store_true',
+                        help='Пакетная запись: один коммит на несколько задач')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Задач в одном пакете (по умолчанию {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--batch-seconds', type=float, default=DEFAULT_BATCH_SECONDS,
+                        help=f'Максимальная длительность пакета в секундах (по умолчанию {DEFAULT_BATCH_SECONDS:g})')
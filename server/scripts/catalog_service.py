@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Каталог предметов СДАМ ГИА: один запрос на предмет и индекс по темам/категориям
+
+database/load_tasks.import_problem запрашивал каталог заново на каждую задачу,
+чтобы найти название темы, а get_problem_ids, load_catalog и load_tasks_batch
+получали тот же каталог еще раз. CatalogService держит каталог каждого предмета
+в памяти процесса в виде индекса:
+
+    topic_id    -> тема
+    category_id -> категория (и её тема)
+
+На диск каталог сохраняет http_cache (класс 'catalog', TTL 7 дней), поэтому
+повторный запуск в пределах TTL не обращается к сети вовсе.
+
+Использование:
+    catalog = get_catalog(sdamgia, 'bio')
+    for topic in catalog:
+        ...
+    topic = catalog.topic('12')            # None, если темы нет
+    category = catalog.category('174')
+"""
+
+import threading
+
+from http_cache import cached_call
+from rate_limiter import api_host
+
+
+class Catalog:
+    def __init__(self, subject_code: str, topics: list):
+        self.subject_code = subject_code
+        self.topics = topics or []
+        self._topics = {}
+        self._categories = {}
+        self._category_topics = {}
+        for topic in self.topics:
+            self._topics[str(topic['topic_id'])] = topic
+            for category in topic.get('categories', []):
+                self._categories[str(category['category_id'])] = category
+                self._category_topics[str(category['category_id'])] = topic
+
+    def __iter__(self):
+        return iter(self.topics)
+
+    def __len__(self) -> int:
+        return len(self.topics)
+
+    def __getitem__(self, index):
+        return self.topics[index]
+
+    def topic(self, topic_id) -> dict:
+        """Тема по номеру задания (None, если её нет в каталоге)"""
+        return self._topics.get(str(topic_id))
+
+    def category(self, category_id) -> dict:
+        """Категория по ID (None, если её нет в каталоге)"""
+        return self._categories.get(str(category_id))
+
+    def topic_of_category(self, category_id) -> dict:
+        """Тема, в которую входит категория"""
+        return self._category_topics.get(str(category_id))
+
+
+class CatalogService:
+    def __init__(self):
+        self._catalogs = {}
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'hits': 0}
+
+    def get(self, sdamgia, subject_code: str) -> Catalog:
+        """Каталог предмета (запрашивается один раз за процесс)"""
+        with self._lock:
+            catalog = self._catalogs.get(subject_code)
+            if catalog is not None:
+                self.stats['hits'] += 1
+                return catalog
+
+            topics = cached_call('catalog', api_host(subject_code), sdamgia.get_catalog, subject_code)
+            self.stats['requests'] += 1
+            catalog = Catalog(subject_code, topics)
+            if topics:
+                # Пустой ответ не запоминаем - следующий вызов попробует снова
+                self._catalogs[subject_code] = catalog
+            return catalog
+
+    def summary(self) -> str:
+        return f"Каталоги: запросов {self.stats['requests']}, из памяти {self.stats['hits']}"
+
+    def invalidate(self, subject_code: str = None):
+        """Забывает каталог предмета (или все каталоги)"""
+        with self._lock:
+            if subject_code is None:
+                self._catalogs.clear()
+            else:
+                self._catalogs.pop(subject_code, None)
+
+
+# Общий сервис каталогов процесса
+catalog_service = CatalogService()
+
+
+def get_catalog(sdamgia, subject_code: str) -> Catalog:
+    return catalog_service.get(sdamgia, subject_code)
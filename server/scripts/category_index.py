@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Точный состав категорий (category_index) и связывание задач с категориями
+
+load_problem и database/load_tasks.link_problem_to_categories связывали задачу
+со всеми категориями ее темы, поэтому category_problems росла как
+задачи x категории темы, а выборка задач категории возвращала чужие задачи.
+При этом настоящий состав категории у загрузчиков уже был - список ID задач
+из get_category_by_id - и после выбора задач выбрасывался.
+
+Теперь этот список сохраняется (весь, включая еще не загруженные задачи) в
+таблицу category_index по ID СДАМ ГИА, а связи category_problems создает
+один проход INSERT ... SELECT с JOIN на problems и categories - в конце
+запуска или по запросу. Связи категорий, состав которых известен, но не
+подтвержден списком (остались от связывания по теме), тем же проходом
+удаляются. Строки индекса, задача или категория которых еще не загружена,
+ждут следующего прохода; повторный проход ничего не пишет.
+
+Использование:
+    from category_index import ensure_schema, record_category, link_categories
+
+    ensure_schema(conn)
+    record_category(cursor, subject_id, '174', problem_ids)   # после get_category_by_id
+    linked, removed = link_categories(conn)                   # в конце запуска
+
+    python category_index.py --db ../tasksbd.db                 # по запросу
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+from run_log import get_logger, setup_logging, add_logging_arguments
+
+log = get_logger(__name__)
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS category_index (
+    subject_id INTEGER NOT NULL,            -- Предмет (ID категорий и задач СДАМ ГИА уникальны в пределах предмета)
+    category_id TEXT NOT NULL,              -- ID категории из СДАМ ГИА
+    problem_id TEXT NOT NULL,               -- ID задачи из СДАМ ГИА (может быть еще не загружена)
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (subject_id) REFERENCES subjects(id) ON DELETE CASCADE,
+    PRIMARY KEY (subject_id, category_id, problem_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_category_index_problem ON category_index(subject_id, problem_id);
+"""
+
+# Связи для всех строк индекса, задача и категория которых уже есть в БД
+LINK_SQL = """
+INSERT OR IGNORE INTO category_problems (category_id, problem_id)
+SELECT c.id, p.id
+FROM category_index ci
+JOIN problems p ON p.subject_id = ci.subject_id AND p.problem_id = ci.problem_id
+JOIN topics t ON t.subject_id = ci.subject_id
+JOIN categories c ON c.topic_id = t.id AND c.category_id = ci.category_id
+{subject_filter}
+"""
+
+# Связи проиндексированных категорий, которых нет в их списке (остались от связывания по теме)
+PRUNE_SQL = """
+DELETE FROM category_problems WHERE id IN (
+    SELECT cp.id
+    FROM category_problems cp
+    JOIN categories c ON c.id = cp.category_id
+    JOIN topics t ON t.id = c.topic_id
+    JOIN problems p ON p.id = cp.problem_id
+    WHERE EXISTS (SELECT 1 FROM category_index ci
+                  WHERE ci.subject_id = t.subject_id AND ci.category_id = c.category_id)
+      AND NOT EXISTS (SELECT 1 FROM category_index ci
+                      WHERE ci.subject_id = t.subject_id AND ci.category_id = c.category_id
+                        AND ci.problem_id = p.problem_id)
+      {subject_filter}
+)
+"""
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Создает таблицу состава категорий по ID СДАМ ГИА"""
+    conn.executescript(SCHEMA_SQL)
+
+
+def record_category(cursor, subject_id: int, category_id, problem_ids):
+    """
+    Запоминает задачи категории (связи создаст link_categories). Строки только
+    добавляются: get_category_by_id отдает одну страницу списка, и задачи с
+    других страниц, записанные раньше, не должны пропадать
+    """
+    category_id = str(category_id)
+    cursor.executemany(
+        "INSERT OR IGNORE INTO category_index (subject_id, category_id, problem_id) VALUES (?, ?, ?)",
+        [(subject_id, category_id, str(problem_id)) for problem_id in problem_ids or ()]
+    )
+
+
+def link_categories(conn: sqlite3.Connection, subject_id: int = None) -> tuple:
+    """
+    Создает все разрешимые связи category_problems одним запросом и удаляет
+    связи проиндексированных категорий, не подтвержденные индексом
+    (subject_id - только один предмет). Возвращает (добавлено, удалено)
+    """
+    params = (subject_id,) if subject_id else ()
+    before = conn.total_changes
+    conn.execute(PRUNE_SQL.format(subject_filter='AND t.subject_id = ?' if subject_id else ''), params)
+    removed = conn.total_changes - before
+    conn.execute(LINK_SQL.format(subject_filter='WHERE ci.subject_id = ?' if subject_id else ''), params)
+    linked = conn.total_changes - before - removed
+    # В пакетном режиме (bulk_ingest) commit() отложен - связи должны попасть в БД сейчас
+    getattr(conn, 'flush', conn.commit)()
+    return linked, removed
+
+
+def unlinked_count(conn: sqlite3.Connection) -> int:
+    """Сколько строк индекса ждут загрузки задачи"""
+    return conn.execute("""
+        SELECT COUNT(*) FROM category_index ci
+        WHERE NOT EXISTS (SELECT 1 FROM problems p WHERE p.subject_id = ci.subject_id
+                                                     AND p.problem_id = ci.problem_id)
+    """).fetchone()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Связывание задач с категориями по таблице category_index')
+    parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
+    parser.add_argument('--subject', help='Код предмета (по умолчанию все)')
+    parser.add_argument('--exam-type', default='oge', choices=['oge', 'ege'], help='Тип экзамена')
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args)
+
+    conn = connect(Path(__file__).parent / args.db)
+    ensure_schema(conn)
+    subject_id = None
+    if args.subject:
+        row = conn.execute("SELECT id FROM subjects WHERE code = ? AND exam_type = ?",
+                           (args.subject, args.exam_type)).fetchone()
+        if row is None:
+            log.error(f"Предмет {args.subject} ({args.exam_type}) не найден в БД")
+            sys.exit(1)
+        subject_id = row[0]
+
+    linked, removed = link_categories(conn, subject_id)
+    total = conn.execute("SELECT COUNT(*) FROM category_problems").fetchone()[0]
+    log.info(f"Связей с категориями добавлено: {linked}, удалено лишних: {removed}, всего: {total}, "
+             f"ждут загрузки задачи: {unlinked_count(conn)}")
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
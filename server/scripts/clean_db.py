@@ -9,27 +9,43 @@
 
 import sys
 import os
-import sqlite3
 import argparse
 import shutil
 from pathlib import Path
 
+sys.path.insert(0, os.path.dirname(__file__))
+from sqlite_conn import connect
+from image_store import get_image_store, referenced_blobs, BLOBS_DIR_NAME
+from run_log import get_logger, setup_logging, add_logging_arguments
+
+log = get_logger(__name__)
+
+# Журнал обхода каталога (crawl_journal.py): после очистки БД --resume не должен
+# считать задачи загруженными
+JOURNAL_TABLES = ['crawl_journal', 'crawl_journal_categories', 'crawl_runs']
+
+
+def existing_tables(cursor) -> set:
+    """Таблицы, которые есть в БД (журнал есть не во всех БД)"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cursor.fetchall()}
+
 
 def clean_database(db_path: str, subject_code: str = None):
     """Очистить базу данных"""
-    conn = sqlite3.connect(db_path)
+    conn = connect(db_path)
     cursor = conn.cursor()
     
     try:
         if subject_code:
-            print(f"🗑️  Удаление данных по предмету: {subject_code}")
+            log.info(f"Удаление данных по предмету: {subject_code}")
             
             # Получаем ID предмета
             cursor.execute("SELECT id FROM subjects WHERE code = ?", (subject_code,))
             subject_row = cursor.fetchone()
             
             if not subject_row:
-                print(f"⚠️  Предмет {subject_code} не найден в БД")
+                log.warning(f"Предмет {subject_code} не найден в БД")
                 return
             
             subject_id = subject_row[0]
@@ -39,10 +55,17 @@ def clean_database(db_path: str, subject_code: str = None):
             cursor.execute("DELETE FROM topics WHERE subject_id = ?", (subject_id,))
             cursor.execute("DELETE FROM subjects WHERE id = ?", (subject_id,))
             
+            # Запуски загрузки предмета и их журнал
+            if set(JOURNAL_TABLES) <= existing_tables(cursor):
+                runs = "SELECT run_id FROM crawl_runs WHERE subject_code = ?"
+                cursor.execute(f"DELETE FROM crawl_journal WHERE run_id IN ({runs})", (subject_code,))
+                cursor.execute(f"DELETE FROM crawl_journal_categories WHERE run_id IN ({runs})", (subject_code,))
+                cursor.execute("DELETE FROM crawl_runs WHERE subject_code = ?", (subject_code,))
+            
             conn.commit()
-            print(f"✅ Данные по предмету {subject_code} удалены")
+            log.info(f"Данные по предмету {subject_code} удалены")
         else:
-            print("🗑️  Удаление ВСЕХ данных из БД")
+            log.info("Удаление ВСЕХ данных из БД")
             
             # Удаляем все данные
             tables = [
@@ -58,50 +81,68 @@ def clean_database(db_path: str, subject_code: str = None):
                 'subjects',
             ]
             
+            tables += [table for table in JOURNAL_TABLES if table in existing_tables(cursor)]
+            
             for table in tables:
                 cursor.execute(f"DELETE FROM {table}")
-                print(f"   ✅ Таблица {table} очищена")
+                log.info(f"Таблица {table} очищена")
             
             conn.commit()
-            print("✅ Все данные удалены")
+            log.info("Все данные удалены")
             
     except Exception as e:
-        print(f"❌ Ошибка очистки БД: {e}")
+        log.error(f"Ошибка очистки БД: {e}")
         conn.rollback()
     finally:
         conn.close()
 
 
-def clean_images(images_dir: str, subject_code: str = None):
-    """Очистить папку с изображениями"""
+def clean_images(images_dir: str, subject_code: str = None, db_path: str = None):
+    """
+    Очистить папку с изображениями. Файлы хранилища (blobs/) общие для всех
+    предметов: при удалении предмета удаляются те, на которые в БД db_path
+    больше нет ссылок
+    """
     images_path = Path(images_dir)
     
     if not images_path.exists():
-        print(f"⚠️  Папка {images_dir} не существует")
+        log.warning(f"Папка {images_dir} не существует")
         return
     
     try:
         if subject_code:
+            # Старая раскладка: image_tasksdb/{subject}/{problem_id}/...
             subject_dir = images_path / subject_code
             if subject_dir.exists():
-                print(f"🗑️  Удаление изображений предмета: {subject_code}")
+                log.info(f"Удаление изображений предмета: {subject_code}")
                 shutil.rmtree(subject_dir)
-                print(f"✅ Папка {subject_code} удалена")
-            else:
-                print(f"⚠️  Папка {subject_code} не найдена")
+                log.info(f"Папка {subject_code} удалена")
+            
+            if (images_path / BLOBS_DIR_NAME).exists() and db_path:
+                conn = connect(db_path)
+                try:
+                    referenced = referenced_blobs(conn)
+                finally:
+                    conn.close()
+                store = get_image_store(images_path)
+                try:
+                    files, size = store.collect_garbage(referenced)
+                finally:
+                    store.close()
+                log.info(f"Удалено файлов хранилища без ссылок: {files} ({size / 1024 / 1024:.1f} МБ)")
         else:
-            print(f"🗑️  Удаление ВСЕХ изображений из {images_dir}")
+            log.info(f"Удаление ВСЕХ изображений из {images_dir}")
             
             # Удаляем все подпапки
             for item in images_path.iterdir():
                 if item.is_dir():
-                    print(f"   Удаление {item.name}...")
+                    log.info(f"Удаление {item.name}...")
                     shutil.rmtree(item)
             
-            print("✅ Все изображения удалены")
+            log.info("Все изображения удалены")
             
     except Exception as e:
-        print(f"❌ Ошибка удаления изображений: {e}")
+        log.error(f"Ошибка удаления изображений: {e}")
 
 
 def main():
@@ -110,12 +151,14 @@ def main():
     parser.add_argument('--subject', help='Код предмета для удаления (опционально)')
     parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
     parser.add_argument('--images-dir', default='../image_tasksdb', help='Папка для изображений')
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    setup_logging(args)
     
     if not args.confirm:
-        print("⚠️  Для подтверждения удаления используйте флаг --confirm")
-        print("   Пример: python clean_db.py --confirm")
+        log.warning("Для подтверждения удаления используйте флаг --confirm")
+        log.info("Пример: python clean_db.py --confirm")
         return
     
     # Определяем пути относительно скрипта
@@ -123,31 +166,28 @@ def main():
     db_path = script_dir / args.db
     images_dir = script_dir / args.images_dir
     
-    print("=" * 60)
-    print("🗑️  ОЧИСТКА БАЗЫ ДАННЫХ")
-    print("=" * 60)
+    log.info("Очистка базы данных")
     
     if args.subject:
-        print(f"Предмет: {args.subject}")
+        log.info(f"Предмет: {args.subject}")
     else:
-        print("⚠️  ВНИМАНИЕ: Будут удалены ВСЕ данные!")
+        log.warning("ВНИМАНИЕ: Будут удалены ВСЕ данные!")
     
-    print(f"БД: {db_path}")
-    print(f"Папка изображений: {images_dir}")
-    print("=" * 60)
+    log.info(f"БД: {db_path}")
+    log.info(f"Папка изображений: {images_dir}")
     
     # Запрос подтверждения
     if not args.subject:
         confirm = input("\n⚠️  Вы уверены, что хотите удалить ВСЕ данные? (введите 'да'): ")
         if confirm.lower() != 'да':
-            print("❌ Отменено")
+            log.info("Отменено")
             return
     
     # Очистка
     clean_database(str(db_path), args.subject)
-    clean_images(str(images_dir), args.subject)
+    clean_images(str(images_dir), args.subject, str(db_path))
     
-    print("\n✅ Очистка завершена!")
+    log.info("Очистка завершена!")
 
 
 if __name__ == '__main__':
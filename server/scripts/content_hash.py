@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Хэши содержимого задач для инкрементального обновления (--refresh)
+
+Чтобы поддерживать загруженный предмет актуальным, приходилось загружать его
+заново: load_html_parser.load_problem заменял строку задачи целиком, а
+database/load_tasks.upsert_problem всегда переписывал текст и updated_at.
+Теперь у задачи есть problems.content_hash - SHA-256 того, что сохранено в БД:
+условия, решения, ответа и списка изображений (путей из markdown условия и
+решения, а путь в хранилище - это хэш файла изображения).
+
+Режим --refresh запрашивает страницы задач условно (If-None-Match /
+If-Modified-Since, ответ 304 берется из кэша), разбирает их, считает хэш и
+пишет в БД только задачи, у которых он изменился. Изображения с известными
+URL берутся из хранилища, поэтому у неизменившихся задач они не скачиваются.
+
+Для строк, загруженных до появления столбца (content_hash IS NULL), хэш
+считается по сохраненному тексту - первый --refresh не переписывает их все.
+
+Использование:
+    from content_hash import ensure_schema, problem_content_hash, stored_hashes, refresh_stats
+
+    ensure_schema(conn)                                  # столбец problems.content_hash
+    hashes = stored_hashes(conn, 'bio', 'oge')           # {problem_id: хэш}
+    if problem_content_hash(condition, solution, answer) != hashes.get(problem_id):
+        save(...)
+    refresh_stats.add(CHANGED)
+    log.info(refresh_stats.summary())
+"""
+
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+
+from run_metrics import run_metrics
+
+# Итог перепроверки задачи
+CHANGED = 'changed'
+UNCHANGED = 'unchanged'
+REMOVED = 'removed'
+
+# ![...](путь) - изображение в markdown (load_html_parser и database/load_tasks)
+MARKDOWN_IMAGE_RE = re.compile(r'!\[[^\]]*\]\(([^)\s]+)\)')
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Добавляет столбец problems.content_hash в БД, созданную до его появления"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(problems)")}
+    if columns and 'content_hash' not in columns:
+        conn.execute("ALTER TABLE problems ADD COLUMN content_hash TEXT")
+        conn.commit()
+
+
+def markdown_images(text: str) -> list:
+    """Пути изображений markdown в порядке появления"""
+    return MARKDOWN_IMAGE_RE.findall(text or '')
+
+
+def problem_content_hash(condition: str, solution: str, answer: str) -> str:
+    """SHA-256 условия, решения, ответа и списка изображений (в том виде, в каком они сохраняются)"""
+    condition = condition or ''
+    solution = solution or ''
+    payload = json.dumps(
+        [condition, solution, answer or '', markdown_images(condition) + markdown_images(solution)],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def stored_hashes(conn: sqlite3.Connection, subject_code: str, exam_type: str = 'oge') -> dict:
+    """{problem_id: хэш} задач предмета в порядке загрузки (NULL - хэш по сохраненному тексту)"""
+    rows = conn.execute("""
+        SELECT p.problem_id, p.content_hash, p.condition_text, p.solution_text, p.answer
+        FROM problems p
+        JOIN subjects s ON s.id = p.subject_id
+        WHERE s.code = ? AND s.exam_type = ?
+        ORDER BY p.id
+    """, (subject_code, exam_type)).fetchall()
+    return {
+        str(problem_id): content_hash or problem_content_hash(condition, solution, answer)
+        for problem_id, content_hash, condition, solution, answer in rows
+    }
+
+
+def stored_hash(conn: sqlite3.Connection, subject_id: int, problem_id) -> str:
+    """Хэш сохраненной задачи или None, если задачи нет в БД"""
+    row = conn.execute(
+        "SELECT content_hash, condition_text, solution_text, answer FROM problems "
+        "WHERE subject_id = ? AND problem_id = ?",
+        (subject_id, str(problem_id))
+    ).fetchone()
+    if row is None:
+        return None
+    return row[0] or problem_content_hash(row[1], row[2], row[3])
+
+
+class RefreshStats:
+    """Итог --refresh: изменившиеся, неизменившиеся и удаленные на сайте задачи (потокобезопасно)"""
+
+    def __init__(self):
+        self.counts = {CHANGED: 0, UNCHANGED: 0, REMOVED: 0}
+        self.removed = []
+        self._lock = threading.Lock()
+
+    def add(self, status: str, problem_id=None):
+        with self._lock:
+            self.counts[status] += 1
+            if status == REMOVED and problem_id is not None:
+                self.removed.append(str(problem_id))
+        run_metrics.count(f'refresh_{status}')
+
+    def summary(self) -> str:
+        line = (f"Обновление: изменено {self.counts[CHANGED]}, без изменений {self.counts[UNCHANGED]}, "
+                f"удалено на сайте {self.counts[REMOVED]}")
+        if self.removed:
+            shown = ', '.join(self.removed[:20]) + (' ...' if len(self.removed) > 20 else '')
+            line += f" ({shown})"
+        return line
+
+
+# Общий итог процесса
+refresh_stats = RefreshStats()
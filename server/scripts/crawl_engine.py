@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Асинхронный движок загрузки задач СДАМ ГИА с ограничением параллелизма
+
+Держит одновременно в работе до N задач (страница + её изображения),
+при этом на каждый хост приходится не больше per_host задач, чтобы не
+перегружать сайт. Сама загрузка задачи остается синхронной (requests +
+BeautifulSoup) и выполняется в пуле потоков, поэтому логика парсинга
+(parse_html_block) используется без изменений.
+
+Использование:
+    engine = CrawlEngine(concurrency=8, per_host=4)
+    results = engine.run([(host, func, args), ...], on_done=progress.advance)
+"""
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from run_log import get_logger
+from run_metrics import run_metrics
+
+log = get_logger(__name__)
+
+
+class CrawlEngine:
+    def __init__(self, concurrency: int = 8, per_host: int = 4):
+        """
+        Args:
+            concurrency: Максимум задач в работе одновременно (всего)
+            per_host: Максимум задач в работе одновременно на один хост
+        """
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, min(per_host, self.concurrency))
+        self._host_semaphores = {}
+        self.errors = 0  # Заданий, завершившихся исключением
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        """Семафор хоста (создается при первом обращении)"""
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.per_host)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    async def _run_job(self, loop, executor, global_semaphore, host: str, func, args, on_done=None):
+        async with global_semaphore:
+            async with self._host_semaphore(host):
+                try:
+                    result = await loop.run_in_executor(executor, func, *args)
+                except Exception as e:
+                    # Исключение задания - сбой (в журнал с трассировкой и в счетчики запуска)
+                    log.exception(f"Ошибка задания ({host}): {e}", extra={'host': host})
+                    self.errors += 1
+                    run_metrics.count('job_errors')
+                    result = False
+                if on_done is not None:
+                    on_done(bool(result))
+                return result
+
+    async def run_async(self, jobs, on_done=None) -> list:
+        """
+        Выполняет задания вида (host, func, args) и возвращает результаты
+        в том же порядке, что и задания; on_done(ok) вызывается по мере завершения заданий
+        """
+        loop = asyncio.get_running_loop()
+        global_semaphore = asyncio.Semaphore(self.concurrency)
+        self._host_semaphores = {}
+        self.errors = 0
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            tasks = [
+                self._run_job(loop, executor, global_semaphore, host, func, args, on_done)
+                for host, func, args in jobs
+            ]
+            return await asyncio.gather(*tasks)
+
+    def run(self, jobs, on_done=None) -> list:
+        """Синхронная обертка над run_async"""
+        jobs = list(jobs)
+        started = time.perf_counter()
+        results = asyncio.run(self.run_async(jobs, on_done))
+        elapsed = time.perf_counter() - started
+
+        done = sum(1 for result in results if result)
+        rate = len(jobs) / elapsed if elapsed > 0 else 0.0
+        log.info(f"Обработано задач: {len(jobs)} (успешно: {done}) за {elapsed:.1f} с "
+                 f"({rate:.2f} задач/с, параллелизм: {self.concurrency}, на хост: {self.per_host})")
+        if self.errors:
+            log.error(f"Заданий завершилось исключением: {self.errors}")
+        return results
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал обхода каталога для возобновления загрузки (--resume)
+
+Если массовая загрузка падала после 3000 задач из 10000, повторный запуск заново
+обходил каталог, запрашивал списки задач всех категорий и страницы задач.
+Журнал хранит в tasksbd.db план и прогресс запуска:
+
+- crawl_runs               - запуски (загрузчик, предмет, тип экзамена, цель);
+- crawl_journal_categories - категории, список задач которых уже получен;
+- crawl_journal            - задачи плана: состояние (pending/done/failed),
+                             число попыток и последняя ошибка.
+
+При --resume берется последний незавершенный запуск того же загрузчика и предмета:
+категории из журнала повторно не запрашиваются, готовые задачи пропускаются,
+а неудачные повторяются, пока число попыток меньше max_attempts.
+
+Использование:
+    journal = CrawlJournal(conn, 'load_tasks_batch', 'bio', 'oge', count=300, resume=True)
+    problem_ids = journal.planned(cat_id)
+    if problem_ids is None:
+        problem_ids = journal.plan(cat_id, fetch_category(cat_id)[:10])
+    for problem_id in problem_ids:
+        if journal.should_load(cat_id, problem_id):
+            journal.record(cat_id, problem_id, load(problem_id))
+    journal.finish()
+"""
+
+import sqlite3
+import time
+import uuid
+
+MAX_ATTEMPTS = 3
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS crawl_runs (
+    run_id TEXT PRIMARY KEY,
+    loader TEXT NOT NULL,                   -- Скрипт загрузки (load_tasks_batch, load_tasks)
+    subject_code TEXT NOT NULL,
+    exam_type TEXT NOT NULL,
+    target_count INTEGER,                   -- Сколько задач нужно загрузить
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    finished_at DATETIME                    -- NULL - запуск не завершен
+);
+
+CREATE TABLE IF NOT EXISTS crawl_journal_categories (
+    run_id TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    problem_count INTEGER NOT NULL,         -- Сколько задач категории вошло в план
+    PRIMARY KEY (run_id, category_id)
+);
+
+CREATE TABLE IF NOT EXISTS crawl_journal (
+    run_id TEXT NOT NULL,
+    subject_code TEXT NOT NULL,
+    category_id TEXT NOT NULL,
+    problem_id TEXT NOT NULL,
+    position INTEGER NOT NULL,              -- Порядок задачи в плане
+    state TEXT NOT NULL DEFAULT 'pending',  -- pending, done, failed
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, category_id, problem_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_crawl_journal_state ON crawl_journal(run_id, state);
+"""
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Создает таблицы журнала обхода"""
+    conn.executescript(SCHEMA_SQL)
+
+
+class CrawlJournal:
+    def __init__(self, conn: sqlite3.Connection, loader: str, subject_code: str, exam_type: str,
+                 count: int = None, resume: bool = False, max_attempts: int = MAX_ATTEMPTS):
+        """
+        Args:
+            conn: Подключение к tasksbd.db
+            loader: Имя загрузчика (разные загрузчики ведут разные журналы)
+            subject_code, exam_type: Предмет запуска
+            count: Целевое количество задач
+            resume: Продолжить последний незавершенный запуск
+            max_attempts: Сколько раз пытаться загрузить задачу
+        """
+        self.conn = conn
+        self.subject_code = subject_code
+        self.max_attempts = max_attempts
+        ensure_schema(conn)
+
+        self.run_id = self._find_unfinished(loader, subject_code, exam_type) if resume else None
+        self.resumed = self.run_id is not None
+        if not self.resumed:
+            self.run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+            conn.execute(
+                "INSERT INTO crawl_runs (run_id, loader, subject_code, exam_type, target_count) VALUES (?, ?, ?, ?, ?)",
+                (self.run_id, loader, subject_code, exam_type, count)
+            )
+            conn.commit()
+
+        self._categories = {}
+        self._states = {}
+        for category_id, in conn.execute(
+                "SELECT category_id FROM crawl_journal_categories WHERE run_id = ?", (self.run_id,)):
+            self._categories[category_id] = []
+        for category_id, problem_id, state, attempts in conn.execute(
+                "SELECT category_id, problem_id, state, attempts FROM crawl_journal WHERE run_id = ? ORDER BY position",
+                (self.run_id,)):
+            self._categories.setdefault(category_id, []).append(problem_id)
+            self._states[(category_id, problem_id)] = (state, attempts)
+
+    def _find_unfinished(self, loader: str, subject_code: str, exam_type: str):
+        row = self.conn.execute(
+            "SELECT run_id FROM crawl_runs WHERE loader = ? AND subject_code = ? AND exam_type = ? "
+            "AND finished_at IS NULL ORDER BY started_at DESC, rowid DESC LIMIT 1",
+            (loader, subject_code, exam_type)
+        ).fetchone()
+        return row[0] if row else None
+
+    # ---------- план ----------
+
+    def planned(self, category_id) -> list:
+        """Задачи категории из журнала (None - категория еще не запрашивалась)"""
+        return self._categories.get(str(category_id))
+
+    def plan(self, category_id, problem_ids: list) -> list:
+        """Записывает в журнал задачи категории, которые нужно загрузить"""
+        category_id = str(category_id)
+        problem_ids = [str(problem_id) for problem_id in problem_ids]
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO crawl_journal (run_id, subject_code, category_id, problem_id, position) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(self.run_id, self.subject_code, category_id, problem_id, position)
+             for position, problem_id in enumerate(problem_ids)]
+        )
+        self.conn.execute(
+            "INSERT OR REPLACE INTO crawl_journal_categories (run_id, category_id, problem_count) VALUES (?, ?, ?)",
+            (self.run_id, category_id, len(problem_ids))
+        )
+        self.conn.commit()
+        self._categories[category_id] = problem_ids
+        for problem_id in problem_ids:
+            self._states.setdefault((category_id, problem_id), ('pending', 0))
+        return problem_ids
+
+    # ---------- прогресс ----------
+
+    def should_load(self, category_id, problem_id) -> bool:
+        """Нужно ли (еще раз) загружать задачу"""
+        state, attempts = self._states.get((str(category_id), str(problem_id)), ('pending', 0))
+        return state != 'done' and attempts < self.max_attempts
+
+    def record(self, category_id, problem_id, ok: bool, error: str = None):
+        """Записывает результат попытки загрузки задачи"""
+        key = (str(category_id), str(problem_id))
+        _, attempts = self._states.get(key, ('pending', 0))
+        state = 'done' if ok else 'failed'
+        if not ok and error is None:
+            error = 'задача не загружена'
+        self.conn.execute(
+            "UPDATE crawl_journal SET state = ?, attempts = attempts + 1, last_error = ?, "
+            "updated_at = CURRENT_TIMESTAMP WHERE run_id = ? AND category_id = ? AND problem_id = ?",
+            (state, None if ok else error, self.run_id, key[0], key[1])
+        )
+        self.conn.commit()
+        self._states[key] = (state, attempts + 1)
+
+    def done_count(self) -> int:
+        return sum(1 for state, _ in self._states.values() if state == 'done')
+
+    def retry_items(self) -> list:
+        """Неудачные задачи, для которых еще остались попытки: [(category_id, problem_id), ...]"""
+        return [key for key, (state, attempts) in self._states.items()
+                if state == 'failed' and attempts < self.max_attempts]
+
+    def finish(self):
+        """Отмечает запуск завершенным (--resume его больше не подхватит)"""
+        self.conn.execute(
+            "UPDATE crawl_runs SET finished_at = CURRENT_TIMESTAMP WHERE run_id = ?", (self.run_id,)
+        )
+        self.conn.commit()
+
+    def summary(self) -> str:
+        states = [state for state, _ in self._states.values()]
+        return (f"Журнал {self.run_id}: готово {states.count('done')}, "
+                f"ошибок {states.count('failed')}, ожидает {states.count('pending')}")
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+Контекст загрузки одной задачи: каждая страница и каждое изображение
+запрашиваются ровно один раз
+
+Хранит разобранный DOM страницы, пути скачанных изображений и результаты
+вызовов SdamGIA API и раздает их условию, решению и API в рамках задачи.
+
+Использование:
+    with ProblemFetchContext(images_dir) as ctx:
+        prob_div = ctx.prob_div(url)              # страница скачивается один раз
+        rel_path, blob_hash = ctx.image(img_url)  # изображение - тоже
+        print(ctx.requests)                       # сетевых запросов по задаче
+
+    print(run_request_stats.summary())            # итог по всем задачам запуска
+"""
+
+import threading
+from pathlib import Path
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+
+from http_cache import cached_get, cached_call
+from image_store import get_image_store
+from html_backend import parse_document, resolve_backend, strainer, SoupNode, PROB_MAINDIV
+from run_log import get_logger
+
+log = get_logger(__name__)
+
+
+class RunRequestStats:
+    """Счетчик сетевых запросов по задачам за весь запуск (потокобезопасный)"""
+
+    def __init__(self):
+        self.problems = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def add(self, requests: int):
+        with self._lock:
+            self.problems += 1
+            self.requests += requests
+
+    def per_problem(self) -> float:
+        return self.requests / self.problems if self.problems else 0.0
+
+    def summary(self) -> str:
+        return (f"Сетевых запросов: {self.requests} на {self.problems} задач "
+                f"({self.per_problem():.1f} на задачу)")
+
+
+# Общий счетчик процесса
+run_request_stats = RunRequestStats()
+
+
+class ProblemFetchContext:
+    def __init__(self, images_dir: Path, stats: RunRequestStats = None, max_age: float = None):
+        """max_age=0 - страницы перепроверяются условным запросом независимо от TTL кэша (--refresh)"""
+        self.images_dir = Path(images_dir)
+        self.run_stats = stats or run_request_stats
+        self.max_age = max_age
+        self.counters = {'requests': 0}
+        self.image_errors = 0
+        self._soups = {}
+        self._pages = {}
+        self._images = {}
+        self._api = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+    @property
+    def requests(self) -> int:
+        return self.counters['requests']
+
+    def finish(self):
+        """Освобождает DOM и учитывает запросы задачи в общем счетчике"""
+        for soup in self._soups.values():
+            if soup is not None:
+                soup.decompose()
+        self._soups.clear()
+        for page in self._pages.values():
+            page.release()
+        self._pages.clear()
+        self.run_stats.add(self.requests)
+
+    def soup(self, url: str):
+        """
+        Разобранная страница (скачивается и парсится один раз).
+        Строится только блок задачи div.prob_maindiv - навигация, шапка и скрипты пропускаются
+        """
+        if url not in self._soups:
+            response = cached_get(url, timeout=10, stats=self.counters, max_age=self.max_age)
+            response.raise_for_status()
+            self._soups[url] = BeautifulSoup(response.content, 'html.parser', parse_only=strainer(PROB_MAINDIV))
+        return self._soups[url]
+
+    def prob_div(self, url: str):
+        """Блок задачи div.prob_maindiv страницы или None"""
+        return self.soup(url).find('div', {'class': 'prob_maindiv'})
+
+    def page(self, url: str, backend: str = None):
+        """Корень страницы (html_backend.Node), разобранной выбранным парсером"""
+        backend = resolve_backend(backend)
+        if backend == 'html.parser':
+            return SoupNode(self.soup(url))
+        key = (url, backend)
+        if key not in self._pages:
+            response = cached_get(url, timeout=10, stats=self.counters, max_age=self.max_age)
+            response.raise_for_status()
+            self._pages[key] = parse_document(response.content, backend, only=PROB_MAINDIV)
+        return self._pages[key]
+
+    def prob_node(self, url: str, backend: str = None):
+        """Блок задачи div.prob_maindiv (html_backend.Node) или None"""
+        return self.page(url, backend).find('div', 'prob_maindiv')
+
+    def image(self, url: str, base_url: str = None):
+        """
+        Скачивает изображение в хранилище один раз за задачу
+        (и вообще не скачивает, если URL уже есть в хранилище)
+
+        Returns:
+            (путь относительно папки изображений, хэш файла)
+        """
+        if base_url and not url.startswith('http'):
+            url = urljoin(base_url, url)
+        if url not in self._images:
+            store = get_image_store(self.images_dir)
+            known = store.lookup(url)
+            if known is None:
+                self.counters['requests'] += 1
+                known = store.fetch(url)
+            self._images[url] = known
+        return self._images[url]
+
+    def save_image(self, url: str, subject_code: str, problem_id: str, img_type: str, index: int, images_dir: Path) -> str:
+        """Совместимая с load_html_parser.save_image обертка над image()"""
+        try:
+            rel_path, _ = self.image(url, base_url=f"https://{subject_code}-ege.sdamgia.ru/")
+            return rel_path
+        except Exception as e:
+            self.image_errors += 1
+            log.warning(f"Ошибка скачивания изображения {url}: {e}", extra={'problem_id': problem_id})
+            return None
+
+    def api(self, url_class: str, host: str, func, *args):
+        """Результат вызова SdamGIA API (один раз за задачу, с дисковым кэшем)"""
+        key = (func.__name__,) + args
+        if key not in self._api:
+            self._api[key] = cached_call(url_class, host, func, *args, stats=self.counters)
+        return self._api[key]
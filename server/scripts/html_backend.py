@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Сменный HTML парсер для разбора страниц задач СДАМ ГИА
+
+parse_html_block и извлечение ответа, номера задания и аналогов работали прямо
+с деревом BeautifulSoup на чистом Python (html.parser). Здесь они работают через
+тонкую обертку Node с небольшим подмножеством API BeautifulSoup, а само дерево
+строит выбранный парсер:
+
+- html.parser - BeautifulSoup + встроенный парсер Python (по умолчанию);
+- lxml        - BeautifulSoup + lxml (pip install lxml);
+- selectolax  - парсер Lexbor на C без BeautifulSoup (pip install selectolax).
+
+Выбор парсера: аргумент backend или переменная окружения SDAMGIA_HTML_BACKEND.
+Совпадение результата с html.parser проверяет bench_html_backends.py.
+Lexbor сохраняет пробельные текстовые узлы как есть, а BeautifulSoup заменяет
+их на '\n' или ' ' - LexborNode делает то же самое (кроме <pre> и <textarea>).
+
+Страница задачи - это в основном навигация, шапка и скрипты, а нужен только
+div.prob_maindiv. parse_document(..., only=PROB_MAINDIV) строит только это
+поддерево (SoupStrainer для BeautifulSoup). Lexbor строит дерево целиком, но
+на C и без объектов Python для каждого узла.
+
+Использование:
+    root = parse_document(response.content, 'selectolax')
+    prob_div = root.find('div', 'prob_maindiv')
+    for block in prob_div.find_all('div', 'pbody'):
+        ...
+    root.release()
+"""
+
+import os
+
+BACKENDS = ('html.parser', 'lxml', 'selectolax')
+DEFAULT_BACKEND = os.environ.get('SDAMGIA_HTML_BACKEND', 'html.parser')
+
+# Блок задачи на странице СДАМ ГИА (тег, класс)
+PROB_MAINDIV = ('div', 'prob_maindiv')
+
+
+def resolve_backend(backend: str = None) -> str:
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Неизвестный HTML парсер: {backend} (доступны: {', '.join(BACKENDS)})")
+    return backend
+
+
+def available_backends() -> list:
+    """Парсеры, библиотеки которых установлены"""
+    result = []
+    for backend in BACKENDS:
+        try:
+            if backend == 'selectolax':
+                import selectolax.lexbor  # noqa: F401
+            else:
+                import bs4  # noqa: F401
+                if backend == 'lxml':
+                    import lxml  # noqa: F401
+        except ImportError:
+            continue
+        result.append(backend)
+    return result
+
+
+# События Node.walk: (событие, значение)
+TEXT = 'text'      # текстовый узел (или комментарий): строка
+IMG = 'img'        # <img>: src ('' - нет src)
+BR = 'br'          # <br>
+OPEN = 'open'      # начало блочного элемента (block_tags)
+CLOSE = 'close'    # конец блочного элемента
+SKIP = 'skip'      # элемент с классом из skip_classes: Node (поддерево не обходится)
+
+
+# BeautifulSoup не сжимает пробелы внутри этих тегов
+PRESERVE_WHITESPACE_TAGS = frozenset(('pre', 'textarea'))
+_ASCII_SPACES = ' \n\t\x0c\r'
+
+
+def _soup_whitespace(text: str) -> str:
+    """Строка только из пробелов - как у BeautifulSoup: '\\n', если есть перевод строки, иначе ' '"""
+    if text and not text.strip(_ASCII_SPACES):
+        return '\n' if '\n' in text else ' '
+    return text
+
+
+def _as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+# ---------- BeautifulSoup (html.parser, lxml) ----------
+
+class SoupNode:
+    """Узел дерева BeautifulSoup"""
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        self._node = node
+
+    @property
+    def name(self):
+        """Имя тега (None - текстовый узел)"""
+        return self._node.name
+
+    @property
+    def text(self) -> str:
+        return str(self._node)
+
+    @property
+    def classes(self) -> list:
+        if self._node.name is None:
+            return []
+        return self._node.get('class') or []
+
+    def get(self, attr: str, default=None):
+        if self._node.name is None:
+            return default
+        return self._node.get(attr, default)
+
+    @property
+    def children(self):
+        for child in self._node.children:
+            yield SoupNode(child)
+
+    def find(self, tag, class_: str = None):
+        found = self._node.find(tag, class_=class_) if class_ else self._node.find(tag)
+        return SoupNode(found) if found is not None else None
+
+    def find_all(self, tags, class_=None) -> list:
+        found = self._node.find_all(tags, class_=class_) if class_ else self._node.find_all(tags)
+        return [SoupNode(node) for node in found]
+
+    def get_text(self) -> str:
+        return self._node.get_text()
+
+    def remove_all(self, tags, classes):
+        """Удаляет из дерева элементы с любым из тегов и любым из классов"""
+        for element in self._node.find_all(tags, class_=classes):
+            element.decompose()
+
+    def decompose(self):
+        """Удаляет узел из дерева"""
+        self._node.decompose()
+
+    def walk(self, skip_classes, block_tags):
+        """Обход потомков в порядке документа без рекурсии - события TEXT, IMG, BR, OPEN, CLOSE, SKIP"""
+        stack = [(iter(self._node.contents), False)]
+        while stack:
+            children, is_block = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                if is_block:
+                    yield CLOSE, None
+                continue
+            name = node.name
+            if name is None:
+                yield TEXT, str(node)
+                continue
+            classes = node.get('class')
+            if classes and not skip_classes.isdisjoint(classes):
+                yield SKIP, SoupNode(node)
+            elif name == 'img':
+                yield IMG, node.get('src', '')
+            elif name == 'br':
+                yield BR, None
+            elif name in block_tags:
+                yield OPEN, None
+                stack.append((iter(node.contents), True))
+            else:
+                stack.append((iter(node.contents), False))
+
+    def release(self):
+        self._node.decompose()
+
+
+# ---------- selectolax (Lexbor) ----------
+
+class LexborNode:
+    """Узел дерева selectolax.lexbor"""
+    __slots__ = ('_node',)
+
+    def __init__(self, node):
+        self._node = node
+
+    @property
+    def name(self):
+        tag = self._node.tag
+        return None if tag in ('-text', '-comment') else tag
+
+    @property
+    def text(self) -> str:
+        if self._node.tag == '-comment':
+            # comment_content обрезает пробелы, BeautifulSoup их сохраняет
+            html = self._node.html or ''
+            text = html[4:-3] if html.startswith('<!--') and html.endswith('-->') else html
+        else:
+            text = self._node.text(deep=False)
+        return text if self._preserves_whitespace() else _soup_whitespace(text)
+
+    def _preserves_whitespace(self) -> bool:
+        parent = self._node.parent
+        while parent is not None:
+            if parent.tag in PRESERVE_WHITESPACE_TAGS:
+                return True
+            parent = parent.parent
+        return False
+
+    @property
+    def classes(self) -> list:
+        if self.name is None:
+            return []
+        value = self._node.attributes.get('class')
+        return value.split() if value else []
+
+    def get(self, attr: str, default=None):
+        if self.name is None:
+            return default
+        value = self._node.attributes.get(attr, default)
+        return default if value is None else value
+
+    @property
+    def children(self):
+        for child in self._node.iter(include_text=True):
+            yield LexborNode(child)
+
+    @staticmethod
+    def _selector(tags, classes) -> str:
+        tags = _as_list(tags)
+        classes = _as_list(classes)
+        if not classes:
+            return ', '.join(tags)
+        return ', '.join(f'{tag}.{cls}' for tag in tags for cls in classes)
+
+    def _matches(self, tags, class_):
+        # css() у selectolax проверяет и сам узел - BeautifulSoup ищет только среди потомков
+        own_id = self._node.mem_id
+        return [node for node in self._node.css(self._selector(tags, class_)) if node.mem_id != own_id]
+
+    def find(self, tag, class_: str = None):
+        found = self._matches(tag, class_)
+        return LexborNode(found[0]) if found else None
+
+    def find_all(self, tags, class_=None) -> list:
+        return [LexborNode(node) for node in self._matches(tags, class_)]
+
+    def get_text(self) -> str:
+        """Текст потомков (без комментариев) с пробельными узлами, сжатыми как у BeautifulSoup"""
+        parts = []
+        stack = [(self._node.iter(include_text=True), self._preserves_whitespace()
+                  or self._node.tag in PRESERVE_WHITESPACE_TAGS)]
+        while stack:
+            children, preserve = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+            elif node.tag == '-text':
+                text = node.text(deep=False)
+                parts.append(text if preserve else _soup_whitespace(text))
+            elif node.tag != '-comment':
+                stack.append((node.iter(include_text=True), preserve or node.tag in PRESERVE_WHITESPACE_TAGS))
+        return ''.join(parts)
+
+    def remove_all(self, tags, classes):
+        """Удаляет из дерева элементы с любым из тегов и любым из классов"""
+        removed = set()
+        for node in self._matches(tags, classes):
+            # Вложенный элемент уже удален вместе с родителем
+            parent, inside_removed = node.parent, False
+            while parent is not None:
+                if parent.mem_id in removed:
+                    inside_removed = True
+                    break
+                parent = parent.parent
+            if not inside_removed:
+                removed.add(node.mem_id)
+                node.decompose()
+
+    def decompose(self):
+        """Удаляет узел из дерева"""
+        self._node.decompose()
+
+    def walk(self, skip_classes, block_tags):
+        """Обход потомков в порядке документа без рекурсии - события TEXT, IMG, BR, OPEN, CLOSE, SKIP"""
+        preserve_root = self._preserves_whitespace() or self._node.tag in PRESERVE_WHITESPACE_TAGS
+        stack = [(self._node.iter(include_text=True), False, preserve_root)]
+        while stack:
+            children, is_block, preserve = stack[-1]
+            node = next(children, None)
+            if node is None:
+                stack.pop()
+                if is_block:
+                    yield CLOSE, None
+                continue
+            tag = node.tag
+            if tag == '-text':
+                text = node.text(deep=False)
+                yield TEXT, text if preserve else _soup_whitespace(text)
+                continue
+            if tag == '-comment':
+                yield TEXT, LexborNode(node).text
+                continue
+            preserve = preserve or tag in PRESERVE_WHITESPACE_TAGS
+            attributes = node.attributes
+            classes = attributes.get('class')
+            if classes and not skip_classes.isdisjoint(classes.split()):
+                yield SKIP, LexborNode(node)
+            elif tag == 'img':
+                src = attributes.get('src', '')
+                yield IMG, '' if src is None else src
+            elif tag == 'br':
+                yield BR, None
+            elif tag in block_tags:
+                yield OPEN, None
+                stack.append((node.iter(include_text=True), True, preserve))
+            else:
+                stack.append((node.iter(include_text=True), False, preserve))
+
+    def release(self):
+        # Дерево Lexbor освобождается вместе с парсером, когда на него не остается ссылок
+        pass
+
+
+def strainer(only):
+    """SoupStrainer для BeautifulSoup: разбирать только элементы (тег, класс)"""
+    from bs4 import SoupStrainer
+    tag, class_ = only
+    return SoupStrainer(tag, class_=class_)
+
+
+def parse_document(content, backend: str = None, only=None):
+    """
+    Разбирает страницу выбранным парсером и возвращает корень дерева
+
+    only - (тег, класс): построить только поддеревья этих элементов (например, PROB_MAINDIV)
+    """
+    backend = resolve_backend(backend)
+    if backend == 'selectolax':
+        from selectolax.lexbor import LexborHTMLParser
+        if isinstance(content, bytes):
+            content = content.decode('utf-8', errors='replace')
+        return LexborNode(LexborHTMLParser(content).root)
+
+    from bs4 import BeautifulSoup
+    return SoupNode(BeautifulSoup(content, backend, parse_only=strainer(only) if only else None))
+
+
+def as_node(element):
+    """Оборачивает узел BeautifulSoup в SoupNode (узлы Node возвращаются как есть)"""
+    if element is None or isinstance(element, (SoupNode, LexborNode)):
+        return element
+    return SoupNode(element)
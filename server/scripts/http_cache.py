@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""
+Дисковый кэш HTTP ответов СДАМ ГИА с условной перепроверкой (ETag / Last-Modified)
+
+Ключ кэша - URL. Для каждого ответа хранится тело и метаданные (ETag,
+Last-Modified, время загрузки). Пока запись "свежая" (моложе TTL своего
+класса URL), сеть не используется вовсе. После истечения TTL делается
+условный запрос (If-None-Match / If-Modified-Since); ответ 304 продлевает
+запись без повторной загрузки тела. max_age=0 (режим --refresh) перепроверяет
+запись условным запросом независимо от TTL.
+
+Если сайт отвечает ошибкой, отдается устаревшая копия - кроме 404/410: задача
+удалена, запись кэша удаляется, а raise_for_status() бросает GoneError.
+
+Результаты вызовов SdamGIA API (каталог, список задач категории, задача)
+кэшируются так же, но без перепроверки - только по TTL.
+
+Одновременные одинаковые запросы из разных потоков схлопываются: в сеть
+идет один запрос, остальные ждут и получают его результат. Блокировки берутся
+из постоянного набора (LOCK_STRIPES, по хэшу URL), поэтому их число не растет
+с числом загруженных URL.
+
+Если запрос не удался (ошибка соединения, 429/5xx после всех повторов), а в
+кэше есть устаревшая копия - отдается она.
+
+Использование:
+    from http_cache import cached_get, cached_call
+
+    response = cached_get(url, timeout=10)
+    catalog = cached_call('catalog', api_host('bio'), sdamgia.get_catalog, 'bio')
+
+Настройки:
+    SDAMGIA_CACHE_DIR - папка кэша (по умолчанию server/.http_cache, а при
+                        SDAMGIA_BASE_URL - отдельная папка стенда .http_cache/mock)
+    SDAMGIA_CACHE=0   - отключить кэш
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from http_client import http_get, BASE_URL, HTTP_ERRORS
+from rate_limiter import rate_limiter
+from run_metrics import run_metrics
+
+# Ответы локального стенда не должны попасть в кэш настоящего сайта (ключ кэша - исходный URL)
+_DEFAULT_CACHE_DIR = Path(__file__).parent.parent / '.http_cache' / ('mock' if BASE_URL else '')
+CACHE_DIR = Path(os.environ.get('SDAMGIA_CACHE_DIR', _DEFAULT_CACHE_DIR))
+CACHE_ENABLED = os.environ.get('SDAMGIA_CACHE', '1') != '0'
+
+# Блокировок на запись кэша (URL с одинаковым хэшем ждут друг друга)
+LOCK_STRIPES = 64
+
+DAY = 24 * 60 * 60
+
+# Время жизни записи по классу URL (секунды)
+TTL = {
+    'catalog': 7 * DAY,
+    'category': 1 * DAY,
+    'problem': 30 * DAY,
+    'image': 365 * DAY,
+    'page': 1 * DAY,
+}
+
+IMAGE_EXTENSIONS = ('.svg', '.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+# Страница удалена с сайта: устаревшая копия не отдается
+GONE_STATUSES = (404, 410)
+
+
+def classify_url(url: str) -> str:
+    """Определяет класс URL для выбора TTL"""
+    path = url.split('?')[0].lower()
+    if '/problem' in path and 'id=' in url:
+        return 'problem'
+    if path.endswith(IMAGE_EXTENSIONS) or '/get_file' in path or '/formula/' in path:
+        return 'image'
+    if '/prob_catalog' in path:
+        return 'catalog'
+    if 'theme=' in url or 'category' in url:
+        return 'category'
+    return 'page'
+
+
+class GoneError(RuntimeError):
+    """Страница удалена с сайта (HTTP 404/410)"""
+
+
+class CachedResponse:
+    """Ответ из кэша или сети с тем же интерфейсом, что у requests.Response"""
+
+    def __init__(self, url: str, status_code: int, headers: dict, content: bytes, from_cache: bool):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = from_cache
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code in GONE_STATUSES:
+            raise GoneError(f"HTTP {self.status_code} для {self.url}")
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code} для {self.url}")
+
+
+class HttpCache:
+    def __init__(self, cache_dir: Path = CACHE_DIR, enabled: bool = CACHE_ENABLED):
+        self.cache_dir = Path(cache_dir)
+        self.enabled = enabled
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._stats_lock = threading.Lock()
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0}
+
+    def _count(self, stats: dict, name: str):
+        with self._stats_lock:
+            stats[name] = stats.get(name, 0) + 1
+
+    # ---------- хранилище ----------
+
+    def _paths(self, key: str):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        entry_dir = self.cache_dir / digest[:2]
+        return entry_dir / f"{digest}.body", entry_dir / f"{digest}.meta.json"
+
+    def _read(self, key: str):
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                body = f.read()
+            return meta, body
+        except (OSError, ValueError):
+            return None, None
+
+    def _write(self, key: str, meta: dict, body: bytes = None):
+        body_path, meta_path = self._paths(key)
+        body_path.parent.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        if body is not None:
+            tmp = body_path.with_name(body_path.name + suffix)
+            with open(tmp, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, body_path)
+        tmp = meta_path.with_name(meta_path.name + suffix)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp, meta_path)
+
+    def _remove(self, key: str):
+        for path in self._paths(key):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def _lock_for(self, key: str) -> threading.Lock:
+        return self._locks[hash(key) % LOCK_STRIPES]
+
+    @staticmethod
+    def _is_fresh(meta: dict, ttl: float) -> bool:
+        return time.time() - meta.get('fetched_at', 0) < ttl
+
+    def _has_fresh(self, key: str, url_class: str = None, max_age: float = None) -> bool:
+        """Есть ли свежая запись (без чтения тела)"""
+        if max_age == 0:
+            return False
+        _, meta_path = self._paths(key)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return self._is_fresh(meta, TTL[url_class or classify_url(key)] if max_age is None else max_age)
+
+    # ---------- HTTP ----------
+
+    def get(self, url: str, timeout: float = 10, url_class: str = None, stats: dict = None,
+            max_age: float = None) -> CachedResponse:
+        """
+        GET с кэшем: свежая запись -> диск, устаревшая -> условный запрос.
+        max_age - срок свежести вместо TTL класса URL (0 - всегда перепроверять).
+        Если передан stats, в stats['requests'] считаются запросы, ушедшие в сеть.
+        """
+        if stats is not None and (not self.enabled or not self._has_fresh(url, url_class, max_age)):
+            self._count(stats, 'requests')
+
+        if not self.enabled:
+            response = http_get(url, timeout=timeout)
+            return CachedResponse(url, response.status_code, dict(response.headers), response.content, False)
+
+        ttl = TTL[url_class or classify_url(url)] if max_age is None else max_age
+
+        # Один сетевой запрос на URL, остальные потоки ждут его результат
+        with self._lock_for(url):
+            meta, body = self._read(url)
+            if meta and self._is_fresh(meta, ttl):
+                self._count(self.stats, 'hits')
+                run_metrics.count('cache_hits')
+                return CachedResponse(url, meta['status'], meta.get('headers', {}), body, True)
+
+            headers = {}
+            if meta:
+                if meta.get('etag'):
+                    headers['If-None-Match'] = meta['etag']
+                if meta.get('last_modified'):
+                    headers['If-Modified-Since'] = meta['last_modified']
+
+            try:
+                response = http_get(url, timeout=timeout, headers=headers or None)
+            except HTTP_ERRORS:
+                if not meta:
+                    raise
+                # Сайт недоступен (соединение, 429/5xx после повторов) - отдаем устаревшую копию
+                self._count(self.stats, 'hits')
+                run_metrics.count('cache_stale')
+                return CachedResponse(url, meta['status'], meta.get('headers', {}), body, True)
+
+            if response.status_code == 304 and meta:
+                meta['fetched_at'] = time.time()
+                self._write(url, meta)
+                self._count(self.stats, 'revalidated')
+                run_metrics.count('cache_revalidated')
+                return CachedResponse(url, meta['status'], meta.get('headers', {}), body, True)
+
+            if response.status_code in GONE_STATUSES and meta:
+                # Страница удалена - устаревшая копия больше не нужна
+                self._remove(url)
+            elif response.status_code >= 400 and meta:
+                # Сайт недоступен - отдаем устаревшую копию
+                self._count(self.stats, 'hits')
+                run_metrics.count('cache_stale')
+                return CachedResponse(url, meta['status'], meta.get('headers', {}), body, True)
+
+            self._count(self.stats, 'misses')
+            run_metrics.count('cache_misses')
+            content = response.content
+            response_headers = {
+                'content-type': response.headers.get('content-type', ''),
+            }
+            if response.status_code == 200:
+                self._write(url, {
+                    'url': url,
+                    'status': response.status_code,
+                    'headers': response_headers,
+                    'etag': response.headers.get('etag'),
+                    'last_modified': response.headers.get('last-modified'),
+                    'fetched_at': time.time(),
+                }, content)
+            return CachedResponse(url, response.status_code, response_headers, content, False)
+
+    # ---------- SdamGIA API ----------
+
+    def call(self, url_class: str, host: str, func, *args, stats: dict = None, max_age: float = None):
+        """
+        Кэширует результат вызова SdamGIA API (JSON-сериализуемый) по TTL.
+        Запрос к хосту проходит через ограничитель частоты только при промахе.
+        max_age=0 - вызвать API заново (условных запросов у API нет)
+        """
+        key = f"api://{host}/{func.__name__}/" + '/'.join(str(arg) for arg in args)
+
+        if stats is not None and (not self.enabled or not self._has_fresh(key, url_class, max_age)):
+            self._count(stats, 'requests')
+
+        if not self.enabled:
+            return self._call_api(host, func, args)
+
+        with self._lock_for(key):
+            meta, body = self._read(key)
+            if meta and self._is_fresh(meta, TTL[url_class] if max_age is None else max_age):
+                self._count(self.stats, 'hits')
+                run_metrics.count('cache_hits')
+                return json.loads(body.decode('utf-8'))
+
+            self._count(self.stats, 'misses')
+            run_metrics.count('cache_misses')
+            result = self._call_api(host, func, args)
+            if result:
+                self._write(key, {'url': key, 'status': 200, 'fetched_at': time.time()},
+                            json.dumps(result, ensure_ascii=False).encode('utf-8'))
+            return result
+
+    @staticmethod
+    def _call_api(host: str, func, args):
+        """Вызов SdamGIA API (запросы идут мимо http_get, поэтому учитываются здесь)"""
+        rate_limiter.wait(host)
+        with run_metrics.stage('api'):
+            result = func(*args)
+        run_metrics.count('api_calls')
+        return result
+
+
+# Общий кэш процесса
+http_cache = HttpCache()
+
+
+def cached_get(url: str, timeout: float = 10, url_class: str = None, stats: dict = None,
+               max_age: float = None) -> CachedResponse:
+    return http_cache.get(url, timeout=timeout, url_class=url_class, stats=stats, max_age=max_age)
+
+
+def cached_call(url_class: str, host: str, func, *args, stats: dict = None, max_age: float = None):
+    return http_cache.call(url_class, host, func, *args, stats=stats, max_age=max_age)
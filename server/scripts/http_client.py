@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Общий HTTP клиент для всех загрузчиков и скачивания изображений
+
+Одна сессия на процесс с пулом соединений по хостам и keep-alive, поэтому
+TCP+TLS рукопожатие делается один раз на хост, а не на каждую SVG формулу.
+Ответы запрашиваются в сжатом виде (gzip/deflate, br - если установлен brotli).
+Если установлен httpx[http2] (httpx и h2) и задана переменная SDAMGIA_HTTP2=1,
+запросы к одному хосту мультиплексируются через HTTP/2, иначе используется
+requests с предупреждением в логе.
+
+Перед каждым запросом вызывается общий ограничитель частоты (rate_limiter),
+время, байты и повторы запроса учитываются в run_metrics (стадия http).
+Ответы 429/5xx повторяются одинаково для обоих клиентов (RETRY_*, с учетом
+Retry-After): у requests - Retry urllib3, у httpx - в http_get, так как
+транспорт httpx повторяет только ошибки соединения.
+
+SDAMGIA_BASE_URL=http://127.0.0.1:8765 направляет запросы к *.sdamgia.ru на
+локальный стенд (sdamgia_mock_server.py): https://bio-ege.sdamgia.ru/problem?id=1
+уходит на http://127.0.0.1:8765/bio-ege.sdamgia.ru/problem?id=1. Ключи кэша,
+лимиты и URL в БД остаются исходными. Объекты SdamGIA API направляет туда же
+use_base_url(SdamGIA()).
+
+Использование:
+    from http_client import http_get
+
+    response = http_get(url, timeout=10)
+    response.raise_for_status()
+    content = response.content
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from rate_limiter import rate_limiter
+from run_log import get_logger
+from run_metrics import run_metrics, count_retries
+
+log = get_logger(__name__)
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    ACCEPT_ENCODING = 'gzip, deflate'
+
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = HTTPX_AVAILABLE
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Ошибки запроса обоих клиентов (соединение, таймаут, исчерпанные повторы)
+HTTP_ERRORS = (requests.RequestException, httpx.HTTPError) if HTTPX_AVAILABLE else (requests.RequestException,)
+
+POOL_SIZE = int(os.environ.get('SDAMGIA_POOL_SIZE', '32'))
+USE_HTTP2 = os.environ.get('SDAMGIA_HTTP2', '0') == '1' and HTTP2_AVAILABLE
+if os.environ.get('SDAMGIA_HTTP2', '0') == '1' and not HTTP2_AVAILABLE:
+    log.warning("SDAMGIA_HTTP2=1, но httpx[http2] не установлен (нужны httpx и h2) - используется requests")
+BASE_URL = os.environ.get('SDAMGIA_BASE_URL', '').rstrip('/')
+
+# Повторы запроса (пауза RETRY_BACKOFF * 2^n или Retry-After)
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; edumvp-loader/1.0)',
+    'Accept-Encoding': ACCEPT_ENCODING,
+    'Connection': 'keep-alive',
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _create_requests_session() -> requests.Session:
+    """Сессия requests с пулом соединений и повторами на 5xx/429"""
+    session = requests.Session()
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=('GET', 'HEAD'),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update(DEFAULT_HEADERS)
+    return session
+
+
+def _create_httpx_client():
+    """
+    Клиент httpx с HTTP/2 (один мультиплексированный канал на хост). Если
+    передан transport, параметры пула клиента не используются - они задаются
+    транспорту; retries транспорта - только повторы соединения
+    """
+    return httpx.Client(
+        headers=DEFAULT_HEADERS,
+        follow_redirects=True,
+        transport=httpx.HTTPTransport(
+            http2=True,
+            retries=RETRY_TOTAL,
+            limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+        ),
+    )
+
+
+def _retry_after(response):
+    """Пауза из заголовка Retry-After в секундах (None - заголовка нет или это дата)"""
+    try:
+        return max(0.0, float(response.headers.get('retry-after', '')))
+    except ValueError:
+        return None
+
+
+def _httpx_get(client, url: str, timeout: float, headers: dict):
+    """GET через httpx с повторами 429/5xx как у Retry в сессии requests. Возвращает (ответ, число повторов)"""
+    retries = 0
+    while True:
+        response = client.get(rewrite_url(url), timeout=timeout, headers=headers)
+        if response.status_code not in RETRY_STATUSES or retries >= RETRY_TOTAL:
+            return response, retries
+        delay = _retry_after(response)
+        response.close()
+        time.sleep(RETRY_BACKOFF * 2 ** retries if delay is None else delay)
+        retries += 1
+        rate_limiter.wait(url)
+
+
+def get_session():
+    """Возвращает общую сессию процесса (создается при первом обращении)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _create_httpx_client() if USE_HTTP2 else _create_requests_session()
+    return _session
+
+
+def rewrite_url(url: str) -> str:
+    """URL на стенде SDAMGIA_BASE_URL для хостов *.sdamgia.ru (без переменной - URL как есть)"""
+    if not BASE_URL:
+        return url
+    parts = urlsplit(url)
+    if not parts.netloc.endswith('sdamgia.ru'):
+        return url
+    return f"{BASE_URL}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else '')
+
+
+def use_base_url(sdamgia):
+    """Направляет запросы объекта SdamGIA API на SDAMGIA_BASE_URL (если переменная задана)"""
+    base_urls = getattr(sdamgia, '_SUBJECT_BASE_URL', None)
+    if BASE_URL and isinstance(base_urls, dict):
+        sdamgia._SUBJECT_BASE_URL = {subject: rewrite_url(url) for subject, url in base_urls.items()}
+    return sdamgia
+
+
+def http_get(url: str, timeout: float = 10, headers: dict = None):
+    """
+    GET запрос через общую сессию с учетом лимита частоты запросов к хосту
+
+    Returns:
+        Объект ответа (requests.Response или httpx.Response) - у обоих есть
+        status_code, headers, content и raise_for_status()
+    """
+    rate_limiter.wait(url)
+    session = get_session()
+    with run_metrics.stage('http'):
+        if USE_HTTP2:
+            response, retries = _httpx_get(session, url, timeout, headers)
+        else:
+            response = session.get(rewrite_url(url), timeout=timeout, headers=headers)
+            retries = count_retries(response)
+    run_metrics.count('requests')
+    run_metrics.count('retries', retries)
+    run_metrics.add_bytes('http', len(response.content))
+    return response
+
+
+def close_session():
+    """Закрывает соединения пула (вызывается в конце работы скрипта)"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
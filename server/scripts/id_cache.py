@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Кэш ID предметов, тем и категорий на время загрузки
+
+save_problem/import_problem на каждую задачу вызывали get_or_create_subject и
+get_or_create_topic, а load_catalog на каждый узел каталога делал SELECT и UPDATE.
+IdCache один раз читает таблицы subjects, topics и categories (по одному запросу
+на таблицу) и дальше отвечает из памяти:
+
+    (code, exam_type)          -> subjects.id
+    (subject_id, topic_number) -> topics.id
+    (topic_id, category_id)    -> categories.id
+
+Кэш сквозной (write-through): новые строки сначала пишутся в БД, затем в кэш.
+Существующая строка обновляется только если её название действительно изменилось.
+
+После отката транзакции кэш может содержать ID несуществующих строк -
+вызовите invalidate(), и при следующем обращении кэш перечитается из БД.
+
+Использование:
+    ids = IdCache(conn)
+    subject_id = ids.subject('bio', 'oge', 'Биология')
+    topic_id = ids.topic(subject_id, '1', 'Задание 1', '1')
+    category_id = ids.category(topic_id, '123', 'Клетка', update=True)
+"""
+
+import sqlite3
+
+
+class IdCache:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._subjects = {}
+        self._topics = {}
+        self._categories = {}
+        self._warm = False
+        self.stats = {'hits': 0, 'inserts': 0, 'updates': 0}
+
+    def warm(self):
+        """Читает справочные таблицы целиком (по одному запросу на таблицу)"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT id, code, exam_type FROM subjects")
+        self._subjects = {(code, exam_type): row_id for row_id, code, exam_type in cursor.fetchall()}
+        cursor.execute("SELECT id, subject_id, topic_number, topic_name, topic_line FROM topics")
+        self._topics = {(subject_id, str(number)): (row_id, name, line)
+                        for row_id, subject_id, number, name, line in cursor.fetchall()}
+        cursor.execute("SELECT id, topic_id, category_id, category_name FROM categories")
+        self._categories = {(topic_id, str(category_id)): (row_id, name)
+                            for row_id, topic_id, category_id, name in cursor.fetchall()}
+        self._warm = True
+
+    def invalidate(self):
+        """Сбрасывает кэш (например, после rollback)"""
+        self._warm = False
+
+    def _ensure_warm(self):
+        if not self._warm:
+            self.warm()
+
+    def subject(self, code: str, exam_type: str, name: str) -> int:
+        """ID предмета; создает предмет, если его нет"""
+        self._ensure_warm()
+        key = (code, exam_type)
+        if key in self._subjects:
+            self.stats['hits'] += 1
+            return self._subjects[key]
+
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "INSERT INTO subjects (code, name, exam_type) VALUES (?, ?, ?)",
+            (code, name, exam_type)
+        )
+        self.conn.commit()
+        self.stats['inserts'] += 1
+        self._subjects[key] = cursor.lastrowid
+        return cursor.lastrowid
+
+    def topic(self, subject_id: int, topic_number: str, topic_name: str, topic_line: str = None,
+              update: bool = False) -> int:
+        """ID темы; создает тему, если её нет (update=True - обновляет изменившееся название)"""
+        self._ensure_warm()
+        key = (subject_id, str(topic_number))
+        cached = self._topics.get(key)
+        cursor = self.conn.cursor()
+
+        if cached:
+            row_id, name, line = cached
+            if update and (name, line) != (topic_name, topic_line):
+                cursor.execute(
+                    "UPDATE topics SET topic_name = ?, topic_line = ? WHERE id = ?",
+                    (topic_name, topic_line, row_id)
+                )
+                self.conn.commit()
+                self.stats['updates'] += 1
+                self._topics[key] = (row_id, topic_name, topic_line)
+            else:
+                self.stats['hits'] += 1
+            return row_id
+
+        cursor.execute(
+            "INSERT INTO topics (subject_id, topic_number, topic_name, topic_line) VALUES (?, ?, ?, ?)",
+            (subject_id, topic_number, topic_name, topic_line)
+        )
+        self.conn.commit()
+        self.stats['inserts'] += 1
+        self._topics[key] = (cursor.lastrowid, topic_name, topic_line)
+        return cursor.lastrowid
+
+    def category(self, topic_id: int, category_id: str, category_name: str, update: bool = False) -> int:
+        """ID категории; создает категорию, если её нет (update=True - обновляет изменившееся название)"""
+        self._ensure_warm()
+        key = (topic_id, str(category_id))
+        cached = self._categories.get(key)
+        cursor = self.conn.cursor()
+
+        if cached:
+            row_id, name = cached
+            if update and name != category_name:
+                cursor.execute(
+                    "UPDATE categories SET category_name = ? WHERE id = ?",
+                    (category_name, row_id)
+                )
+                self.conn.commit()
+                self.stats['updates'] += 1
+                self._categories[key] = (row_id, category_name)
+            else:
+                self.stats['hits'] += 1
+            return row_id
+
+        cursor.execute(
+            "INSERT INTO categories (topic_id, category_id, category_name) VALUES (?, ?, ?)",
+            (topic_id, category_id, category_name)
+        )
+        self.conn.commit()
+        self.stats['inserts'] += 1
+        self._categories[key] = (cursor.lastrowid, category_name)
+        return cursor.lastrowid
+
+    def summary(self) -> str:
+        return (f"Кэш ID: попаданий {self.stats['hits']}, "
+                f"новых строк {self.stats['inserts']}, обновлений {self.stats['updates']}")
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилище изображений с адресацией по содержимому (content-addressed store)
+
+Файл называется по SHA-256 содержимого и лежит один раз на все задачи и
+предметы: image_tasksdb/blobs/ab/cd/<hash>.svg. Индекс (URL -> хэш) - в
+image_tasksdb/blobs/index.db, ссылки задач на файлы - в problem_image_blobs
+основной БД. collect_garbage удаляет файлы, на которые больше нет ссылок.
+
+Использование:
+    store = get_image_store(images_dir)
+    rel_path, blob_hash = store.fetch(url)   # blobs/ab/cd/<hash>.svg
+    store.collect_garbage(referenced_blobs(conn))
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+
+from http_client import http_get
+from sqlite_conn import connect
+from run_metrics import run_metrics
+
+BLOBS_DIR_NAME = 'blobs'
+INDEX_DB_NAME = 'index.db'
+
+# Сколько байт начала файла смотреть, чтобы узнать изображение
+MAGIC_BYTES = 100
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}$')
+# Ссылка на файл хранилища в markdown или пути строки изображения: .../blobs/ab/cd/<sha256>.svg
+BLOB_REF_RE = re.compile(r'(blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64})\.\w+)')
+
+INDEX_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS image_blobs (
+    hash TEXT PRIMARY KEY,                  -- SHA-256 содержимого
+    ext TEXT NOT NULL,                      -- Расширение файла (.svg, .png, .jpg, .gif)
+    size INTEGER NOT NULL,                  -- Размер в байтах
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS image_url_blobs (
+    url TEXT PRIMARY KEY,                   -- Оригинальный URL изображения
+    blob_hash TEXT NOT NULL,                -- Хэш файла в хранилище
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (blob_hash) REFERENCES image_blobs(hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_image_url_blobs_hash ON image_url_blobs(blob_hash);
+"""
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS problem_image_blobs (
+    image_table TEXT NOT NULL,              -- problem_condition_images или problem_solution_images
+    image_id INTEGER NOT NULL,              -- id строки в этой таблице
+    blob_hash TEXT NOT NULL,                -- SHA-256 файла в image_tasksdb/blobs
+    PRIMARY KEY (image_table, image_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_problem_image_blobs_hash ON problem_image_blobs(blob_hash);
+
+CREATE TRIGGER IF NOT EXISTS delete_condition_image_blob
+    AFTER DELETE ON problem_condition_images
+    FOR EACH ROW
+BEGIN
+    DELETE FROM problem_image_blobs WHERE image_table = 'problem_condition_images' AND image_id = OLD.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS delete_solution_image_blob
+    AFTER DELETE ON problem_solution_images
+    FOR EACH ROW
+BEGIN
+    DELETE FROM problem_image_blobs WHERE image_table = 'problem_solution_images' AND image_id = OLD.id;
+END;
+"""
+
+
+def detect_extension(content: bytes, content_type: str = '', url: str = '') -> str:
+    """Определяет расширение изображения по содержимому, заголовкам и URL"""
+    head = content[:100]
+    if head[:5] == b'<?xml' or head[:4] == b'<svg' or b'<svg' in head or 'svg' in content_type:
+        return '.svg'
+    if head[:4] == b'\x89PNG':
+        return '.png'
+    if head[:3] == b'\xff\xd8\xff':
+        return '.jpg'
+    if head[:4] == b'GIF8':
+        return '.gif'
+    lowered = url.lower()
+    if 'png' in lowered:
+        return '.png'
+    if 'jpg' in lowered or 'jpeg' in lowered:
+        return '.jpg'
+    return '.svg'  # По умолчанию SVG для СДАМ ГИА
+
+
+def looks_like_image(head: bytes) -> bool:
+    """Начало файла - PNG, JPEG, GIF или SVG (магические байты)"""
+    return (head[:4] == b'\x89PNG' or head[:3] == b'\xff\xd8\xff' or head[:4] == b'GIF8'
+            or head.lstrip()[:5] == b'<?xml' or b'<svg' in head[:MAGIC_BYTES])
+
+
+def verify_file(path: Path, size: int = None, check_hash: bool = True) -> str:
+    """
+    Проверяет файл изображения без сети: есть ли он, совпадает ли размер с
+    индексом (size), похоже ли начало на изображение и - для файлов хранилища,
+    имя которых и есть хэш, - SHA-256 содержимого (check_hash).
+    Возвращает None, если файл в порядке, иначе причину
+    """
+    try:
+        file_size = os.stat(path).st_size
+    except OSError:
+        return 'нет файла'
+    if file_size == 0 or (size is not None and file_size != size):
+        return 'размер'
+    with open(path, 'rb') as f:
+        head = f.read(MAGIC_BYTES)
+        if not looks_like_image(head):
+            return 'не изображение'
+        blob_hash = Path(path).stem
+        if check_hash and BLOB_NAME_RE.match(blob_hash):
+            digest = hashlib.sha256(head)
+            for chunk in iter(lambda: f.read(1 << 16), b''):
+                digest.update(chunk)
+            if digest.hexdigest() != blob_hash:
+                return 'хэш'
+    return None
+
+
+def blob_relative_path(blob_hash: str, ext: str) -> str:
+    """Путь файла относительно папки изображений (с разбиением по 2 уровням)"""
+    return f"{BLOBS_DIR_NAME}/{blob_hash[:2]}/{blob_hash[2:4]}/{blob_hash}{ext}"
+
+
+def ensure_schema(conn: sqlite3.Connection):
+    """Создает в основной БД таблицу связей изображений задач с файлами хранилища"""
+    conn.executescript(SCHEMA_SQL)
+
+
+class ImageStore:
+    def __init__(self, images_dir: Path):
+        self.images_dir = Path(images_dir)
+        self.index_path = self.images_dir / BLOBS_DIR_NAME / INDEX_DB_NAME
+        self._conn = None
+        self._lock = threading.Lock()
+        self._url_index = None
+        self.stats = {'reused': 0, 'downloaded': 0, 'new_blobs': 0}
+
+    # ---------- БД ----------
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = connect(self.index_path, ingest=True, check_same_thread=False)
+            self._conn.executescript(INDEX_SCHEMA_SQL)
+        return self._conn
+
+    def _load_url_index(self):
+        """Загружает соответствие URL -> (хэш, расширение) одним запросом"""
+        if self._url_index is None:
+            rows = self._connection().execute("""
+                SELECT u.url, b.hash, b.ext
+                FROM image_url_blobs u
+                JOIN image_blobs b ON b.hash = u.blob_hash
+            """).fetchall()
+            self._url_index = {url: (blob_hash, ext) for url, blob_hash, ext in rows}
+        return self._url_index
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._url_index = None
+
+    def blob_sizes(self) -> dict:
+        """{хэш: размер} всех файлов хранилища (одним запросом)"""
+        with self._lock:
+            return dict(self._connection().execute("SELECT hash, size FROM image_blobs").fetchall())
+
+    def source_urls(self) -> dict:
+        """{хэш: URL, с которого файл был скачан} (для восстановления файлов по ссылкам в тексте)"""
+        with self._lock:
+            return {blob_hash: url for url, (blob_hash, _) in self._load_url_index().items()}
+
+    def totals(self):
+        """Количество и суммарный размер файлов в хранилище"""
+        with self._lock:
+            count, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_blobs"
+            ).fetchone()
+        return count, size
+
+    def collect_garbage(self, referenced: set):
+        """
+        Удаляет файлы хранилища, хэшей которых нет в referenced, и их строки
+        индекса (запускать, когда загрузчики не работают). Возвращает (файлов, байт)
+        """
+        removed_files, removed_bytes = 0, 0
+        for path in (self.images_dir / BLOBS_DIR_NAME).glob('*/*/*'):
+            if BLOB_NAME_RE.match(path.stem) and path.stem not in referenced:
+                removed_bytes += path.stat().st_size
+                path.unlink()
+                removed_files += 1
+
+        with self._lock:
+            conn = self._connection()
+            stale = [(blob_hash,) for (blob_hash,) in conn.execute("SELECT hash FROM image_blobs")
+                     if blob_hash not in referenced]
+            conn.executemany("DELETE FROM image_url_blobs WHERE blob_hash = ?", stale)
+            conn.executemany("DELETE FROM image_blobs WHERE hash = ?", stale)
+            conn.commit()
+            self._url_index = None
+        return removed_files, removed_bytes
+
+    # ---------- файлы ----------
+
+    def blob_path(self, blob_hash: str, ext: str) -> Path:
+        return self.images_dir / blob_relative_path(blob_hash, ext)
+
+    def store_bytes(self, content: bytes, content_type: str = '', url: str = ''):
+        """
+        Сохраняет содержимое в хранилище (если такого файла еще нет)
+
+        Returns:
+            (путь относительно папки изображений, хэш)
+        """
+        blob_hash = hashlib.sha256(content).hexdigest()
+        ext = detect_extension(content, content_type, url)
+        path = self.blob_path(blob_hash, ext)
+
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+            self.stats['new_blobs'] += 1
+
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR IGNORE INTO image_blobs (hash, ext, size) VALUES (?, ?, ?)",
+                (blob_hash, ext, len(content))
+            )
+            if url:
+                conn.execute(
+                    "INSERT OR REPLACE INTO image_url_blobs (url, blob_hash) VALUES (?, ?)",
+                    (url, blob_hash)
+                )
+                self._load_url_index()[url] = (blob_hash, ext)
+            conn.commit()
+
+        return blob_relative_path(blob_hash, ext), blob_hash
+
+    def lookup(self, url: str):
+        """Возвращает (путь, хэш) уже сохраненного изображения по URL или None"""
+        with self._lock:
+            known = self._load_url_index().get(url)
+        if known and self.blob_path(*known).exists():
+            return blob_relative_path(*known), known[0]
+        return None
+
+    def fetch(self, url: str, timeout: float = 10):
+        """
+        Возвращает (путь, хэш) изображения по URL. Если файл с этим URL
+        уже есть в хранилище, сеть не используется.
+        """
+        known = self.lookup(url)
+        if known:
+            self.stats['reused'] += 1
+            run_metrics.count('images_reused')
+            return known
+
+        with run_metrics.stage('image'):
+            # Хранилище само служит кэшем изображений, поэтому HTTP кэш не используется
+            response = http_get(url, timeout=timeout)
+            response.raise_for_status()
+            self.stats['downloaded'] += 1
+            run_metrics.count('images_downloaded')
+            return self.store_bytes(response.content, response.headers.get('content-type', ''), url)
+
+
+def referenced_blobs(conn: sqlite3.Connection) -> set:
+    """
+    Хэши файлов хранилища, на которые ссылается основная БД: problem_image_blobs,
+    пути в строках изображений и ссылки в markdown условия и решения
+    """
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    hashes = set()
+    if 'problem_image_blobs' in tables:
+        hashes.update(row[0] for row in conn.execute("SELECT blob_hash FROM problem_image_blobs"))
+    texts = [
+        "SELECT image_path FROM problem_condition_images WHERE image_path LIKE '%blobs/%'",
+        "SELECT image_path FROM problem_solution_images WHERE image_path LIKE '%blobs/%'",
+        "SELECT COALESCE(condition_text, '') || char(10) || COALESCE(solution_text, '') FROM problems "
+        "WHERE condition_text LIKE '%blobs/%' OR solution_text LIKE '%blobs/%'",
+    ]
+    for sql in texts:
+        for (text,) in conn.execute(sql):
+            hashes.update(match.group(2) for match in BLOB_REF_RE.finditer(text or ''))
+    return hashes
+
+
+def link_image_row(cursor, image_table: str, image_id: int, blob_hash: str):
+    """Связывает строку таблицы изображений задачи с файлом хранилища"""
+    cursor.execute(
+        "INSERT OR REPLACE INTO problem_image_blobs (image_table, image_id, blob_hash) VALUES (?, ?, ?)",
+        (image_table, image_id, blob_hash)
+    )
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_image_store(images_dir: Path) -> ImageStore:
+    """Возвращает общее хранилище для папки изображений (одно на процесс)"""
+    key = str(Path(images_dir).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = ImageStore(images_dir)
+            _stores[key] = store
+        return store
@@ -0,0 +1,400 @@
+# -*- coding: utf-8 -*-
+"""
+Конвейер загрузки задач: скачивание -> разбор -> запись
+
+load_problem делает всё по очереди в одном потоке: страница, разбор HTML
+(BeautifulSoup на чистом Python нагружает CPU), изображения, запись в SQLite.
+Конвейер разносит это по стадиям:
+
+    потоки fetch  --pages-->  пул процессов parse  --parsed-->  потоки images  --write-->  writer
+    (страницы)                (parse_html_block,                (изображения)             (одно подключение,
+                               ответ, тема, аналоги)                                       пакетные коммиты)
+
+- разбор идет в --parse-workers процессах, поэтому масштабируется по ядрам;
+- в БД пишет один поток пакетами (bulk_ingest.IngestConnection);
+- стадии связаны очередями ограниченного размера, а страница занимает слот
+  от скачивания до записи: в памяти одновременно не больше --max-pages
+  страниц, сколько бы задач ни было в списке (ID читаются лениво);
+- если писатель упал (БД недоступна, диск заполнен), новые ID не читаются,
+  задачи в очередях завершаются ошибкой, а run() бросает исключение писателя.
+
+Процесс разбора не качает изображения: вместо пути вставляется метка, которую
+стадия images заменяет путем в хранилище. Если изображение не скачалось,
+страница разбирается заново с известными путями - результат тот же, что у
+load_problem.
+
+Использование:
+    pipeline = IngestPipeline('bio', 'oge', db_path, images_dir, max_pages=64)
+    stats = pipeline.run(problem_ids, on_done=lambda problem_id, ok: ...)
+    log.info(pipeline.summary())
+"""
+
+import multiprocessing
+import os
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+from bulk_ingest import connect_for_ingest, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SECONDS
+from content_hash import ensure_schema as ensure_content_hash_schema
+from analog_links import ensure_schema as ensure_analog_schema
+from fetch_context import ProblemFetchContext
+from html_backend import parse_document, resolve_backend, PROB_MAINDIV
+from http_cache import cached_get
+from load_html_parser import extract_problem, save_problem, get_problem_url, problem_summary
+from run_metrics import run_metrics
+from run_log import get_logger
+
+log = get_logger(__name__)
+
+DEFAULT_IO_WORKERS = 8
+DEFAULT_MAX_PAGES = 64
+
+# Метка изображения в тексте из процесса разбора: \x00img<n>\x00
+IMAGE_MARK = '\x00img{}\x00'
+IMAGE_MARK_RE = re.compile('\x00img(\\d+)\x00')
+
+_DONE = object()
+
+
+class _ImageCollector:
+    """image_saver для процесса разбора: запоминает src и возвращает метку вместо пути"""
+
+    def __init__(self):
+        self.sources = []
+        self._marks = {}
+
+    def __call__(self, url, subject_code, problem_id, img_type, index, images_dir):
+        if url not in self._marks:
+            self._marks[url] = IMAGE_MARK.format(len(self.sources))
+            self.sources.append(url)
+        return self._marks[url]
+
+
+def parse_page(problem_id: str, subject_code: str, content: bytes, backend: str):
+    """
+    Стадия parse (выполняется в пуле процессов)
+
+    Returns:
+        (dict extract_problem + 'images' (src изображений по номерам меток) или строка с ошибкой,
+         время разбора в секундах - замеры процесса пула в run_metrics конвейера не попадают)
+    """
+    started = time.perf_counter()
+    root = parse_document(content, backend, only=PROB_MAINDIV)
+    try:
+        prob_div = root.find('div', 'prob_maindiv')
+        if prob_div is None:
+            return "Не найден блок задачи", time.perf_counter() - started
+        collector = _ImageCollector()
+        data = extract_problem(prob_div, subject_code, problem_id, Path('.'), image_saver=collector)
+        if isinstance(data, dict):
+            data['images'] = collector.sources
+        return data, time.perf_counter() - started
+    finally:
+        root.release()
+
+
+class _Item:
+    """Задача на конвейере (занимает один слот страницы)"""
+    __slots__ = ('problem_id', 'url', 'ctx', 'content', 'data', 'started')
+
+    def __init__(self, problem_id: str, url: str, ctx: ProblemFetchContext):
+        self.problem_id = problem_id
+        self.url = url
+        self.ctx = ctx
+        self.content = None
+        self.data = None
+        self.started = time.perf_counter()
+
+
+class IngestPipeline:
+    def __init__(self, subject_code: str, exam_type: str, db_path: Path, images_dir: Path,
+                 backend: str = None, io_workers: int = DEFAULT_IO_WORKERS, parse_workers: int = None,
+                 max_pages: int = DEFAULT_MAX_PAGES, batch_size: int = DEFAULT_BATCH_SIZE,
+                 batch_seconds: float = DEFAULT_BATCH_SECONDS):
+        """
+        Args:
+            io_workers: Потоков скачивания страниц и, отдельно, изображений
+            parse_workers: Процессов разбора HTML (по умолчанию - число ядер)
+            max_pages: Максимум задач (страниц) в памяти на всех стадиях сразу
+        """
+        self.subject_code = subject_code
+        self.exam_type = exam_type
+        self.db_path = Path(db_path)
+        self.images_dir = Path(images_dir)
+        self.backend = resolve_backend(backend)
+        self.io_workers = max(1, io_workers)
+        self.parse_workers = max(1, parse_workers or os.cpu_count() or 1)
+        self.max_pages = max(1, max_pages)
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
+
+        self._slots = threading.BoundedSemaphore(self.max_pages)
+        self._lock = threading.Lock()
+        self._on_done = None
+        self._stop = threading.Event()
+        self._write_error = None
+        self.stats = {'loaded': 0, 'failed': 0, 'in_memory': 0, 'peak_in_memory': 0, 'seconds': 0.0}
+        self.write_summary = ''
+
+    # ---------- слоты страниц ----------
+
+    def _acquire_slot(self):
+        self._slots.acquire()
+        with self._lock:
+            self.stats['in_memory'] += 1
+            self.stats['peak_in_memory'] = max(self.stats['peak_in_memory'], self.stats['in_memory'])
+
+    def _finish(self, item: _Item, ok: bool, message: str = ''):
+        """Задача покинула конвейер: освобождаем слот и сообщаем результат"""
+        item.content = item.data = None
+        item.ctx.finish()
+        run_metrics.observe('problem', time.perf_counter() - item.started)
+        if ok:
+            log.debug(f"[{item.problem_id}] Сохранена ({message})", extra={'problem_id': item.problem_id})
+        else:
+            log.error(f"[{item.problem_id}] {message}", extra={'problem_id': item.problem_id})
+        with self._lock:
+            self.stats['loaded' if ok else 'failed'] += 1
+            self.stats['in_memory'] -= 1
+        self._slots.release()
+        if self._on_done:
+            self._on_done(item.problem_id, ok)
+
+    @staticmethod
+    def _start_workers(count: int, target, in_queue: queue.Queue, out_queue: queue.Queue) -> list:
+        """
+        count потоков target(item) над in_queue; последний завершившийся поток
+        передает признак конца в out_queue
+        """
+        remaining = [count]
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                item = in_queue.get()
+                if item is _DONE:
+                    in_queue.put(_DONE)  # для остальных потоков стадии
+                    break
+                target(item)
+            with lock:
+                remaining[0] -= 1
+                last = remaining[0] == 0
+            if last:
+                out_queue.put(_DONE)
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    # ---------- стадии ----------
+
+    def _feed(self, problem_ids, ids_queue: queue.Queue):
+        """ID читаются лениво: слот страницы занимается до того, как ID попадет в fetch"""
+        for problem_id in problem_ids:
+            if self._stop.is_set():
+                break
+            self._acquire_slot()
+            ids_queue.put(str(problem_id))
+        ids_queue.put(_DONE)
+
+    def _fetch(self, problem_id: str, pages: queue.Queue):
+        url = get_problem_url(self.subject_code, problem_id)
+        item = _Item(problem_id, url, ProblemFetchContext(self.images_dir))
+        try:
+            response = cached_get(url, timeout=10, stats=item.ctx.counters)
+            response.raise_for_status()
+            item.content = response.content
+        except Exception as e:
+            self._finish(item, False, f"страница не скачана: {e}")
+            return
+        pages.put(item)
+
+    def _parse(self, pages: queue.Queue, parsed: queue.Queue):
+        """Раздает страницы пулу процессов, держа в работе не больше 2 страниц на процесс"""
+        in_flight = {}
+        limit = self.parse_workers * 2
+        exhausted = False
+        # spawn: процессы не наследуют состояние потоков конвейера (и так же работает на Windows)
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=context) as pool:
+            while not exhausted or in_flight:
+                # Забираем из очереди все доступные страницы, пока есть место в пуле
+                while not exhausted and len(in_flight) < limit:
+                    try:
+                        item = pages.get(block=not in_flight)
+                    except queue.Empty:
+                        break
+                    if item is _DONE:
+                        exhausted = True
+                    else:
+                        future = pool.submit(parse_page, item.problem_id, self.subject_code,
+                                             item.content, self.backend)
+                        in_flight[future] = item
+                if not in_flight:
+                    continue
+                block = exhausted or len(in_flight) >= limit
+                done, _ = wait(list(in_flight), timeout=None if block else 0.01, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    try:
+                        item.data, seconds = future.result()
+                        run_metrics.observe('parse', seconds)
+                    except Exception as e:
+                        item.data = f"ошибка разбора: {e}"
+                    if isinstance(item.data, str):
+                        self._finish(item, False, item.data)
+                    else:
+                        parsed.put(item)
+        parsed.put(_DONE)
+
+    def _images(self, item: _Item, write: queue.Queue):
+        try:
+            self._resolve_images(item)
+        except Exception as e:
+            self._finish(item, False, f"ошибка обработки изображений: {e}")
+            return
+        write.put(item)
+
+    def _resolve_images(self, item: _Item):
+        """Скачивает изображения задачи и подставляет пути вместо меток"""
+        data = item.data
+        base_url = f"https://{self.subject_code}-ege.sdamgia.ru/"
+        paths = {}
+        for src in data.pop('images'):
+            try:
+                paths[src], _ = item.ctx.image(src, base_url=base_url)
+            except Exception as e:
+                log.warning(f"[{item.problem_id}] Ошибка скачивания изображения {src}: {e}",
+                            extra={'problem_id': item.problem_id})
+                paths[src] = None
+
+        if None in paths.values():
+            # Без изображения текст собирается иначе (переносы, обрезка) - разбираем заново
+            root = parse_document(item.content, self.backend, only=PROB_MAINDIV)
+            try:
+                data = extract_problem(root.find('div', 'prob_maindiv'), self.subject_code, item.problem_id,
+                                       self.images_dir, image_saver=lambda src, *args: paths.get(src))
+            finally:
+                root.release()
+        elif paths:
+            by_mark = list(paths.values())
+            for field in ('condition', 'solution'):
+                data[field] = IMAGE_MARK_RE.sub(lambda m: by_mark[int(m.group(1))], data[field])
+
+        item.data = data
+        item.content = None
+
+    def _write(self, write: queue.Queue):
+        """
+        Единственный писатель: одно подключение, коммит раз в пакет задач.
+        Если запись сломалась, ошибка сохраняется для run(), а очередь
+        дочитывается - иначе стадии выше навсегда заблокировались бы на put()
+        """
+        item = None
+        try:
+            conn = connect_for_ingest(self.db_path, bulk=True, batch_size=self.batch_size,
+                                      batch_seconds=self.batch_seconds)
+            try:
+                ensure_content_hash_schema(conn)
+                ensure_analog_schema(conn)
+                item = write.get()
+                while item is not _DONE:
+                    try:
+                        with conn.problem():
+                            save_problem(conn, self.subject_code, self.exam_type, item.problem_id, item.url,
+                                         item.data)
+                    except Exception as e:
+                        log.debug(f"[{item.problem_id}] Трассировка ошибки записи", exc_info=True)
+                        self._finish(item, False, f"ошибка записи: {e}")
+                    else:
+                        self._finish(item, True, f"{problem_summary(item.data)}, запросов: {item.ctx.requests}")
+                    item = write.get()
+                conn.flush()
+                self.write_summary = conn.summary()
+            finally:
+                conn.close()
+        except Exception as e:
+            log.exception(f"Запись в БД остановлена: {e}")
+            self._write_error = e
+            self._stop.set()
+            if item is not _DONE:
+                self._drain(write, f"запись в БД остановлена: {e}")
+
+    def _drain(self, write: queue.Queue, message: str):
+        """Завершает ошибкой задачи, оставшиеся в очереди записи (освобождает их слоты)"""
+        item = write.get()
+        while item is not _DONE:
+            try:
+                self._finish(item, False, message)
+            except Exception:
+                log.debug(f"[{item.problem_id}] Ошибка при завершении задачи", exc_info=True)
+            item = write.get()
+
+    # ---------- запуск ----------
+
+    def run(self, problem_ids, on_done=None) -> dict:
+        """
+        Загружает задачи (problem_ids - любой итерируемый объект, читается лениво)
+
+        on_done(problem_id, ok) вызывается из потоков конвейера по мере готовности задач
+        """
+        self._on_done = on_done
+        self._stop.clear()
+        self._write_error = None
+        started = time.perf_counter()
+
+        ids_queue = queue.Queue(maxsize=self.io_workers)
+        pages = queue.Queue(maxsize=self.max_pages)
+        parsed = queue.Queue(maxsize=self.max_pages)
+        write = queue.Queue(maxsize=self.max_pages)
+
+        threads = self._start_workers(self.io_workers, lambda pid: self._fetch(pid, pages), ids_queue, pages)
+        threads.append(threading.Thread(target=self._parse, args=(pages, parsed), daemon=True))
+        threads[-1].start()
+        threads += self._start_workers(self.io_workers, lambda item: self._images(item, write), parsed, write)
+        writer = threading.Thread(target=self._write, args=(write,), daemon=True)
+        writer.start()
+
+        self._feed(problem_ids, ids_queue)
+        for thread in threads:
+            thread.join()
+        writer.join()
+
+        self.stats['seconds'] = time.perf_counter() - started
+        if self._write_error is not None:
+            raise self._write_error
+        return self.stats
+
+    def summary(self) -> str:
+        total = self.stats['loaded'] + self.stats['failed']
+        seconds = self.stats['seconds']
+        rate = total / seconds if seconds > 0 else 0.0
+        lines = [
+            f"Конвейер: {total} задач (успешно: {self.stats['loaded']}) за {seconds:.1f} с ({rate:.2f} задач/с), "
+            f"процессов разбора: {self.parse_workers}, потоков I/O: {self.io_workers}, "
+            f"страниц в памяти: не больше {self.stats['peak_in_memory']} из {self.max_pages}",
+        ]
+        if self.write_summary:
+            lines.append(self.write_summary)
+        return '\n'.join(lines)
+
+
+def add_pipeline_arguments(parser):
+    """Добавляет в argparse параметры конвейера"""
+    parser.add_argument('--pipeline', action='store_true',
+                        help='Конвейер: скачивание, разбор в нескольких процессах и пакетная запись')
+    parser.add_argument('--io-workers', type=int, default=DEFAULT_IO_WORKERS,
+                        help=f'Потоков скачивания страниц/изображений (по умолчанию {DEFAULT_IO_WORKERS})')
+    parser.add_argument('--parse-workers', type=int, default=None,
+                        help='Процессов разбора HTML (по умолчанию - число ядер)')
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES,
+                        help=f'Максимум страниц в памяти одновременно (по умолчанию {DEFAULT_MAX_PAGES})')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help=f'Задач в одном коммите (по умолчанию {DEFAULT_BATCH_SIZE})')
+    parser.add_argument('--batch-seconds', type=float, default=DEFAULT_BATCH_SECONDS,
+                        help=f'Максимальная длительность пакета в секундах (по умолчанию {DEFAULT_BATCH_SECONDS:g})')
@@ -3,18 +3,24 @@
 Инициализация базы данных
 """
 
-import sqlite3
 import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).parent))
+from sqlite_conn import connect
+from run_log import get_logger, setup_logging
+
+setup_logging()
+log = get_logger(__name__)
+
 # Путь к БД
 script_dir = Path(__file__).parent
 db_path = script_dir.parent / 'tasksbd.db'
 
-print(f"Создание базы данных: {db_path}")
+log.info(f"Создание базы данных: {db_path}")
 
 # Создаем БД
-conn = sqlite3.connect(str(db_path))
+conn = connect(db_path)
 cursor = conn.cursor()
 
 # Читаем SQL скрипт
@@ -27,6 +33,6 @@ cursor.executescript(sql_script)
 conn.commit()
 conn.close()
 
-print("✅ База данных создана успешно!")
+log.info("База данных создана успешно!")
 
 
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Множество уже загруженных задач предмета
+
+Загрузчики узнавали, что задача уже есть в БД, только после того, как скачали
+её страницу (TasksLoader: "SKIP Задача ... уже существует", load_html_parser:
+повторная загрузка и INSERT OR REPLACE). KnownProblems одним запросом читает
+problems.problem_id предмета, и обход категорий планирует только новые задачи,
+поэтому дозагрузка почти полностью загруженного предмета почти не запрашивает
+страниц задач.
+
+Множество строк ID занимает несколько мегабайт даже для сотен тысяч задач,
+поэтому вероятностный фильтр (Bloom) здесь не нужен.
+
+Использование:
+    known = KnownProblems(conn, 'bio', 'oge')
+    new_ids = known.unseen(problem_ids)     # только задачи, которых нет в БД
+    known.add(problem_id)                   # после сохранения задачи
+"""
+
+import sqlite3
+
+
+class KnownProblems:
+    def __init__(self, conn: sqlite3.Connection, subject_code: str, exam_type: str = 'oge'):
+        rows = conn.execute("""
+            SELECT p.problem_id FROM problems p
+            JOIN subjects s ON s.id = p.subject_id
+            WHERE s.code = ? AND s.exam_type = ?
+        """, (subject_code, exam_type)).fetchall()
+        self._ids = {str(row[0]) for row in rows}
+        self.skipped = 0
+
+    def __contains__(self, problem_id) -> bool:
+        return str(problem_id) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, problem_id):
+        self._ids.add(str(problem_id))
+
+    def unseen(self, problem_ids) -> list:
+        """ID задач, которых еще нет в БД (порядок сохраняется)"""
+        result = [problem_id for problem_id in problem_ids if str(problem_id) not in self._ids]
+        self.skipped += len(problem_ids) - len(result)
+        return result
@@ -6,16 +6,40 @@
 - Тема (с названием из каталога)
 - Аналогичные задачи
 - Категории (из каталога)
+
+--refresh перепроверяет уже загруженные задачи и переписывает только те,
+у которых изменился хэш содержимого (см. content_hash.py).
 """
 
 import sys
 import os
-import sqlite3
-import requests
 import argparse
+import re
+from contextlib import closing
 from pathlib import Path
-from bs4 import BeautifulSoup, NavigableString
-import time
+from urllib.parse import urlparse
+
+sys.path.insert(0, str(Path(__file__).parent))
+from crawl_engine import CrawlEngine
+from sqlite_conn import connect
+from image_store import get_image_store
+from http_cache import GoneError
+from fetch_context import ProblemFetchContext, run_request_stats
+from content_hash import (ensure_schema as ensure_content_hash_schema, problem_content_hash, stored_hashes,
+                          refresh_stats, CHANGED, UNCHANGED, REMOVED)
+from analog_links import ensure_schema as ensure_analog_schema, record_analogs, resolve_analogs
+from category_index import ensure_schema as ensure_category_schema, link_categories
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+from html_backend import as_node, BACKENDS, DEFAULT_BACKEND, TEXT, IMG, BR, OPEN, CLOSE, SKIP
+
+log = get_logger(__name__)
+
+# Названия предметов для новых строк subjects
+SUBJECT_NAMES = {'mathb': 'Математика (База)', 'bio': 'Биология', 'math': 'Математика (Профиль)',
+                 'rus': 'Русский язык', 'phys': 'Физика', 'inf': 'Информатика', 'chem': 'Химия',
+                 'geo': 'География', 'soc': 'Обществознание', 'hist': 'История', 'lit': 'Литература',
+                 'en': 'Английский', 'de': 'Немецкий', 'fr': 'Французский', 'sp': 'Испанский'}
 
 # Добавляем путь к sdamgia-api
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / 'sdamgia-api'))
@@ -24,128 +48,122 @@ try:
     SDAMGIA_AVAILABLE = True
 except ImportError:
     SDAMGIA_AVAILABLE = False
-    print("WARNING: sdamgia-api не установлен. Каталог и аналоги будут загружаться из HTML.")
+    log.warning("sdamgia-api не установлен. Каталог и аналоги будут загружаться из HTML.")
 
 
 def save_image(url: str, subject_code: str, problem_id: str, img_type: str, index: int, images_dir: Path) -> str:
-    """Скачивает изображение"""
+    """Скачивает изображение в хранилище (уже известные URL повторно не скачиваются)"""
     try:
         if not url.startswith('http'):
             url = f"https://{subject_code}-ege.sdamgia.ru{url}"
         
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        content = response.content
-        
-        # Определяем тип
-        if content[:4] in (b'<?xml', b'<svg') or b'<svg' in content[:100]:
-            ext = '.svg'
-        elif content[:4] == b'\x89PNG':
-            ext = '.png'
-        elif content[:3] == b'\xff\xd8\xff':
-            ext = '.jpg'
-        else:
-            ext = '.svg'
-        
-        # Сохраняем
-        problem_dir = images_dir / subject_code / problem_id
-        problem_dir.mkdir(parents=True, exist_ok=True)
-        
-        filename = f"{img_type}_{index}{ext}"
-        with open(problem_dir / filename, 'wb') as f:
-            f.write(content)
-        
-        return f"{subject_code}/{problem_id}/{filename}"
+        # Путь вида blobs/ab/cd/<sha256>.svg относительно папки изображений
+        rel_path, _ = get_image_store(images_dir).fetch(url)
+        return rel_path
     except Exception as e:
-        print(f"    WARNING: Ошибка скачивания изображения: {e}")
+        log.warning(f"Ошибка скачивания изображения {url}: {e}", extra={'problem_id': problem_id})
         return None
 
 
-def parse_html_block(block, subject_code: str, problem_id: str, block_type: str, images_dir: Path) -> str:
+# Служебные элементы СДАМ ГИА внутри условия/решения (пропускаются целиком)
+RULE_CLASSES = frozenset(('rule_info', 'rule_body'))
+RULE_TAGS = ('div', 'span')
+BLOCK_TAGS = ('p', 'div')
+
+IMG_MARKDOWN = '![img](http://localhost:3001/tasks/images/{})'
+BLANK_LINES_RE = re.compile(r'\n{3,}')
+# "Решение" или "Пояснение" в начале решения (с учетом мягких переносов)
+SOLUTION_PREFIX_RE = re.compile(r'^[Рр]е[­\s]*[шщ]е[­\s]*ни[­\s]*е[\.\:\s]*', re.IGNORECASE)
+EXPLANATION_PREFIX_RE = re.compile(r'^[Пп]о[­\s]*я[­\s]*с[­\s]*не[­\s]*ни[­\s]*е[\.\:\s]*', re.IGNORECASE)
+ANSWER_IN_TEXT_RE = re.compile(r'Ответ[:\s]+([^\n\.]+)', re.IGNORECASE)
+
+
+def _append_lines(parts: list, chunk: str, newlines: int) -> int:
     """
-    Рекурсивно парсит HTML блок, сохраняя точный порядок текста и изображений
+    Добавляет к тексту фрагмент с переносами строки, схлопывая 3+ переноса подряд в 2
+
+    newlines - сколько '\n' подряд стоит в конце уже собранного текста (parts);
+    возвращает то же число после добавления фрагмента
+    """
+    lead = len(chunk) - len(chunk.lstrip('\n'))
+    if lead == len(chunk):
+        # Только переносы строки
+        keep = min(lead, max(0, 2 - newlines))
+        if keep:
+            parts.append(chunk[:keep])
+        return newlines + lead
+    if lead and newlines + lead > 2:
+        chunk = chunk[lead - max(0, 2 - newlines):]
+    if '\n\n\n' in chunk:
+        chunk = BLANK_LINES_RE.sub('\n\n', chunk)
+    parts.append(chunk)
+    return len(chunk) - len(chunk.rstrip('\n'))
+
+
+def parse_html_block(block, subject_code: str, problem_id: str, block_type: str, images_dir: Path,
+                     image_saver=None) -> str:
+    """
+    Парсит HTML блок за один проход, сохраняя точный порядок текста и изображений
     ВАЖНО: Inline изображения (формулы) вставляются БЕЗ переносов строк
     Исключает служебные элементы: rule_info, rule_body
+    
+    image_saver - функция с сигнатурой save_image (по умолчанию save_image)
+    block - узел html_backend.Node или BeautifulSoup
     """
     if not block:
         return ''
     
-    # Удаляем служебные элементы перед парсингом
-    for element in block.find_all(['div', 'span'], class_=['rule_info', 'rule_body']):
-        element.decompose()
+    block = as_node(block)
+    image_saver = image_saver or save_image
     
-    result = []
-    img_counter = [0]
+    # Текст собирается в parts; 3+ переноса подряд схлопываются сразу при добавлении,
+    # newlines - число '\n' в конце собранного текста
+    parts = []
+    newlines = 0
+    img_counter = 0
+    # Служебные div/span удаляются из дерева после обхода (их текст не должен
+    # попасть и в extract_answer, который читает решение через get_text)
+    rules = []
     
-    def process_node(node, is_inline=True):
-        """
-        Рекурсивно обрабатывает узел DOM
-        is_inline - находится ли узел внутри строки текста (для inline формул)
-        """
-        
-        # Пропускаем служебные элементы
-        if hasattr(node, 'get') and node.get('class'):
-            classes = node.get('class', [])
-            if 'rule_info' in classes or 'rule_body' in classes:
-                return
-        
-        if isinstance(node, NavigableString):
-            # Текстовый узел
-            text = str(node)
-            # Сохраняем пробелы, но не добавляем лишние переносы
-            if text:
-                result.append(text)
+    for event, value in block.walk(RULE_CLASSES, BLOCK_TAGS):
+        if event is TEXT:
+            # Текстовый узел - пробелы сохраняем как есть
+            if not value:
+                continue
+            if '\n' in value:
+                newlines = _append_lines(parts, value, newlines)
+            else:
+                parts.append(value)
+                newlines = 0
         
-        elif node.name == 'img':
+        elif event is IMG:
             # Изображение (формула) - вставляем inline БЕЗ переносов
-            img_url = node.get('src', '')
-            if img_url:
-                img_path = save_image(img_url, subject_code, problem_id, block_type, img_counter[0], images_dir)
+            if value:
+                img_path = image_saver(value, subject_code, problem_id, block_type, img_counter, images_dir)
                 if img_path:
-                    # Inline изображение - вставляем прямо в текст
-                    result.append(f'![img](http://localhost:3001/tasks/images/{img_path})')
-                    img_counter[0] += 1
+                    parts.append(IMG_MARKDOWN.format(img_path))
+                    newlines = 0
+                    img_counter += 1
         
-        elif node.name == 'br':
+        elif event is BR:
             # Явный перенос строки
-            result.append('\n')
-        
-        elif node.name in ('p', 'div'):
-            # Блочные элементы - добавляем перенос ДО (если нужно)
-            if result and not result[-1].endswith('\n'):
-                result.append('\n')
-            
-            # Обрабатываем содержимое как блочное
-            for child in node.children:
-                process_node(child, is_inline=False)
-            
-            # Добавляем перенос ПОСЛЕ
-            if result and not result[-1].endswith('\n'):
-                result.append('\n')
-        
-        elif node.name in ('span', 'b', 'i', 'strong', 'em'):
-            # Inline элементы - обрабатываем содержимое как inline
-            for child in node.children:
-                process_node(child, is_inline=True)
-        
-        elif node.name:
-            # Другие элементы - обрабатываем как inline по умолчанию
-            for child in node.children:
-                process_node(child, is_inline=True)
+            newlines = _append_lines(parts, '\n', newlines)
+        
+        elif event is OPEN or event is CLOSE:
+            # Блочные элементы - перенос ДО и ПОСЛЕ содержимого
+            if parts and not newlines:
+                parts.append('\n')
+                newlines = 1
+        
+        elif event is SKIP:
+            # Служебный элемент пропущен вместе с поддеревом
+            if value.name in RULE_TAGS:
+                rules.append(value)
     
-    # Обрабатываем все дочерние узлы как inline (формулы в тексте)
-    for child in block.children:
-        process_node(child, is_inline=True)
+    for node in rules:
+        node.decompose()
     
-    # Объединяем результат
-    text = ''.join(result)
-    
-    # Убираем лишние пустые строки в начале и конце
-    text = text.strip()
-    
-    # Убираем множественные пустые строки (оставляем максимум одну)
-    while '\n\n\n' in text:
-        text = text.replace('\n\n\n', '\n\n')
+    text = ''.join(parts).strip()
     
     # Для решения: очищаем от служебных элементов и текста
     if block_type == 'solution':
@@ -153,12 +171,8 @@ def parse_html_block(block, subject_code: str, problem_id: str, block_type: str,
         text = text.replace('rule_info.', '').replace('rule_body', '').strip()
         
         # Убираем "Решение" или "Пояснение" в начале (может быть с разными пробелами/переносами)
-        text = text.lstrip()
-        # Используем регулярное выражение для более точного поиска
-        import re
-        # Убираем "Решение" или "Пояснение" в начале (с учетом мягких переносов)
-        text = re.sub(r'^[Рр]е[­\s]*[шщ]е[­\s]*ни[­\s]*е[\.\:\s]*', '', text, flags=re.IGNORECASE)
-        text = re.sub(r'^[Пп]о[­\s]*я[­\s]*с[­\s]*не[­\s]*ни[­\s]*е[\.\:\s]*', '', text, flags=re.IGNORECASE)
+        text = SOLUTION_PREFIX_RE.sub('', text)
+        text = EXPLANATION_PREFIX_RE.sub('', text)
         text = text.lstrip()
         
         # Убираем точки и двоеточия в начале
@@ -175,219 +189,395 @@ def parse_html_block(block, subject_code: str, problem_id: str, block_type: str,
     return text
 
 
-def load_problem(problem_id: str, subject_code: str, exam_type: str, db_path: Path, images_dir: Path):
-    """Загружает одну задачу"""
+def get_problem_url(subject_code: str, problem_id: str) -> str:
+    """Формирует URL страницы задачи"""
+    if subject_code == 'mathb':
+        return f"https://mathb-ege.sdamgia.ru/problem?id={problem_id}"
+    return f"https://{subject_code}-ege.sdamgia.ru/problem?id={problem_id}"
+
+
+def extract_answer(prob_div, pbody_blocks) -> str:
+    """Извлекает ответ из блока answer, а если его нет - из текста решения"""
+    answer = ''
+    prob_div = as_node(prob_div)
+    pbody_blocks = [as_node(block) for block in pbody_blocks]
+    answer_div = prob_div.find('div', 'answer')
+    if answer_div:
+        answer_text = answer_div.get_text().strip()
+        # Убираем "Ответ:" или "Ответ" в начале
+        if answer_text.lower().startswith('ответ'):
+            answer_text = answer_text[5:].lstrip()  # "Ответ" = 5 символов
+            # Убираем двоеточие если есть
+            if answer_text.startswith(':'):
+                answer_text = answer_text[1:].lstrip()
+        answer = answer_text.strip()
+    
+    # Если ответ не найден в отдельном блоке, пытаемся извлечь из решения
+    if not answer and len(pbody_blocks) > 1:
+        solution_text_raw = pbody_blocks[1].get_text()
+        if 'Ответ:' in solution_text_raw or 'Ответ ' in solution_text_raw:
+            # Ищем "Ответ:" или "Ответ " в тексте
+            answer_match = ANSWER_IN_TEXT_RE.search(solution_text_raw)
+            if answer_match:
+                answer = answer_match.group(1).strip().rstrip('.')
+    
+    return answer
+
+
+def extract_topic_number(prob_div) -> str:
+    """Извлекает номер темы (задания) из prob_nums, например "Тип 4 № 506304" -> 4"""
+    topic_number = None
+    nums_span = as_node(prob_div).find('span', 'prob_nums')
+    if nums_span:
+        nums_text = nums_span.get_text().strip()
+        parts = nums_text.split()
+        # Ищем "Тип" и берем следующее число
+        for i, part in enumerate(parts):
+            if part == 'Тип' and i + 1 < len(parts):
+                # Берем следующее слово (номер темы)
+                next_part = parts[i + 1]
+                # Убираем символы, оставляем только цифры
+                topic_number = ''.join(c for c in next_part if c.isdigit())
+                if topic_number:
+                    break
+    return topic_number
+
+
+def extract_analogs(prob_div) -> list:
+    """Извлекает ID аналогичных задач из блока minor"""
+    analogs = []
+    minor_div = as_node(prob_div).find('div', 'minor')
+    if minor_div:
+        analog_links = minor_div.find_all('a')
+        for link in analog_links:
+            link_text = link.get_text().strip()
+            if link_text and link_text != 'Все' and link_text.isdigit():
+                analogs.append(link_text)
+    return analogs
+
+
+@run_metrics.timed('parse')
+def extract_problem(prob_div, subject_code: str, problem_id: str, images_dir: Path, image_saver=None):
+    """
+    Извлекает из блока задачи всё, что сохраняется в БД
+
+    Returns:
+        dict (condition, solution, answer, topic_number, analogs) или строка с ошибкой
+    """
+    # Находим блоки с текстом
+    pbody_blocks = prob_div.find_all('div', 'pbody')
+    
+    if len(pbody_blocks) == 0:
+        return "Нет блоков pbody"
+    
+    # Парсим условие
+    condition = parse_html_block(pbody_blocks[0], subject_code, problem_id, 'condition', images_dir,
+                                 image_saver=image_saver)
+    
+    # Парсим решение (если есть)
+    solution = ''
+    if len(pbody_blocks) > 1:
+        solution = parse_html_block(pbody_blocks[1], subject_code, problem_id, 'solution', images_dir,
+                                    image_saver=image_saver)
+    
+    # Получаем ответ, номер темы и аналогичные задачи
+    return {
+        'condition': condition,
+        'solution': solution,
+        'answer': extract_answer(prob_div, pbody_blocks),
+        'topic_number': extract_topic_number(prob_div),
+        'analogs': extract_analogs(prob_div),
+    }
+
+
+def get_or_create_subject(conn, subject_code: str, exam_type: str) -> int:
+    """ID предмета в БД (новый предмет создается с названием из SUBJECT_NAMES)"""
+    conn.execute("INSERT OR IGNORE INTO subjects (code, name, exam_type) VALUES (?, ?, ?)",
+                 (subject_code, SUBJECT_NAMES.get(subject_code, subject_code), exam_type))
+    conn.commit()
+    return conn.execute("SELECT id FROM subjects WHERE code = ? AND exam_type = ?",
+                        (subject_code, exam_type)).fetchone()[0]
+
+
+@run_metrics.timed('db_write')
+def save_problem(conn, subject_code: str, exam_type: str, problem_id: str, url: str, data: dict):
+    """
+    Сохраняет извлеченную задачу (см. extract_problem) в БД, commit() - после каждого шага.
+    Уже загруженная задача обновляется на месте (UPSERT): id строки не меняется, поэтому
+    изображения, категории, аналоги и test_problems задачи не удаляются каскадом
+    """
+    condition = data['condition']
+    solution = data['solution']
+    answer = data['answer']
+    topic_number = data['topic_number']
+    topic_name = None
+    analogs = data['analogs']
+    content_hash = problem_content_hash(condition, solution, answer)
+    
+    cursor = conn.cursor()
+    subject_id = get_or_create_subject(conn, subject_code, exam_type)
+    
+    # Создаем или находим тему
+    topic_id = None
+    if topic_number:
+        # Проверяем, существует ли тема
+        cursor.execute("SELECT id, topic_name FROM topics WHERE subject_id = ? AND topic_number = ?",
+                      (subject_id, topic_number))
+        topic_row = cursor.fetchone()
+        
+        if topic_row:
+            topic_id = topic_row[0]
+            if not topic_name:
+                topic_name = topic_row[1]
+        else:
+            # Создаем новую тему
+            if not topic_name:
+                topic_name = f'Задание {topic_number}'
+            cursor.execute("""
+                INSERT INTO topics (subject_id, topic_number, topic_name, topic_line)
+                VALUES (?, ?, ?, ?)
+            """, (subject_id, topic_number, topic_name, topic_number))
+            topic_id = cursor.lastrowid
+            conn.commit()
+    
+    # Сохраняем задачу: новая - INSERT, загруженная - UPDATE той же строки и только если что-то изменилось
+    # (иначе триггер update_problems_timestamp сдвинул бы updated_at)
+    cursor.execute("""
+        INSERT INTO problems 
+        (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, source, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'sdamgia', ?)
+        ON CONFLICT(subject_id, problem_id) DO UPDATE SET
+            topic_id = excluded.topic_id,
+            line = excluded.line,
+            condition_text = excluded.condition_text,
+            solution_text = excluded.solution_text,
+            answer = excluded.answer,
+            url = excluded.url,
+            source = excluded.source,
+            content_hash = excluded.content_hash
+        WHERE problems.content_hash IS NOT excluded.content_hash
+           OR problems.topic_id IS NOT excluded.topic_id
+           OR problems.line IS NOT excluded.line
+           OR problems.url IS NOT excluded.url
+           OR problems.source IS NOT excluded.source
+    """, (subject_id, topic_id, problem_id, topic_number, condition, solution, answer, url, content_hash))
+    
+    # Аналоги запоминаются по ID СДАМ ГИА, связи создаст resolve_analogs в конце запуска.
+    # Категории связывает link_categories - по их составу (category_index), а не по теме задачи
+    record_analogs(cursor, subject_id, problem_id, analogs)
+    
+    conn.commit()
+
+
+def _store_problem(conn, db_path: Path, subject_code: str, exam_type: str, problem_id: str, url: str, data: dict):
+    """
+    Сохраняет задачу через соединение вызывающего (conn), а без него - через свое,
+    которое закрывается и при ошибке записи
+    """
+    if conn is None:
+        with closing(connect(db_path, ingest=True)) as own:
+            save_problem(own, subject_code, exam_type, problem_id, url, data)
+        return
+    try:
+        save_problem(conn, subject_code, exam_type, problem_id, url, data)
+    except Exception:
+        # Незавершенный шаг не должен попасть в следующий commit() вызывающего
+        conn.rollback()
+        raise
+
+
+@run_metrics.timed('problem')
+def load_problem(problem_id: str, subject_code: str, exam_type: str, db_path: Path, images_dir: Path,
+                 backend: str = None, conn=None):
+    """
+    Загружает одну задачу (backend - HTML парсер, см. html_backend.py).
+    conn - открытое соединение вызывающего (одно на весь запуск); без него задача
+    пишется через отдельное соединение. Из разных потоков conn не передается.
+    """
     
+    with ProblemFetchContext(images_dir) as ctx:
+        return _load_problem(problem_id, subject_code, exam_type, db_path, images_dir, ctx, backend, conn)
+
+
+def _load_problem(problem_id: str, subject_code: str, exam_type: str, db_path: Path, images_dir: Path,
+                  ctx: ProblemFetchContext, backend: str = None, conn=None):
     try:
         # Формируем URL
-        if subject_code == 'mathb':
-            url = f"https://mathb-ege.sdamgia.ru/problem?id={problem_id}"
-        else:
-            url = f"https://{subject_code}-ege.sdamgia.ru/problem?id={problem_id}"
-        
-        print(f"  Загрузка с {url}")
+        url = get_problem_url(subject_code, problem_id)
         
-        # Скачиваем страницу
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
+        log.debug(f"[{problem_id}] Загрузка с {url}")
         
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Находим блок задачи
-        prob_div = soup.find('div', {'class': 'prob_maindiv'})
+        # Скачиваем страницу (один раз на задачу) и находим блок задачи
+        prob_div = ctx.prob_node(url, backend)
         if not prob_div:
-            print(f"  ERROR: Не найден блок задачи")
+            log.error(f"[{problem_id}] Не найден блок задачи", extra={'problem_id': problem_id})
             return False
         
-        # Находим блоки с текстом
-        pbody_blocks = prob_div.find_all('div', {'class': 'pbody'})
-        
-        if len(pbody_blocks) == 0:
-            print(f"  ERROR: Нет блоков pbody")
+        data = extract_problem(prob_div, subject_code, problem_id, images_dir, image_saver=ctx.save_image)
+        if isinstance(data, str):
+            log.error(f"[{problem_id}] {data}", extra={'problem_id': problem_id})
             return False
         
-        # Парсим условие
-        condition = parse_html_block(pbody_blocks[0], subject_code, problem_id, 'condition', images_dir)
-        
-        # Парсим решение (если есть)
-        solution = ''
-        if len(pbody_blocks) > 1:
-            solution = parse_html_block(pbody_blocks[1], subject_code, problem_id, 'solution', images_dir)
-        
-        # Получаем ответ
-        answer = ''
-        answer_div = prob_div.find('div', {'class': 'answer'})
-        if answer_div:
-            answer_text = answer_div.get_text().strip()
-            # Убираем "Ответ:" или "Ответ" в начале
-            if answer_text.lower().startswith('ответ'):
-                answer_text = answer_text[5:].lstrip()  # "Ответ" = 5 символов
-                # Убираем двоеточие если есть
-                if answer_text.startswith(':'):
-                    answer_text = answer_text[1:].lstrip()
-            answer = answer_text.strip()
-        
-        # Если ответ не найден в отдельном блоке, пытаемся извлечь из решения
-        if not answer and len(pbody_blocks) > 1:
-            solution_text_raw = pbody_blocks[1].get_text()
-            if 'Ответ:' in solution_text_raw or 'Ответ ' in solution_text_raw:
-                # Ищем "Ответ:" или "Ответ " в тексте
-                import re
-                answer_match = re.search(r'Ответ[:\s]+([^\n\.]+)', solution_text_raw, re.IGNORECASE)
-                if answer_match:
-                    answer = answer_match.group(1).strip().rstrip('.')
-        
-        # Получаем номер темы (задания)
-        topic_number = None
-        topic_name = None
-        nums_span = prob_div.find('span', {'class': 'prob_nums'})
-        if nums_span:
-            nums_text = nums_span.get_text().strip()
-            # Извлекаем номер темы (например "Тип 4 № 506304" -> "4")
-            parts = nums_text.split()
-            # Ищем "Тип" и берем следующее число
-            for i, part in enumerate(parts):
-                if part == 'Тип' and i + 1 < len(parts):
-                    # Берем следующее слово (номер темы)
-                    next_part = parts[i + 1]
-                    # Убираем символы, оставляем только цифры
-                    topic_number = ''.join(c for c in next_part if c.isdigit())
-                    if topic_number:
-                        break
-        
-        # Получаем аналогичные задачи
-        analogs = []
-        minor_div = prob_div.find('div', {'class': 'minor'})
-        if minor_div:
-            analog_links = minor_div.find_all('a')
-            for link in analog_links:
-                link_text = link.get_text().strip()
-                if link_text and link_text != 'Все' and link_text.isdigit():
-                    analogs.append(link_text)
-        
         # Сохраняем в БД
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        
-        # Создаем предмет если нужно
-        names = {'mathb': 'Математика (База)', 'bio': 'Биология', 'math': 'Математика (Профиль)',
-                 'rus': 'Русский язык', 'phys': 'Физика', 'inf': 'Информатика', 'chem': 'Химия',
-                 'geo': 'География', 'soc': 'Обществознание', 'hist': 'История', 'lit': 'Литература',
-                 'en': 'Английский', 'de': 'Немецкий', 'fr': 'Французский', 'sp': 'Испанский'}
-        cursor.execute("INSERT OR IGNORE INTO subjects (code, name, exam_type) VALUES (?, ?, ?)",
-                       (subject_code, names.get(subject_code, subject_code), exam_type))
-        conn.commit()
+        _store_problem(conn, db_path, subject_code, exam_type, problem_id, url, data)
         
-        cursor.execute("SELECT id FROM subjects WHERE code = ? AND exam_type = ?", (subject_code, exam_type))
-        subject_id = cursor.fetchone()[0]
-        
-        # Создаем или находим тему
-        topic_id = None
-        if topic_number:
-            # Проверяем, существует ли тема
-            cursor.execute("SELECT id, topic_name FROM topics WHERE subject_id = ? AND topic_number = ?",
-                          (subject_id, topic_number))
-            topic_row = cursor.fetchone()
-            
-            if topic_row:
-                topic_id = topic_row[0]
-                if not topic_name:
-                    topic_name = topic_row[1]
-            else:
-                # Создаем новую тему
-                if not topic_name:
-                    topic_name = f'Задание {topic_number}'
-                cursor.execute("""
-                    INSERT INTO topics (subject_id, topic_number, topic_name, topic_line)
-                    VALUES (?, ?, ?, ?)
-                """, (subject_id, topic_number, topic_name, topic_number))
-                topic_id = cursor.lastrowid
-                conn.commit()
-        
-        # Сохраняем задачу
-        cursor.execute("""
-            INSERT OR REPLACE INTO problems 
-            (subject_id, topic_id, problem_id, line, condition_text, solution_text, answer, url, source)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'sdamgia')
-        """, (subject_id, topic_id, problem_id, topic_number, condition, solution, answer, url))
-        
-        problem_db_id = cursor.lastrowid
-        
-        # Сохраняем аналогичные задачи
-        if analogs:
-            for analog_id in analogs:
-                # Находим ID аналогичной задачи в БД (если она уже загружена)
-                cursor.execute("SELECT id FROM problems WHERE subject_id = ? AND problem_id = ?",
-                              (subject_id, analog_id))
-                analog_row = cursor.fetchone()
-                
-                if analog_row:
-                    analog_db_id = analog_row[0]
-                    # Сохраняем связь (в обе стороны)
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id)
-                        VALUES (?, ?)
-                    """, (problem_db_id, analog_db_id))
-                    cursor.execute("""
-                        INSERT OR IGNORE INTO problem_analogs (problem_id, analog_problem_id)
-                        VALUES (?, ?)
-                    """, (analog_db_id, problem_db_id))
-        
-        # Связываем задачу с категориями темы (если категории уже загружены)
-        if topic_id:
-            cursor.execute("""
-                SELECT id FROM categories WHERE topic_id = ?
-            """, (topic_id,))
-            category_rows = cursor.fetchall()
-            
-            for cat_row in category_rows:
-                cat_db_id = cat_row[0]
-                cursor.execute("""
-                    INSERT OR IGNORE INTO category_problems (category_id, problem_id)
-                    VALUES (?, ?)
-                """, (cat_db_id, problem_db_id))
-        
-        conn.commit()
-        conn.close()
-        
-        img_count = condition.count('![img](') + solution.count('![img](')
-        analogs_count = len(analogs)
-        print(f"  OK: Сохранена (изображений: {img_count}, аналогичных: {analogs_count})")
+        log.debug(f"[{problem_id}] Сохранена ({problem_summary(data)}, запросов: {ctx.requests})",
+                  extra={'problem_id': problem_id, 'requests': ctx.requests})
         return True
         
     except Exception as e:
-        print(f"  ERROR: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"[{problem_id}] {e}", extra={'problem_id': problem_id})
         return False
 
 
+@run_metrics.timed('problem')
+def refresh_problem(problem_id: str, subject_code: str, exam_type: str, db_path: Path, images_dir: Path,
+                    known_hash: str = None, backend: str = None, conn=None):
+    """
+    Перепроверяет загруженную задачу (--refresh): страница запрашивается условно,
+    в БД задача пишется, только если хэш содержимого отличается от known_hash
+    (conn - как в load_problem)
+    """
+    with ProblemFetchContext(images_dir, max_age=0) as ctx:
+        try:
+            url = get_problem_url(subject_code, problem_id)
+            try:
+                prob_div = ctx.prob_node(url, backend)
+            except GoneError:
+                prob_div = None
+            if not prob_div:
+                log.warning(f"[{problem_id}] Задача удалена с сайта", extra={'problem_id': problem_id})
+                refresh_stats.add(REMOVED, problem_id)
+                return True
+            
+            data = extract_problem(prob_div, subject_code, problem_id, images_dir, image_saver=ctx.save_image)
+            if isinstance(data, str):
+                log.error(f"[{problem_id}] {data}", extra={'problem_id': problem_id})
+                return False
+            if ctx.image_errors:
+                # Без части изображений хэш изменится, а сохраненная версия полнее - оставляем ее
+                log.error(f"[{problem_id}] Не скачаны изображения: {ctx.image_errors}, задача не обновлена",
+                          extra={'problem_id': problem_id})
+                return False
+            
+            if problem_content_hash(data['condition'], data['solution'], data['answer']) == known_hash:
+                log.debug(f"[{problem_id}] Без изменений (запросов: {ctx.requests})",
+                          extra={'problem_id': problem_id, 'requests': ctx.requests})
+                refresh_stats.add(UNCHANGED)
+                return True
+            
+            _store_problem(conn, db_path, subject_code, exam_type, problem_id, url, data)
+            
+            log.debug(f"[{problem_id}] Обновлена ({problem_summary(data)}, запросов: {ctx.requests})",
+                      extra={'problem_id': problem_id, 'requests': ctx.requests})
+            refresh_stats.add(CHANGED)
+            return True
+            
+        except Exception as e:
+            log.exception(f"[{problem_id}] {e}", extra={'problem_id': problem_id})
+            return False
+
+
+def problem_summary(data: dict) -> str:
+    img_count = data['condition'].count('![img](') + data['solution'].count('![img](')
+    return f"изображений: {img_count}, аналогичных: {len(data['analogs'])}"
+
+
 def main():
+    # Конвейер сам импортирует этот модуль (extract_problem, save_problem)
+    from ingest_pipeline import IngestPipeline, add_pipeline_arguments
+    
     parser = argparse.ArgumentParser(description='Полная загрузка задач из СДАМ ГИА со всеми данными')
     parser.add_argument('--subject', required=True, help='Код предмета (mathb, bio, math и т.д.)')
     parser.add_argument('--exam-type', default='oge', choices=['oge', 'ege'], help='Тип экзамена')
-    parser.add_argument('--ids', required=True, help='ID задач через запятую (например: "506304,4612")')
+    parser.add_argument('--ids', help='ID задач через запятую (например: "506304,4612"); '
+                                      'с --refresh по умолчанию - все загруженные задачи предмета')
+    parser.add_argument('--refresh', action='store_true',
+                        help='Перепроверить задачи (условными запросами) и переписать только изменившиеся')
     parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
     parser.add_argument('--images-dir', default='../image_tasksdb', help='Папка для изображений')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Сколько задач загружать одновременно (1 = последовательно)')
+    parser.add_argument('--per-host', type=int, default=4,
+                        help='Максимум одновременных задач на один хост')
+    parser.add_argument('--html-backend', default=DEFAULT_BACKEND, choices=BACKENDS,
+                        help='HTML парсер (по умолчанию html.parser или SDAMGIA_HTML_BACKEND)')
+    add_pipeline_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    if not args.ids and not args.refresh:
+        parser.error('укажите --ids (или --refresh для всех загруженных задач)')
+    if args.refresh and args.pipeline:
+        parser.error('--refresh не поддерживается вместе с --pipeline')
+    setup_logging(args)
     
     script_dir = Path(__file__).parent
     db_path = script_dir / args.db
     images_dir = script_dir / args.images_dir
     
-    print(f"\nЗагрузка {args.subject} ({args.exam_type.upper()})")
-    print("=" * 60)
+    conn = connect(db_path)
+    ensure_content_hash_schema(conn)
+    ensure_analog_schema(conn)
+    ensure_category_schema(conn)
+    hashes = stored_hashes(conn, args.subject, args.exam_type) if args.refresh else {}
+    conn.close()
     
-    problem_ids = [pid.strip() for pid in args.ids.split(',')]
+    if args.ids:
+        problem_ids = [pid.strip() for pid in args.ids.split(',')]
+    else:
+        problem_ids = list(hashes)
+    
+    if args.refresh:
+        log.info(f"Обновление {args.subject} ({args.exam_type.upper()}): {len(problem_ids)} задач")
+        
+        def load(problem_id):
+            return refresh_problem(problem_id, args.subject, args.exam_type, db_path, images_dir,
+                                   hashes.get(problem_id), args.html_backend)
+    else:
+        log.info(f"Загрузка {args.subject} ({args.exam_type.upper()})")
+        
+        def load(problem_id):
+            return load_problem(problem_id, args.subject, args.exam_type, db_path, images_dir, args.html_backend)
+    
+    job_errors = 0
+    with Progress(len(problem_ids), 'Задачи') as progress:
+        if args.pipeline:
+            # Конвейер: страницы и изображения в потоках, разбор в процессах, запись одним писателем
+            pipeline = IngestPipeline(args.subject, args.exam_type, db_path, images_dir, args.html_backend,
+                                      io_workers=args.io_workers, parse_workers=args.parse_workers,
+                                      max_pages=args.max_pages, batch_size=args.batch_size,
+                                      batch_seconds=args.batch_seconds)
+            pipeline.run(problem_ids, on_done=lambda problem_id, ok: progress.advance(ok))
+        elif args.concurrency > 1:
+            # Асинхронная загрузка: несколько задач (страница + изображения) одновременно
+            engine = CrawlEngine(concurrency=args.concurrency, per_host=args.per_host)
+            engine.run(
+                ((urlparse(get_problem_url(args.subject, problem_id)).netloc, load, (problem_id,))
+                 for problem_id in problem_ids),
+                on_done=progress.advance
+            )
+            job_errors = engine.errors
+        else:
+            for problem_id in problem_ids:
+                progress.advance(load(problem_id))
     
-    for problem_id in problem_ids:
-        print(f"\n[{problem_id}]")
-        load_problem(problem_id, args.subject, args.exam_type, db_path, images_dir)
-        time.sleep(0.5)
+    if args.pipeline:
+        log.info(pipeline.summary())
+    if args.refresh:
+        log.info(refresh_stats.summary())
     
-    print("\n" + "=" * 60)
-    print("Готово!\n")
+    # Связи аналогов и категорий - одним запросом на весь запуск (в том числе с задачами прошлых запусков)
+    conn = connect(db_path)
+    log.info("Связей аналогов добавлено: {}, удалено лишних: {}".format(*resolve_analogs(conn)))
+    log.info("Связей с категориями добавлено: {}, удалено лишних: {}".format(*link_categories(conn)))
+    conn.close()
+    log.info(run_request_stats.summary())
+    write_run_report(args, 'load_html_parser')
+    if job_errors:
+        # Задания, упавшие с исключением, - сбой запуска, как и исключение при последовательной загрузке
+        sys.exit(1)
 
 
 if __name__ == '__main__':
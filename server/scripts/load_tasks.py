@@ -13,26 +13,46 @@
 import sys
 import os
 import sqlite3
-import requests
 import argparse
 from datetime import datetime
 from pathlib import Path
 from urllib.parse import urlparse
-import time
 
 # Добавляем путь к sdamgia-api
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdamgia-api'))
+sys.path.insert(0, os.path.dirname(__file__))
 
 from sdamgia import SdamGIA
+from rate_limiter import api_host
+from http_client import use_base_url
+from http_cache import cached_call
+from fetch_context import ProblemFetchContext, run_request_stats
+from image_store import get_image_store, ensure_schema
+from category_index import ensure_schema as ensure_category_schema, record_category, link_categories
+from id_cache import IdCache
+from crawl_journal import CrawlJournal
+from known_problems import KnownProblems
+from catalog_service import get_catalog
+from bulk_ingest import connect_for_ingest, add_bulk_arguments, DEFAULT_BATCH_SIZE, DEFAULT_BATCH_SECONDS
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+log = get_logger(__name__)
 
 
 class TasksLoader:
-    def __init__(self, db_path: str, images_dir: str):
+    def __init__(self, db_path: str, images_dir: str, bulk: bool = False,
+                 batch_size: int = DEFAULT_BATCH_SIZE, batch_seconds: float = DEFAULT_BATCH_SECONDS):
         self.db_path = db_path
+        self.bulk = bulk
+        self.batch_size = batch_size
+        self.batch_seconds = batch_seconds
         self.images_dir = Path(images_dir)
         self.images_dir.mkdir(parents=True, exist_ok=True)
-        self.sdamgia = SdamGIA()
+        self.sdamgia = use_base_url(SdamGIA())
         self.conn = None
+        self.ids = None
+        self.known = None
         
         # Маппинг предметов
         self.subject_names = {
@@ -55,82 +75,42 @@ class TasksLoader:
     
     def connect(self):
         """Подключение к базе данных"""
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = connect_for_ingest(self.db_path, self.bulk, self.batch_size, self.batch_seconds)
         self.conn.row_factory = sqlite3.Row
-        print(f"OK Подключено к БД: {self.db_path}")
+        ensure_schema(self.conn)
+        ensure_category_schema(self.conn)
+        self.ids = IdCache(self.conn)
+        self.ids.warm()
+        log.info(f"Подключено к БД: {self.db_path}")
+        if self.bulk:
+            log.info(f"Пакетная запись: по {self.batch_size} задач или {self.batch_seconds:g} с")
     
     def close(self):
         """Закрытие соединения с БД"""
         if self.conn:
             self.conn.close()
-            print("OK Соединение с БД закрыто")
+            log.info(self.conn.summary())
+            log.info(self.ids.summary())
+            log.debug("Соединение с БД закрыто")
     
     def get_or_create_subject(self, code: str, exam_type: str = 'oge') -> int:
         """Получить или создать предмет"""
-        cursor = self.conn.cursor()
-        
-        # Проверяем, существует ли предмет
-        cursor.execute(
-            "SELECT id FROM subjects WHERE code = ? AND exam_type = ?",
-            (code, exam_type)
-        )
-        row = cursor.fetchone()
-        
-        if row:
-            return row[0]
-        
-        # Создаем новый предмет
         name = self.subject_names.get(code, code.upper())
-        cursor.execute(
-            "INSERT INTO subjects (code, name, exam_type) VALUES (?, ?, ?)",
-            (code, name, exam_type)
-        )
-        self.conn.commit()
-        return cursor.lastrowid
+        return self.ids.subject(code, exam_type, name)
     
     def get_or_create_topic(self, subject_id: int, topic_number: str, topic_name: str, topic_line: str = None) -> int:
         """Получить или создать тему"""
-        cursor = self.conn.cursor()
-        
-        # Проверяем, существует ли тема
-        cursor.execute(
-            "SELECT id FROM topics WHERE subject_id = ? AND topic_number = ?",
-            (subject_id, topic_number)
-        )
-        row = cursor.fetchone()
-        
-        if row:
-            return row[0]
-        
-        # Создаем новую тему
-        cursor.execute(
-            "INSERT INTO topics (subject_id, topic_number, topic_name, topic_line) VALUES (?, ?, ?, ?)",
-            (subject_id, topic_number, topic_name, topic_line)
-        )
-        self.conn.commit()
-        return cursor.lastrowid
+        return self.ids.topic(subject_id, topic_number, topic_name, topic_line)
     
     def get_or_create_category(self, topic_id: int, category_id: str, category_name: str) -> int:
         """Получить или создать категорию"""
-        cursor = self.conn.cursor()
-        
-        # Проверяем, существует ли категория
-        cursor.execute(
-            "SELECT id FROM categories WHERE topic_id = ? AND category_id = ?",
-            (topic_id, category_id)
-        )
-        row = cursor.fetchone()
-        
-        if row:
-            return row[0]
-        
-        # Создаем новую категорию
-        cursor.execute(
-            "INSERT INTO categories (topic_id, category_id, category_name) VALUES (?, ?, ?)",
-            (topic_id, category_id, category_name)
-        )
+        return self.ids.category(topic_id, category_id, category_name)
+    
+    def record_category(self, subject_code: str, exam_type: str, category_id: str, problem_ids: list):
+        """Запомнить состав категории (все задачи из get_category_by_id, не только выбранные для загрузки)"""
+        subject_id = self.get_or_create_subject(subject_code, exam_type)
+        record_category(self.conn.cursor(), subject_id, category_id, problem_ids)
         self.conn.commit()
-        return cursor.lastrowid
     
     def problem_exists(self, subject_id: int, problem_id: str) -> bool:
         """Проверить, существует ли задача в БД"""
@@ -141,7 +121,8 @@ class TasksLoader:
         )
         return cursor.fetchone() is not None
     
-    def extract_text_with_images(self, url: str, subject_code: str, problem_id: str, block_type: str) -> str:
+    def extract_text_with_images(self, url: str, subject_code: str, problem_id: str, block_type: str,
+                                 ctx: ProblemFetchContext = None) -> str:
         """
         Парсит HTML страницы и извлекает текст с изображениями в правильном порядке
         
@@ -150,21 +131,16 @@ class TasksLoader:
             subject_code: Код предмета
             problem_id: ID задачи
             block_type: 'condition' или 'solution'
+            ctx: Контекст задачи (страница скачивается один раз для условия и решения)
         
         Returns:
             Текст с markdown изображениями в правильных позициях
         """
         try:
-            from bs4 import BeautifulSoup
-            
-            # Скачиваем страницу
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
+            ctx = ctx or ProblemFetchContext(self.images_dir)
             
             # Находим блок с заданием
-            prob_div = soup.find('div', {'class': 'prob_maindiv'})
+            prob_div = ctx.prob_div(url)
             if not prob_div:
                 return ''
             
@@ -199,16 +175,12 @@ class TasksLoader:
                             img_url = base_url + img_url
                         
                         # Скачиваем изображение
-                        img_path = self.download_image(img_url, subject_code, problem_id, block_type, img_counter)
+                        img_path, _ = self.download_image(img_url, subject_code, problem_id, block_type, img_counter, ctx)
                         
                         if img_path:
-                            # Формируем markdown для изображения
-                            # Путь относительно server/
-                            api_url = f'/tasks/images/{subject_code}/{problem_id}/{block_type}_{img_counter}'
-                            
-                            # Определяем расширение
-                            ext = Path(img_path).suffix
-                            result.append(f'![img](http://localhost:3001{api_url}{ext})')
+                            # Формируем markdown для изображения (путь без префикса image_tasksdb/)
+                            api_url = '/tasks/images/' + img_path[len('image_tasksdb/'):]
+                            result.append(f'![img](http://localhost:3001{api_url})')
                             img_counter += 1
                 
                 # Переносы строк
@@ -224,62 +196,59 @@ class TasksLoader:
             return text
             
         except Exception as e:
-            print(f"  WARNING Ошибка парсинга HTML для {block_type}: {e}")
+            log.warning(f"[{problem_id}] Ошибка парсинга HTML для {block_type}: {e}", extra={'problem_id': problem_id})
             return ''
     
-    def download_image(self, url: str, subject_code: str, problem_id: str, image_type: str, index: int) -> str:
+    def download_image(self, url: str, subject_code: str, problem_id: str, image_type: str, index: int,
+                       ctx: ProblemFetchContext = None):
         """
-        Скачать изображение и сохранить в локальную папку
+        Скачать изображение в хранилище (уже известные URL повторно не скачиваются,
+        в рамках задачи одно изображение запрашивается один раз)
         
         Returns:
-            Относительный путь к сохраненному изображению
+            (относительный путь от папки server, хэш файла) или (None, None)
         """
         try:
-            # Скачиваем изображение сначала, чтобы определить реальный тип
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            # Определяем тип файла по содержимому
-            content = response.content
-            content_type = response.headers.get('content-type', '')
-            
-            # Определяем расширение по содержимому или заголовкам
-            if content[:4] == b'<?xml' or content[:4] == b'<svg' or 'svg' in content_type:
-                ext = '.svg'
-            elif content[:4] == b'\x89PNG':
-                ext = '.png'
-            elif content[:3] == b'\xff\xd8\xff':
-                ext = '.jpg'
-            elif 'svg' in url:
-                ext = '.svg'
-            elif 'png' in url:
-                ext = '.png'
-            elif 'jpg' in url or 'jpeg' in url:
-                ext = '.jpg'
+            if ctx is not None:
+                rel_path, blob_hash = ctx.image(url)
             else:
-                ext = '.svg'  # По умолчанию SVG для СДАМ ГИА
-            
-            # Создаем папку для задачи
-            problem_dir = self.images_dir / subject_code / problem_id
-            problem_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Формируем имя файла
-            filename = f"{image_type}_{index}{ext}"
-            filepath = problem_dir / filename
-            
-            # Сохраняем файл
-            with open(filepath, 'wb') as f:
-                f.write(content)
-            
-            # Возвращаем относительный путь (от папки server)
-            relative_path = f"image_tasksdb/{subject_code}/{problem_id}/{filename}"
-            return relative_path
+                rel_path, blob_hash = get_image_store(self.images_dir).fetch(url)
+            return f"image_tasksdb/{rel_path}", blob_hash
             
         except Exception as e:
-            print(f"  WARNING Ошибка загрузки изображения {url}: {e}")
-            return None
+            log.warning(f"[{problem_id}] Ошибка загрузки изображения {url}: {e}", extra={'problem_id': problem_id})
+            return None, None
     
-    def save_problem(self, subject_code: str, problem_data: dict, exam_type: str = 'oge', category_db_id: int = None):
+    def insert_images(self, cursor, problem_db_id: int, subject_code: str, problem_id: str,
+                      table: str, image_type: str, image_urls: list, ctx: ProblemFetchContext = None):
+        """Скачивает изображения и сохраняет строки изображений одним executemany"""
+        rows = []
+        blob_hashes = {}
+        for idx, img_url in enumerate(image_urls):
+            img_path, blob_hash = self.download_image(img_url, subject_code, problem_id, image_type, idx, ctx)
+            if img_path:
+                rows.append((problem_db_id, img_url, img_path, idx))
+                blob_hashes[idx] = blob_hash
+        
+        if not rows:
+            return
+        
+        cursor.executemany(f"""
+            INSERT INTO {table} 
+            (problem_id, image_url, image_path, image_order)
+            VALUES (?, ?, ?, ?)
+        """, rows)
+        
+        # executemany не возвращает id строк - берем их по порядку изображений
+        cursor.execute(f"SELECT id, image_order FROM {table} WHERE problem_id = ?", (problem_db_id,))
+        cursor.executemany(
+            "INSERT OR REPLACE INTO problem_image_blobs (image_table, image_id, blob_hash) VALUES (?, ?, ?)",
+            [(table, image_id, blob_hashes[order]) for image_id, order in cursor.fetchall() if order in blob_hashes]
+        )
+    
+    @run_metrics.timed('db_write')
+    def save_problem(self, subject_code: str, problem_data: dict, exam_type: str = 'oge', category_db_id: int = None,
+                     ctx: ProblemFetchContext = None):
         """Сохранить задачу в БД"""
         cursor = self.conn.cursor()
         
@@ -289,7 +258,7 @@ class TasksLoader:
             
             # Проверяем, существует ли задача
             if self.problem_exists(subject_id, problem_data['id']):
-                print(f"  SKIP Задача {problem_data['id']} уже существует, пропускаем")
+                log.debug(f"[{problem_data['id']}] Задача уже существует, пропускаем")
                 return False
             
             # Получаем или создаем тему
@@ -327,38 +296,59 @@ class TasksLoader:
                     VALUES (?, ?)
                 """, (category_db_id, problem_db_id))
             
-            # Сохраняем изображения условия
+            # Сохраняем изображения условия и решения
             condition_images = problem_data['condition'].get('images', [])
-            for idx, img_url in enumerate(condition_images):
-                img_path = self.download_image(img_url, subject_code, problem_data['id'], 'condition', idx)
-                if img_path:
-                    cursor.execute("""
-                        INSERT INTO problem_condition_images 
-                        (problem_id, image_url, image_path, image_order)
-                        VALUES (?, ?, ?, ?)
-                    """, (problem_db_id, img_url, img_path, idx))
-            
-            # Сохраняем изображения решения
             solution_images = problem_data['solution'].get('images', [])
-            for idx, img_url in enumerate(solution_images):
-                img_path = self.download_image(img_url, subject_code, problem_data['id'], 'solution', idx)
-                if img_path:
-                    cursor.execute("""
-                        INSERT INTO problem_solution_images 
-                        (problem_id, image_url, image_path, image_order)
-                        VALUES (?, ?, ?, ?)
-                    """, (problem_db_id, img_url, img_path, idx))
+            self.insert_images(cursor, problem_db_id, subject_code, problem_data['id'],
+                               'problem_condition_images', 'condition', condition_images, ctx)
+            self.insert_images(cursor, problem_db_id, subject_code, problem_data['id'],
+                               'problem_solution_images', 'solution', solution_images, ctx)
             
             self.conn.commit()
-            print(f"  OK Задача {problem_data['id']} сохранена (изображений: условие={len(condition_images)}, решение={len(solution_images)})")
+            requests_info = f", запросов: {ctx.requests}" if ctx is not None else ""
+            log.debug(f"[{problem_data['id']}] Задача сохранена (изображений: условие={len(condition_images)}, "
+                      f"решение={len(solution_images)}{requests_info})", extra={'problem_id': problem_data['id']})
             return True
             
         except Exception as e:
-            print(f"  ❌ Ошибка сохранения задачи {problem_data['id']}: {e}")
+            log.error(f"[{problem_data['id']}] Ошибка сохранения задачи: {e}", extra={'problem_id': problem_data['id']})
             self.conn.rollback()
+            self.ids.invalidate()
             return False
     
-    def load_problems_from_catalog(self, subject_code: str, exam_type: str = 'oge', count: int = 30, category_id: str = None):
+    @run_metrics.timed('problem')
+    def load_problem(self, subject_code: str, problem_id: str, exam_type: str = 'oge', category_db_id: int = None) -> bool:
+        """Загрузить одну задачу: данные API и изображения запрашиваются один раз"""
+        with ProblemFetchContext(self.images_dir) as ctx:
+            problem_data = ctx.api('problem', api_host(subject_code), self.sdamgia.get_problem_by_id, subject_code, problem_id)
+            if not problem_data:
+                return False
+            with self.conn.problem():
+                return self.save_problem(subject_code, problem_data, exam_type, category_db_id, ctx)
+    
+    def load_journaled(self, journal: CrawlJournal, subject_code: str, problem_id: str, exam_type: str,
+                       category_id: str, category_db_id: int = None) -> bool:
+        """Загрузить задачу и записать результат в журнал (True - задача добавлена в БД)"""
+        # Задача, которая уже есть в БД, считается выполненной без запроса страницы
+        if self.known is not None and problem_id in self.known:
+            journal.record(category_id, problem_id, True)
+            return False
+        
+        try:
+            loaded = self.load_problem(subject_code, problem_id, exam_type, category_db_id)
+        except Exception as e:
+            journal.record(category_id, problem_id, False, str(e))
+            raise
+        
+        subject_id = self.get_or_create_subject(subject_code, exam_type)
+        exists = loaded or self.problem_exists(subject_id, problem_id)
+        if exists and self.known is not None:
+            self.known.add(problem_id)
+        journal.record(category_id, problem_id, exists)
+        return loaded
+    
+    def load_problems_from_catalog(self, subject_code: str, exam_type: str = 'oge', count: int = 30, category_id: str = None,
+                                   resume: bool = False):
         """
         Загрузить задачи из каталога СДАМ ГИА
         
@@ -367,38 +357,53 @@ class TasksLoader:
             exam_type: Тип экзамена (oge, ege)
             count: Количество задач для загрузки
             category_id: ID категории (опционально, если нужно загрузить из конкретной категории)
+            resume: Продолжить последний незавершенный запуск по журналу загрузки
         """
-        print(f"\nЗагрузка заданий: {subject_code} ({exam_type.upper()})")
-        print(f"   Целевое количество: {count} заданий")
+        log.info(f"Загрузка заданий: {subject_code} ({exam_type.upper()}), целевое количество: {count}")
+        progress = None
         
         try:
             # Получаем каталог
-            print("   Получение каталога...")
-            catalog = self.sdamgia.get_catalog(subject_code)
-            print(f"   Найдено тем в каталоге: {len(catalog)}")
-            
-            loaded_count = 0
+            log.debug("Получение каталога...")
+            catalog = get_catalog(self.sdamgia, subject_code)
+            log.info(f"Найдено тем в каталоге: {len(catalog)}")
+            
+            loader_name = f'load_tasks:{category_id}' if category_id else 'load_tasks'
+            journal = CrawlJournal(self.conn, loader_name, subject_code, exam_type, count, resume)
+            if journal.resumed:
+                log.info(f"Продолжаем запуск {journal.run_id}: {journal.summary()}")
+            loaded_count = journal.done_count()
+            progress = Progress(count, 'Загружено задач', initial=loaded_count)
+            incomplete = False
+            category_db_ids = {}
+            
+            # Уже загруженные задачи предмета (одним запросом) - в план попадают только новые
+            self.known = KnownProblems(self.conn, subject_code, exam_type)
+            log.info(f"Уже в БД: {len(self.known)} задач")
             
             # Если указана категория, загружаем только из неё
             if category_id:
-                print(f"   Загрузка из категории {category_id}...")
-                problem_ids = self.sdamgia.get_category_by_id(subject_code, category_id)
-                print(f"   Найдено задач в категории: {len(problem_ids)}")
+                log.info(f"Загрузка из категории {category_id}...")
+                problem_ids = journal.planned(category_id)
+                if problem_ids is None:
+                    problem_ids = cached_call('category', api_host(subject_code), self.sdamgia.get_category_by_id, subject_code, category_id)
+                    log.info(f"Найдено задач в категории: {len(problem_ids)}")
+                    self.record_category(subject_code, exam_type, category_id, problem_ids)
+                    problem_ids = journal.plan(category_id, self.known.unseen(problem_ids)[:count])
                 
-                for problem_id in problem_ids[:count]:
+                for problem_id in problem_ids:
+                    if loaded_count >= count:
+                        break
+                    if not journal.should_load(category_id, problem_id):
+                        continue
                     try:
-                        time.sleep(0.5)  # Задержка между запросами
-                        print(f"   Загрузка задачи {problem_id}...")
-                        problem_data = self.sdamgia.get_problem_by_id(subject_code, problem_id)
-                        
-                        if problem_data:
-                            if self.save_problem(subject_code, problem_data, exam_type):
-                                loaded_count += 1
-                                
-                            if loaded_count >= count:
-                                break
+                        log.debug(f"[{problem_id}] Загрузка задачи...")
+                        if self.load_journaled(journal, subject_code, problem_id, exam_type, category_id):
+                            loaded_count += 1
+                            progress.advance()
                     except Exception as e:
-                        print(f"   ⚠️  Ошибка загрузки задачи {problem_id}: {e}")
+                        log.warning(f"[{problem_id}] Ошибка загрузки задачи: {e}", extra={'problem_id': problem_id})
+                        progress.error()
                         continue
             else:
                 # Загружаем из всех категорий по порядку
@@ -408,7 +413,7 @@ class TasksLoader:
                     
                     topic_id = topic['topic_id']
                     topic_name = topic['topic_name']
-                    print(f"\n   Тема {topic_id}: {topic_name}")
+                    log.debug(f"Тема {topic_id}: {topic_name}")
                     
                     # Получаем ID предмета и создаем тему в БД
                     subject_id = self.get_or_create_subject(subject_code, exam_type)
@@ -421,43 +426,74 @@ class TasksLoader:
                         
                         cat_id = category['category_id']
                         cat_name = category['category_name']
-                        print(f"      Категория: {cat_name}")
+                        log.debug(f"Категория: {cat_name}")
                         
                         # Создаем категорию в БД
                         category_db_id = self.get_or_create_category(topic_db_id, cat_id, cat_name)
+                        category_db_ids[str(cat_id)] = category_db_id
                         
-                        # Получаем задачи из категории
-                        try:
-                            problem_ids = self.sdamgia.get_category_by_id(subject_code, cat_id)
-                            print(f"         Найдено задач: {len(problem_ids)}")
-                            
+                        # Получаем задачи из категории (если их еще нет в журнале)
+                        problem_ids = journal.planned(cat_id)
+                        if problem_ids is None:
+                            try:
+                                problem_ids = cached_call('category', api_host(subject_code), self.sdamgia.get_category_by_id, subject_code, cat_id)
+                                log.debug(f"Категория {cat_id}: найдено задач: {len(problem_ids)}")
+                                self.record_category(subject_code, exam_type, cat_id, problem_ids)
+                            except Exception as e:
+                                log.warning(f"Ошибка получения задач категории {cat_id}: {e}")
+                                incomplete = True
+                                continue
                             # Загружаем первые несколько задач из категории
-                            for problem_id in problem_ids[:3]:  # По 3 задачи из каждой категории
-                                if loaded_count >= count:
-                                    break
-                                
-                                try:
-                                    time.sleep(0.5)  # Задержка между запросами
-                                    print(f"         Загрузка задачи {problem_id}...")
-                                    problem_data = self.sdamgia.get_problem_by_id(subject_code, problem_id)
-                                    
-                                    if problem_data:
-                                        if self.save_problem(subject_code, problem_data, exam_type, category_db_id):
-                                            loaded_count += 1
-                                        
-                                except Exception as e:
-                                    print(f"         ⚠️  Ошибка загрузки задачи {problem_id}: {e}")
-                                    continue
+                            problem_ids = journal.plan(cat_id, self.known.unseen(problem_ids)[:3])  # По 3 новых задачи из каждой категории
+                        
+                        for problem_id in problem_ids:
+                            if loaded_count >= count:
+                                break
+                            if not journal.should_load(cat_id, problem_id):
+                                continue
+                            
+                            try:
+                                log.debug(f"[{problem_id}] Загрузка задачи...")
+                                if self.load_journaled(journal, subject_code, problem_id, exam_type, cat_id, category_db_id):
+                                    loaded_count += 1
+                                    progress.advance()
                                     
-                        except Exception as e:
-                            print(f"         ⚠️  Ошибка получения задач категории {cat_id}: {e}")
-                            continue
+                            except Exception as e:
+                                log.warning(f"[{problem_id}] Ошибка загрузки задачи: {e}", extra={'problem_id': problem_id})
+                                progress.error()
+                                continue
+            
+            # Повторяем неудачные задачи, пока не кончатся попытки
+            for cat_id, problem_id in journal.retry_items():
+                while loaded_count < count and journal.should_load(cat_id, problem_id):
+                    log.debug(f"[{problem_id}] Повтор задачи...")
+                    try:
+                        if self.load_journaled(journal, subject_code, problem_id, exam_type, cat_id,
+                                               category_db_ids.get(cat_id)):
+                            loaded_count += 1
+                            progress.advance()
+                            break
+                    except Exception as e:
+                        log.warning(f"[{problem_id}] Ошибка загрузки задачи: {e}", extra={'problem_id': problem_id})
+                        progress.error()
+            
+            progress.finish()
+            if incomplete:
+                log.warning("Не все категории получены - продолжить можно с --resume")
+            else:
+                journal.finish()
             
-            print(f"\nЗагрузка завершена! Загружено заданий: {loaded_count}/{count}")
+            log.info(f"Загрузка завершена! Загружено заданий: {loaded_count}/{count}")
+            log.info(f"{journal.summary()}, пропущено уже загруженных: {self.known.skipped}")
+            # Связи задач с категориями по их составу - одним запросом (в том числе для задач прошлых запусков)
+            log.info("Связей с категориями добавлено: {}, удалено лишних: {}".format(*link_categories(self.conn)))
+            log.info(run_request_stats.summary())
             return loaded_count
             
         except Exception as e:
-            print(f"❌ Ошибка загрузки каталога: {e}")
+            if progress is not None:
+                progress.finish()
+            log.error(f"Ошибка загрузки каталога: {e}")
             return 0
 
 
@@ -469,26 +505,25 @@ def main():
     parser.add_argument('--category', help='ID категории (опционально)')
     parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
     parser.add_argument('--images-dir', default='../image_tasksdb', help='Папка для изображений')
+    parser.add_argument('--resume', action='store_true',
+                        help='Продолжить последний незавершенный запуск по журналу загрузки')
+    add_bulk_arguments(parser)
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    setup_logging(args)
     
     # Определяем пути относительно скрипта
     script_dir = Path(__file__).parent
     db_path = script_dir / args.db
     images_dir = script_dir / args.images_dir
     
-    print("=" * 60)
-    print("ЗАГРУЗКА ЗАДАНИЙ ИЗ СДАМ ГИА")
-    print("=" * 60)
-    print(f"Предмет: {args.subject}")
-    print(f"Тип экзамена: {args.exam_type.upper()}")
-    print(f"Количество: {args.count}")
-    print(f"БД: {db_path}")
-    print(f"Папка изображений: {images_dir}")
-    print("=" * 60)
+    log.info(f"Загрузка заданий из СДАМ ГИА: {args.subject} ({args.exam_type.upper()}), количество: {args.count}")
+    log.info(f"БД: {db_path}, папка изображений: {images_dir}")
     
     # Создаем загрузчик
-    loader = TasksLoader(str(db_path), str(images_dir))
+    loader = TasksLoader(str(db_path), str(images_dir), args.bulk, args.batch_size, args.batch_seconds)
     
     try:
         loader.connect()
@@ -496,12 +531,13 @@ def main():
             args.subject,
             args.exam_type,
             args.count,
-            args.category
+            args.category,
+            args.resume
         )
     finally:
         loader.close()
     
-    print("\nГотово!")
+    write_run_report(args, 'load_tasks')
 
 
 if __name__ == '__main__':
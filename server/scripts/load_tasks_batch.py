@@ -7,7 +7,7 @@
 
 import sys
 import os
-import time
+import argparse
 from pathlib import Path
 
 # Добавляем путь к sdamgia-api
@@ -15,9 +15,25 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdamgia-api'))
 
 # Используем HTML парсер для сохранения структуры
 sys.path.insert(0, os.path.dirname(__file__))
-from load_html_parser import load_problem, load_catalog
+from load_html_parser import load_problem, get_or_create_subject
+from rate_limiter import api_host
+from http_client import use_base_url
+from http_cache import cached_call
+from sqlite_conn import connect
+from crawl_journal import CrawlJournal
+from content_hash import ensure_schema as ensure_content_hash_schema
+from analog_links import ensure_schema as ensure_analog_schema, resolve_analogs
+from category_index import ensure_schema as ensure_category_schema, record_category, link_categories
+from known_problems import KnownProblems
+from id_cache import IdCache
+from catalog_service import get_catalog
+from run_metrics import add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
 
-def load_tasks_from_different_lines(subject_code: str, exam_type: str, count: int, db_path: str, images_dir: str):
+log = get_logger(__name__)
+
+def load_tasks_from_different_lines(subject_code: str, exam_type: str, count: int, db_path: str, images_dir: str,
+                                    resume: bool = False):
     """
     Загружает задания из разных линий (тем) используя HTML парсинг
     Сохраняет HTML структуру с переносами строк и правильными размерами изображений
@@ -28,29 +44,69 @@ def load_tasks_from_different_lines(subject_code: str, exam_type: str, count: in
         count: Количество заданий для загрузки
         db_path: Путь к БД
         images_dir: Папка для изображений
+        resume: Продолжить последний незавершенный запуск по журналу
     """
-    print(f"\n{'='*60}")
-    print(f"ЗАГРУЗКА ЗАДАНИЙ: {subject_code.upper()} ({exam_type.upper()})")
-    print(f"Целевое количество: {count} заданий из разных линий")
-    print(f"Используется HTML парсинг для сохранения структуры")
-    print(f"{'='*60}\n")
+    log.info(f"Загрузка заданий: {subject_code.upper()} ({exam_type.upper()}), "
+             f"целевое количество: {count} заданий из разных линий (HTML парсинг)")
     
     db_path_obj = Path(db_path)
     images_dir_obj = Path(images_dir)
+    conn = connect(db_path_obj, ingest=True)
+    ensure_content_hash_schema(conn)
+    ensure_analog_schema(conn)
+    ensure_category_schema(conn)
+    subject_id = get_or_create_subject(conn, subject_code, exam_type)
+    progress = None
     
     try:
-        # Загружаем каталог
-        print("Загрузка каталога...")
-        catalog = load_catalog(subject_code, exam_type, db_path_obj)
-        print(f"Каталог загружен: {len(catalog)} тем\n")
+        journal = CrawlJournal(conn, 'load_tasks_batch', subject_code, exam_type, count, resume)
+        if journal.resumed:
+            log.info(f"Продолжаем запуск {journal.run_id}: {journal.summary()}")
+        
+        # Уже загруженные задачи предмета (одним запросом) - в план попадают только новые
+        known = KnownProblems(conn, subject_code, exam_type)
+        log.info(f"Уже в БД: {len(known)} задач")
+        
+        def load_journaled(cat_id, problem_id) -> bool:
+            """Загружает задачу и записывает результат в журнал"""
+            if problem_id in known:
+                journal.record(cat_id, problem_id, True)
+                return False
+            try:
+                # Используем HTML парсер для сохранения структуры (через соединение запуска)
+                ok = load_problem(problem_id, subject_code, exam_type, db_path_obj, images_dir_obj, conn=conn)
+            except Exception as e:
+                log.warning(f"[{problem_id}] Ошибка загрузки задачи: {e}", extra={'problem_id': problem_id})
+                journal.record(cat_id, problem_id, False, str(e))
+                progress.error()
+                return False
+            journal.record(cat_id, problem_id, ok)
+            if ok:
+                known.add(problem_id)
+                progress.advance()
+            else:
+                progress.error()
+            return ok
         
         # Получаем список всех категорий из каталога
+        log.debug("Загрузка каталога...")
         from sdamgia import SdamGIA
-        sdamgia = SdamGIA()
-        catalog_data = sdamgia.get_catalog(subject_code)
+        sdamgia = use_base_url(SdamGIA())
+        catalog_data = get_catalog(sdamgia, subject_code)
+        log.info(f"Каталог загружен: {len(catalog_data)} тем")
+        
+        # Темы и категории каталога - в БД (link_categories связывает задачи только с существующими категориями)
+        ids = IdCache(conn)
+        for topic in catalog_data:
+            topic_db_id = ids.topic(subject_id, topic['topic_id'], topic['topic_name'], topic['topic_id'])
+            for category in topic.get('categories', []):
+                ids.category(topic_db_id, category['category_id'], category['category_name'])
+        log.debug(ids.summary())
         
-        loaded_count = 0
+        loaded_count = journal.done_count()
+        progress = Progress(count, f'{subject_code}: загружено задач', initial=loaded_count)
         tasks_per_topic = max(1, count // len(catalog_data)) if catalog_data else 5
+        incomplete = False
         
         # Проходим по всем темам для разнообразия линий
         for topic_idx, topic in enumerate(catalog_data):
@@ -59,7 +115,7 @@ def load_tasks_from_different_lines(subject_code: str, exam_type: str, count: in
             
             topic_id = topic['topic_id']
             topic_name = topic['topic_name']
-            print(f"\nТема {topic_idx + 1}/{len(catalog_data)}: {topic_id} - {topic_name}")
+            log.debug(f"Тема {topic_idx + 1}/{len(catalog_data)}: {topic_id} - {topic_name}")
             
             # Определяем, сколько задач нужно загрузить из этой темы
             remaining = count - loaded_count
@@ -73,81 +129,108 @@ def load_tasks_from_different_lines(subject_code: str, exam_type: str, count: in
                 cat_id = category['category_id']
                 cat_name = category['category_name']
                 
-                # Получаем задачи из категории
-                try:
-                    problem_ids = sdamgia.get_category_by_id(subject_code, cat_id)
+                # План категории берем из журнала, иначе получаем задачи из категории
+                problem_ids = journal.planned(cat_id)
+                if problem_ids is None:
+                    try:
+                        problem_ids = cached_call('category', api_host(subject_code), sdamgia.get_category_by_id, subject_code, cat_id)
+                    except Exception as e:
+                        log.warning(f"Ошибка получения задач категории {cat_id}: {e}")
+                        incomplete = True
+                        continue
+                    
+                    # Список задач категории запоминается весь, в том числе задачи, которые не будут загружены
+                    record_category(conn.cursor(), subject_id, cat_id, problem_ids)
+                    conn.commit()
+                    
+                    # Загружаем из категории только задачи, которых еще нет в БД
+                    found = len(problem_ids or [])
+                    problem_ids = known.unseen(problem_ids or [])
+                    new = len(problem_ids)
+                    problems_to_load = min(10, new, count - loaded_count)
+                    problem_ids = journal.plan(cat_id, problem_ids[:problems_to_load])
                     
                     if not problem_ids:
                         continue
                     
-                    # Загружаем задачи из категории
-                    problems_to_load = min(10, len(problem_ids), count - loaded_count)
-                    
-                    print(f"  Категория: {cat_name} (найдено задач: {len(problem_ids)}, загружаем: {problems_to_load})")
+                    log.debug(f"Категория: {cat_name} (найдено задач: {found}, новых: {new}, загружаем: {problems_to_load})")
+                else:
+                    log.debug(f"Категория: {cat_name} (из журнала: {len(problem_ids)})")
+                
+                for problem_id in problem_ids:
+                    if loaded_count >= count:
+                        break
+                    if not journal.should_load(cat_id, problem_id):
+                        continue
                     
-                    for problem_id in problem_ids[:problems_to_load]:
-                        if loaded_count >= count:
-                            break
-                        
-                        try:
-                            time.sleep(0.5)  # Задержка между запросами
-                            
-                            # Используем HTML парсер для сохранения структуры
-                            if load_problem(problem_id, subject_code, exam_type, db_path_obj, images_dir_obj, catalog):
-                                loaded_count += 1
-                                if loaded_count % 10 == 0:
-                                    print(f"    Загружено: {loaded_count}/{count}")
-                                    
-                        except Exception as e:
-                            print(f"    ⚠️  Ошибка загрузки задачи {problem_id}: {e}")
-                            continue
-                            
-                except Exception as e:
-                    print(f"  ⚠️  Ошибка получения задач категории {cat_id}: {e}")
-                    continue
+                    if load_journaled(cat_id, problem_id):
+                        loaded_count += 1
+        
+        # Повторяем неудачные задачи, пока не кончатся попытки
+        for cat_id, problem_id in journal.retry_items():
+            while loaded_count < count and journal.should_load(cat_id, problem_id):
+                log.debug(f"[{problem_id}] Повтор задачи")
+                if load_journaled(cat_id, problem_id):
+                    loaded_count += 1
+                    break
+        
+        progress.finish()
+        if incomplete:
+            log.warning("Не все категории получены - продолжить можно с --resume")
+        else:
+            journal.finish()
         
-        print(f"\n{'='*60}")
-        print(f"Загрузка завершена!")
-        print(f"Загружено заданий: {loaded_count}/{count}")
-        print(f"{'='*60}\n")
+        log.info(f"Загрузка завершена! Загружено заданий: {loaded_count}/{count}")
+        log.info(f"{journal.summary()}, пропущено уже загруженных: {known.skipped}")
+        
+        # Связи аналогов всех задач запуска (и ранее загруженных) - одним запросом
+        log.info("Связей аналогов добавлено: {}, удалено лишних: {}".format(*resolve_analogs(conn)))
+        log.info("Связей с категориями добавлено: {}, удалено лишних: {}".format(*link_categories(conn)))
+        linked_total = conn.execute(
+            "SELECT COUNT(*) FROM category_problems cp JOIN problems p ON p.id = cp.problem_id WHERE p.subject_id = ?",
+            (subject_id,)
+        ).fetchone()[0]
+        if loaded_count and not linked_total:
+            log.warning("Задачи предмета не связаны ни с одной категорией - проверьте темы и категории каталога")
         
         return loaded_count
         
     except Exception as e:
-        print(f"❌ Критическая ошибка: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception(f"Критическая ошибка: {e}")
         return 0
+    finally:
+        if progress is not None:
+            progress.finish()
+        conn.close()
 
 
 def main():
     """Основная функция"""
+    parser = argparse.ArgumentParser(description='Массовая загрузка заданий из разных линий')
+    parser.add_argument('--resume', action='store_true',
+                        help='Продолжить последний незавершенный запуск по журналу загрузки')
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
+    args = parser.parse_args()
+    setup_logging(args)
+    
     script_dir = Path(__file__).parent
     db_path = str(script_dir / '../tasksbd.db')
     images_dir = str(script_dir / '../image_tasksdb')
     
-    print("=" * 60)
-    print("МАССОВАЯ ЗАГРУЗКА ЗАДАНИЙ ИЗ РАЗНЫХ ЛИНИЙ")
-    print("=" * 60)
-    print(f"БД: {db_path}")
-    print(f"Папка изображений: {images_dir}")
-    print("=" * 60)
+    log.info("Массовая загрузка заданий из разных линий")
+    log.info(f"БД: {db_path}, папка изображений: {images_dir}")
     
     # Загружаем биологию ОГЭ - 300 заданий
-    print("\n" + "="*60)
-    print("ШАГ 1: Загрузка биологии ОГЭ (300 заданий)")
-    print("="*60)
-    load_tasks_from_different_lines('bio', 'oge', 300, db_path, images_dir)
+    log.info("Шаг 1: загрузка биологии ОГЭ (300 заданий)")
+    load_tasks_from_different_lines('bio', 'oge', 300, db_path, images_dir, args.resume)
     
     # Загружаем математику базу ОГЭ - 200 заданий
-    print("\n" + "="*60)
-    print("ШАГ 2: Загрузка математики базы ОГЭ (200 заданий)")
-    print("="*60)
-    load_tasks_from_different_lines('mathb', 'oge', 200, db_path, images_dir)
+    log.info("Шаг 2: загрузка математики базы ОГЭ (200 заданий)")
+    load_tasks_from_different_lines('mathb', 'oge', 200, db_path, images_dir, args.resume)
     
-    print("\n" + "="*60)
-    print("ВСЕ ЗАДАНИЯ ЗАГРУЖЕНЫ!")
-    print("="*60)
+    write_run_report(args, 'load_tasks_batch')
+    log.info("Все задания загружены!")
 
 
 if __name__ == '__main__':
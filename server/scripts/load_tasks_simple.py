@@ -6,17 +6,24 @@
 import sys
 import os
 import sqlite3
-import requests
 import argparse
 from datetime import datetime
 from pathlib import Path
-from bs4 import BeautifulSoup
-import time
 
 # Добавляем путь к sdamgia-api
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdamgia-api'))
+sys.path.insert(0, os.path.dirname(__file__))
 
 from sdamgia import SdamGIA
+from rate_limiter import api_host
+from http_client import use_base_url
+from fetch_context import ProblemFetchContext, run_request_stats
+from sqlite_conn import connect
+from load_html_parser import get_problem_url, extract_answer, extract_topic_number
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+log = get_logger(__name__)
 
 
 class SimpleTasksLoader:
@@ -24,7 +31,7 @@ class SimpleTasksLoader:
         self.db_path = db_path
         self.images_dir = Path(images_dir)
         self.images_dir.mkdir(parents=True, exist_ok=True)
-        self.sdamgia = SdamGIA()
+        self.sdamgia = use_base_url(SdamGIA())
         self.conn = None
         
         self.subject_names = {
@@ -33,9 +40,9 @@ class SimpleTasksLoader:
         }
     
     def connect(self):
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = connect(self.db_path, ingest=True)
         self.conn.row_factory = sqlite3.Row
-        print(f"OK Подключено к БД: {self.db_path}")
+        log.info(f"Подключено к БД: {self.db_path}")
     
     def close(self):
         if self.conn:
@@ -59,40 +66,45 @@ class SimpleTasksLoader:
         cursor.execute("SELECT id FROM problems WHERE subject_id = ? AND problem_id = ?", (subject_id, problem_id))
         return cursor.fetchone() is not None
     
-    def download_and_parse_problem(self, url: str, subject_code: str, problem_id: str):
+    @run_metrics.timed('parse')
+    def download_and_parse_problem(self, url: str, subject_code: str, problem_id: str, ctx: ProblemFetchContext):
         """
-        Скачивает HTML страницы и парсит текст с изображениями в правильном порядке
+        Скачивает HTML страницы (один раз за задачу) и парсит текст с изображениями
+        в правильном порядке
+        
+        Returns:
+            (условие, решение, ответ, номер задания) или None
         """
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            prob_div = soup.find('div', {'class': 'prob_maindiv'})
+            prob_div = ctx.prob_div(url)
             
             if not prob_div:
-                return None, None
+                return None
             
             # Получаем блоки текста
             pbody_blocks = prob_div.find_all('div', {'class': 'pbody'})
             
             condition_text = self.parse_block_with_images(
                 pbody_blocks[0] if len(pbody_blocks) > 0 else None,
-                subject_code, problem_id, 'condition'
+                subject_code, problem_id, 'condition', ctx
             )
             
             solution_text = self.parse_block_with_images(
                 pbody_blocks[1] if len(pbody_blocks) > 1 else None,
-                subject_code, problem_id, 'solution'
+                subject_code, problem_id, 'solution', ctx
             )
             
-            return condition_text, solution_text
+            answer = extract_answer(prob_div, pbody_blocks)
+            topic = extract_topic_number(prob_div)
+            
+            return condition_text, solution_text, answer, topic
             
         except Exception as e:
-            print(f"  ERROR Ошибка парсинга: {e}")
-            return None, None
+            log.error(f"[{problem_id}] Ошибка парсинга: {e}", extra={'problem_id': problem_id})
+            return None
     
-    def parse_block_with_images(self, block, subject_code: str, problem_id: str, block_type: str) -> str:
+    def parse_block_with_images(self, block, subject_code: str, problem_id: str, block_type: str,
+                                ctx: ProblemFetchContext = None) -> str:
         """
         Парсит блок текста, сохраняя порядок текста и изображений
         """
@@ -109,7 +121,7 @@ class SimpleTasksLoader:
                 img_url = element.get('src', '')
                 if img_url and 'sdamgia.ru' in img_url:
                     # Скачиваем и сохраняем
-                    img_path = self.save_image(img_url, subject_code, problem_id, block_type, img_counter)
+                    img_path = self.save_image(img_url, subject_code, problem_id, block_type, img_counter, ctx)
                     if img_path:
                         # Добавляем markdown
                         result.append(f'\n![img](http://localhost:3001/tasks/images/{img_path})\n')
@@ -118,7 +130,7 @@ class SimpleTasksLoader:
             elif hasattr(element, 'get_text'):
                 # Это элемент с текстом
                 # Рекурсивно обрабатываем вложенные элементы
-                text = self.extract_text_with_inline_images(element, subject_code, problem_id, block_type, img_counter)
+                text = self.extract_text_with_inline_images(element, subject_code, problem_id, block_type, img_counter, ctx)
                 if text.strip():
                     result.append(text)
             
@@ -130,7 +142,8 @@ class SimpleTasksLoader:
         
         return ''.join(result)
     
-    def extract_text_with_inline_images(self, element, subject_code: str, problem_id: str, block_type: str, img_counter: int) -> str:
+    def extract_text_with_inline_images(self, element, subject_code: str, problem_id: str, block_type: str, img_counter: int,
+                                        ctx: ProblemFetchContext = None) -> str:
         """
         Рекурсивно извлекает текст с инлайн-изображениями
         """
@@ -140,7 +153,7 @@ class SimpleTasksLoader:
             if child.name == 'img':
                 img_url = child.get('src', '')
                 if img_url and 'sdamgia.ru' in img_url:
-                    img_path = self.save_image(img_url, subject_code, problem_id, block_type, img_counter)
+                    img_path = self.save_image(img_url, subject_code, problem_id, block_type, img_counter, ctx)
                     if img_path:
                         result.append(f'![img](http://localhost:3001/tasks/images/{img_path})')
                         img_counter += 1
@@ -149,79 +162,70 @@ class SimpleTasksLoader:
                 result.append('\n')
             
             elif hasattr(child, 'get_text'):
-                result.append(self.extract_text_with_inline_images(child, subject_code, problem_id, block_type, img_counter))
+                result.append(self.extract_text_with_inline_images(child, subject_code, problem_id, block_type, img_counter, ctx))
             
             elif isinstance(child, str):
                 result.append(child)
         
         return ''.join(result)
     
-    def save_image(self, url: str, subject_code: str, problem_id: str, image_type: str, index: int) -> str:
+    def save_image(self, url: str, subject_code: str, problem_id: str, image_type: str, index: int,
+                   ctx: ProblemFetchContext = None) -> str:
         """
-        Скачивает и сохраняет изображение
+        Скачивает изображение в хранилище (уже известные URL повторно не скачиваются)
         """
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            
-            content = response.content
-            
-            # Определяем тип файла
-            if content[:4] == b'<?xml' or content[:4] == b'<svg':
-                ext = '.svg'
-            elif content[:4] == b'\x89PNG':
-                ext = '.png'
-            elif content[:3] == b'\xff\xd8\xff':
-                ext = '.jpg'
-            else:
-                ext = '.svg'
-            
-            # Создаем папку
-            problem_dir = self.images_dir / subject_code / problem_id
-            problem_dir.mkdir(parents=True, exist_ok=True)
-            
-            # Сохраняем файл
-            filename = f"{image_type}_{index}{ext}"
-            filepath = problem_dir / filename
-            
-            with open(filepath, 'wb') as f:
-                f.write(content)
-            
-            # Возвращаем относительный путь
-            return f"{subject_code}/{problem_id}/{filename}"
+            ctx = ctx or ProblemFetchContext(self.images_dir)
+            # Возвращаем путь относительно папки изображений
+            rel_path, _ = ctx.image(url)
+            return rel_path
             
         except Exception as e:
-            print(f"  WARNING Ошибка скачивания изображения: {e}")
+            log.warning(f"[{problem_id}] Ошибка скачивания изображения {url}: {e}", extra={'problem_id': problem_id})
             return None
     
+    @run_metrics.timed('problem')
     def save_problem(self, problem_id: str, subject_code: str, exam_type: str = 'oge'):
         """
         Сохраняет одну задачу в БД
+
+        Returns:
+            True - сохранена, False - ошибка, None - задача уже есть в БД
         """
+        with ProblemFetchContext(self.images_dir) as ctx:
+            return self._save_problem(problem_id, subject_code, exam_type, ctx)
+    
+    def _save_problem(self, problem_id: str, subject_code: str, exam_type: str, ctx: ProblemFetchContext):
         try:
-            # Получаем данные задачи
-            problem_data = self.sdamgia.get_problem_by_id(subject_code, problem_id)
-            if not problem_data:
-                print(f"  ERROR Задача {problem_id} не найдена")
-                return False
-            
-            # Проверяем наличие
+            # Проверяем наличие до любых сетевых запросов
             subject_id = self.get_or_create_subject(subject_code, exam_type)
             if self.problem_exists(subject_id, problem_id):
-                print(f"  SKIP Задача {problem_id} уже существует")
-                return False
+                log.debug(f"[{problem_id}] Задача уже существует")
+                return None
             
-            # Парсим HTML для получения текста с изображениями в правильном порядке
-            url = problem_data.get('url', '')
-            condition_text, solution_text = self.download_and_parse_problem(url, subject_code, problem_id)
+            # Страница задачи скачивается один раз: из нее берутся текст с изображениями
+            # в правильном порядке, ответ и номер задания
+            url = get_problem_url(subject_code, problem_id)
+            parsed = self.download_and_parse_problem(url, subject_code, problem_id, ctx)
+            condition_text, solution_text, answer, topic = parsed or (None, None, '', None)
             
-            if not condition_text:
-                condition_text = problem_data['condition'].get('text', '')
-            if not solution_text:
-                solution_text = problem_data['solution'].get('text', '')
+            # API нужен только если HTML разобрать не удалось
+            if not condition_text or not answer or not topic:
+                problem_data = ctx.api('problem', api_host(subject_code), self.sdamgia.get_problem_by_id, subject_code, problem_id)
+                if not problem_data:
+                    log.error(f"[{problem_id}] Задача не найдена", extra={'problem_id': problem_id})
+                    return False
+                
+                url = problem_data.get('url', '') or url
+                if not condition_text:
+                    condition_text = problem_data['condition'].get('text', '')
+                if not solution_text:
+                    solution_text = problem_data['solution'].get('text', '')
+                answer = answer or problem_data.get('answer', '')
+                topic = topic or problem_data.get('topic', '')
             
-            answer = problem_data.get('answer', '')
-            topic = problem_data.get('topic', '')
+            solution_text = solution_text or ''
+            topic = topic or ''
             
             # Сохраняем в БД
             cursor = self.conn.cursor()
@@ -234,11 +238,12 @@ class SimpleTasksLoader:
             self.conn.commit()
             
             img_count = condition_text.count('![img](') + solution_text.count('![img](')
-            print(f"  OK Задача {problem_id} сохранена (изображений: {img_count})")
+            log.debug(f"[{problem_id}] Задача сохранена (изображений: {img_count}, запросов: {ctx.requests})",
+                      extra={'problem_id': problem_id, 'requests': ctx.requests})
             return True
             
         except Exception as e:
-            print(f"  ERROR Ошибка: {e}")
+            log.error(f"[{problem_id}] Ошибка: {e}", extra={'problem_id': problem_id})
             return False
 
 
@@ -249,16 +254,17 @@ def main():
     parser.add_argument('--ids', required=True, help='ID заданий через запятую')
     parser.add_argument('--db', default='../tasksbd.db')
     parser.add_argument('--images-dir', default='../image_tasksdb')
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    setup_logging(args)
     
     script_dir = Path(__file__).parent
     db_path = script_dir / args.db
     images_dir = script_dir / args.images_dir
     
-    print("=" * 60)
-    print(f"Загрузка заданий: {args.subject} ({args.exam_type.upper()})")
-    print("=" * 60)
+    log.info(f"Загрузка заданий: {args.subject} ({args.exam_type.upper()})")
     
     loader = SimpleTasksLoader(str(db_path), str(images_dir))
     
@@ -267,12 +273,13 @@ def main():
         
         problem_ids = [pid.strip() for pid in args.ids.split(',')]
         
-        for problem_id in problem_ids:
-            print(f"\nЗагрузка задачи {problem_id}...")
-            loader.save_problem(problem_id, args.subject, args.exam_type)
-            time.sleep(0.5)
+        with Progress(len(problem_ids), 'Задачи') as progress:
+            for problem_id in problem_ids:
+                log.debug(f"[{problem_id}] Загрузка задачи...")
+                progress.advance(loader.save_problem(problem_id, args.subject, args.exam_type) is not False)
         
-        print("\nГотово!")
+        log.info(run_request_stats.summary())
+        write_run_report(args, 'load_tasks_simple')
         
     finally:
         loader.close()
@@ -5,42 +5,29 @@
 
 import sys
 import os
-import sqlite3
-import requests
 import argparse
-from pathlib import Path
 import time
+from pathlib import Path
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../sdamgia-api'))
+sys.path.insert(0, os.path.dirname(__file__))
 from sdamgia import SdamGIA
+from rate_limiter import api_host
+from http_client import use_base_url
+from http_cache import cached_call
+from image_store import get_image_store
+from sqlite_conn import connect
+from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+log = get_logger(__name__)
 
 
 def save_image(url: str, subject_code: str, problem_id: str, image_type: str, index: int, images_dir: Path) -> str:
-    """Скачивает и сохраняет изображение"""
+    """Скачивает изображение в хранилище (уже известные URL повторно не скачиваются)"""
     try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        content = response.content
-        
-        # Определяем тип
-        if content[:4] == b'<?xml' or content[:4] == b'<svg':
-            ext = '.svg'
-        elif content[:4] == b'\x89PNG':
-            ext = '.png'
-        else:
-            ext = '.svg'
-        
-        # Сохраняем
-        problem_dir = images_dir / subject_code / problem_id
-        problem_dir.mkdir(parents=True, exist_ok=True)
-        
-        filename = f"{image_type}_{index}{ext}"
-        filepath = problem_dir / filename
-        
-        with open(filepath, 'wb') as f:
-            f.write(content)
-        
-        return f"{subject_code}/{problem_id}/{filename}"
+        rel_path, _ = get_image_store(images_dir).fetch(url)
+        return rel_path
     except:
         return None
 
@@ -91,17 +78,20 @@ def main():
     parser.add_argument('--ids', required=True)
     parser.add_argument('--db', default='../tasksbd.db')
     parser.add_argument('--images-dir', default='../image_tasksdb')
+    add_metrics_arguments(parser)
+    add_logging_arguments(parser)
     
     args = parser.parse_args()
+    setup_logging(args)
     
     script_dir = Path(__file__).parent
     db_path = script_dir / args.db
     images_dir = script_dir / args.images_dir
     
-    print(f"Загрузка {args.subject} ({args.exam_type.upper()})")
+    log.info(f"Загрузка {args.subject} ({args.exam_type.upper()})")
     
-    sdamgia = SdamGIA()
-    conn = sqlite3.connect(str(db_path))
+    sdamgia = use_base_url(SdamGIA())
+    conn = connect(db_path, ingest=True)
     cursor = conn.cursor()
     
     # Создаем предмет
@@ -114,16 +104,19 @@ def main():
     subject_id = cursor.fetchone()[0]
     
     problem_ids = [pid.strip() for pid in args.ids.split(',')]
+    progress = Progress(len(problem_ids), 'Задачи')
     
     for problem_id in problem_ids:
-        print(f"\nЗагрузка {problem_id}...")
+        log.debug(f"[{problem_id}] Загрузка...")
+        started = time.perf_counter()
+        ok = False
         
         try:
             # Получаем данные
-            data = sdamgia.get_problem_by_id(args.subject, problem_id)
+            data = cached_call('problem', api_host(args.subject), sdamgia.get_problem_by_id, args.subject, problem_id)
             
             if not data:
-                print(f"  ERROR: Не найдена")
+                log.error(f"[{problem_id}] Не найдена", extra={'problem_id': problem_id})
                 continue
             
             # Форматируем текст с изображениями
@@ -149,15 +142,18 @@ def main():
             conn.commit()
             
             img_count = condition.count('![img](') + solution.count('![img](')
-            print(f"  OK: Сохранена (изображений: {img_count})")
-            
-            time.sleep(0.5)
+            log.debug(f"[{problem_id}] Сохранена (изображений: {img_count})")
+            ok = True
             
         except Exception as e:
-            print(f"  ERROR: {e}")
+            log.error(f"[{problem_id}] {e}", extra={'problem_id': problem_id})
+        finally:
+            run_metrics.observe('problem', time.perf_counter() - started)
+            progress.advance(ok)
     
+    progress.finish()
     conn.close()
-    print("\nГотово!")
+    write_run_report(args, 'load_with_images')
 
 
 if __name__ == '__main__':
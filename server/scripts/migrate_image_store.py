@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Перенос старых изображений image_tasksdb/{subject}/{problem_id}/{type}_{n}.ext
+в хранилище с адресацией по содержимому (image_tasksdb/blobs/)
+
+Режимы:
+    hardlink - старый файл заменяется жесткой ссылкой на файл хранилища.
+               Пути в БД и тексты задач не меняются, одинаковые изображения
+               занимают место на диске один раз.
+    rewrite  - пути в problem_*_images и ссылки в текстах задач переписываются
+               на blobs/..., старые файлы и пустые папки удаляются
+               (освобождаются и место, и inode).
+
+Использование:
+    python migrate_image_store.py                  # hardlink
+    python migrate_image_store.py --mode rewrite
+    python migrate_image_store.py --mode rewrite --dry-run
+"""
+
+import sys
+import os
+import argparse
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(__file__))
+from image_store import get_image_store, ensure_schema, link_image_row, BLOBS_DIR_NAME
+from sqlite_conn import connect
+from run_log import get_logger, setup_logging, add_logging_arguments
+
+log = get_logger(__name__)
+
+IMAGE_TABLES = ('problem_condition_images', 'problem_solution_images')
+
+
+def load_image_rows(cursor) -> dict:
+    """Строки изображений задач: старый путь (без image_tasksdb/) -> [(таблица, id, url)]"""
+    rows = {}
+    for table in IMAGE_TABLES:
+        cursor.execute(f"SELECT id, image_path, image_url FROM {table}")
+        for row_id, image_path, image_url in cursor.fetchall():
+            path = (image_path or '').replace('\\', '/')
+            if path.startswith('image_tasksdb/'):
+                path = path[len('image_tasksdb/'):]
+            rows.setdefault(path, []).append((table, row_id, image_url))
+    return rows
+
+
+def rewrite_problem_texts(cursor, subject_code: str, problem_id: str, replacements: dict):
+    """Заменяет ссылки на старые файлы в тексте условия и решения задачи"""
+    cursor.execute("""
+        SELECT p.id, p.condition_text, p.solution_text
+        FROM problems p
+        JOIN subjects s ON p.subject_id = s.id
+        WHERE s.code = ? AND p.problem_id = ?
+    """, (subject_code, problem_id))
+
+    for db_id, condition_text, solution_text in cursor.fetchall():
+        new_condition, new_solution = condition_text or '', solution_text or ''
+        for old_path, new_path in replacements.items():
+            new_condition = new_condition.replace(old_path, new_path)
+            new_solution = new_solution.replace(old_path, new_path)
+        if new_condition != (condition_text or '') or new_solution != (solution_text or ''):
+            cursor.execute(
+                "UPDATE problems SET condition_text = ?, solution_text = ? WHERE id = ?",
+                (new_condition, new_solution, db_id)
+            )
+
+
+def replace_with_hardlink(old_file: Path, blob_file: Path) -> bool:
+    """Заменяет файл жесткой ссылкой на файл хранилища"""
+    if old_file.samefile(blob_file):
+        return True
+    tmp = old_file.with_name(old_file.name + '.link.tmp')
+    try:
+        os.link(blob_file, tmp)
+        os.replace(tmp, old_file)
+        return True
+    except OSError as e:
+        log.warning(f"Не удалось создать жесткую ссылку для {old_file}: {e}")
+        if tmp.exists():
+            tmp.unlink()
+        return False
+
+
+def migrate(db_path: Path, images_dir: Path, mode: str, dry_run: bool = False):
+    store = get_image_store(images_dir)
+    conn = connect(db_path)
+    ensure_schema(conn)
+    cursor = conn.cursor()
+
+    image_rows = load_image_rows(cursor)
+    stats = {'files': 0, 'bytes_before': 0, 'linked_rows': 0}
+
+    for subject_dir in sorted(images_dir.iterdir()):
+        if not subject_dir.is_dir() or subject_dir.name == BLOBS_DIR_NAME:
+            continue
+
+        log.info(f"Предмет: {subject_dir.name}")
+
+        for problem_dir in sorted(subject_dir.iterdir()):
+            if not problem_dir.is_dir():
+                continue
+
+            replacements = {}
+            migrated_files = []
+
+            for old_file in sorted(problem_dir.iterdir()):
+                if not old_file.is_file():
+                    continue
+
+                old_rel = f"{subject_dir.name}/{problem_dir.name}/{old_file.name}"
+                content = old_file.read_bytes()
+                stats['files'] += 1
+                stats['bytes_before'] += len(content)
+
+                if dry_run:
+                    continue
+
+                rows = image_rows.get(old_rel, [])
+                url = next((row_url for _, _, row_url in rows if row_url), '')
+                new_rel, blob_hash = store.store_bytes(content, url=url)
+
+                for table, row_id, _ in rows:
+                    link_image_row(cursor, table, row_id, blob_hash)
+                    if mode == 'rewrite':
+                        cursor.execute(
+                            f"UPDATE {table} SET image_path = ? WHERE id = ?",
+                            (f"image_tasksdb/{new_rel}", row_id)
+                        )
+                    stats['linked_rows'] += 1
+
+                replacements[old_rel] = new_rel
+                migrated_files.append((old_file, images_dir / new_rel))
+
+            if dry_run or not migrated_files:
+                continue
+
+            if mode == 'rewrite':
+                rewrite_problem_texts(cursor, subject_dir.name, problem_dir.name, replacements)
+
+            conn.commit()
+
+            # Файлы трогаем только после успешной записи в БД
+            for old_file, blob_file in migrated_files:
+                if mode == 'rewrite':
+                    old_file.unlink()
+                else:
+                    replace_with_hardlink(old_file, blob_file)
+
+            if mode == 'rewrite' and not any(problem_dir.iterdir()):
+                problem_dir.rmdir()
+
+        if mode == 'rewrite' and not dry_run and not any(subject_dir.iterdir()):
+            subject_dir.rmdir()
+
+    conn.close()
+
+    blob_count, blob_bytes = store.totals()
+    log.info(f"Файлов обработано: {stats['files']} ({stats['bytes_before'] / 1024 / 1024:.1f} МБ)")
+    if not dry_run:
+        log.info(f"Уникальных файлов в хранилище: {blob_count} ({blob_bytes / 1024 / 1024:.1f} МБ)")
+        log.info(f"Строк изображений связано с хранилищем: {stats['linked_rows']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Перенос изображений в хранилище с адресацией по содержимому')
+    parser.add_argument('--mode', default='hardlink', choices=['hardlink', 'rewrite'],
+                        help='hardlink - оставить старые пути ссылками, rewrite - переписать пути в БД')
+    parser.add_argument('--dry-run', action='store_true', help='Только посчитать файлы')
+    parser.add_argument('--db', default='../tasksbd.db', help='Путь к БД')
+    parser.add_argument('--images-dir', default='../image_tasksdb', help='Папка для изображений')
+    add_logging_arguments(parser)
+
+    args = parser.parse_args()
+    setup_logging(args)
+
+    script_dir = Path(__file__).parent
+    db_path = script_dir / args.db
+    images_dir = script_dir / args.images_dir
+
+    log.info(f"Перенос изображений в хранилище (режим: {args.mode})")
+    log.info(f"БД: {db_path}")
+    log.info(f"Папка изображений: {images_dir}")
+
+    migrate(db_path, images_dir, args.mode, args.dry_run)
+
+
+if __name__ == '__main__':
+    main()
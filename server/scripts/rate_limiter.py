@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Общий ограничитель частоты запросов к сайтам СДАМ ГИА (token bucket по хостам)
+
+Вместо фиксированной паузы time.sleep(0.5) после каждого запроса каждый
+хост получает свое "ведро" токенов: запрос забирает токен, токены
+восполняются со скоростью rate в секунду, ведро вмещает не больше burst.
+Пауза делается только если токенов не осталось, поэтому:
+- после медленного запроса (3 с) ждать уже не нужно;
+- bio-oge и math-oge не тормозят друг друга.
+
+Использование:
+    from rate_limiter import rate_limiter, api_host
+
+    rate_limiter.wait(url)                  # перед requests.get(url)
+    rate_limiter.wait(api_host('bio'))      # перед вызовом SdamGIA API
+
+Настройки по умолчанию можно переопределить переменными окружения
+SDAMGIA_RATE (запросов в секунду на хост) и SDAMGIA_BURST.
+"""
+
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_RATE = float(os.environ.get('SDAMGIA_RATE', '2'))
+DEFAULT_BURST = int(os.environ.get('SDAMGIA_BURST', '4'))
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Забирает токен и возвращает, сколько секунд нужно подождать.
+        Если токенов нет, баланс уходит в минус - следующий запрос
+        встает в очередь за текущим, поэтому потоки не толкаются.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+    def acquire(self) -> float:
+        """Ждет токен (только если нужно) и возвращает время ожидания"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class HostRateLimiter:
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._overrides = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float = None, burst: int = None, host: str = None):
+        """Меняет лимиты по умолчанию или для конкретного хоста"""
+        with self._lock:
+            if host:
+                self._overrides[host] = (rate or self.rate, burst or self.burst)
+                self._buckets.pop(host, None)
+            else:
+                self.rate = rate or self.rate
+                self.burst = burst or self.burst
+                self._buckets = {}
+
+    def _bucket(self, host: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                rate, burst = self._overrides.get(host, (self.rate, self.burst))
+                bucket = TokenBucket(rate, burst)
+                self._buckets[host] = bucket
+            return bucket
+
+    def wait(self, url_or_host: str) -> float:
+        """Ждет разрешения на запрос к хосту (принимает URL или имя хоста)"""
+        host = urlparse(url_or_host).netloc if '://' in url_or_host else url_or_host
+        if not host:
+            return 0.0
+        return self._bucket(host).acquire()
+
+
+def api_host(subject_code: str) -> str:
+    """Хост, к которому обращается SdamGIA API для предмета"""
+    return f"{subject_code}-ege.sdamgia.ru"
+
+
+# Общий ограничитель для всех загрузчиков процесса
+rate_limiter = HostRateLimiter()
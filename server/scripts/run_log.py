@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Журнал загрузчиков: уровни, тихий режим, строка прогресса и JSON-lines файл
+
+- сообщения идут через logging (логгеры sdamgia.*): подробности по задачам -
+  DEBUG (видны с -v), предупреждения и ошибки - WARNING/ERROR, итоги - INFO;
+- ход загрузки - одна строка прогресса (готово/всего, скорость, ETA, ошибки),
+  которая перерисовывается не чаще раза в --progress-interval секунд; если
+  вывод не в терминал, та же строка пишется в журнал раз в 10 с;
+- -q оставляет только предупреждения и ошибки;
+- --log-json <файл> дописывает все записи (включая DEBUG) в файл JSON-lines
+  с полями ts, level, logger, msg и дополнительными полями из extra=.
+
+Использование:
+    from run_log import get_logger, setup_logging, add_logging_arguments, Progress
+
+    log = get_logger(__name__)
+
+    add_logging_arguments(parser)          # -q, -v, --log-level, --log-json, --no-progress
+    args = parser.parse_args()
+    setup_logging(args)
+
+    with Progress(len(ids), 'Задачи') as progress:
+        for problem_id in ids:
+            log.debug("Задача %s сохранена", problem_id, extra={'problem_id': problem_id})
+            progress.advance(ok)
+"""
+
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+
+LOGGER_NAME = 'sdamgia'
+DEFAULT_PROGRESS_INTERVAL = 0.5
+# Вне терминала строка прогресса пишется в журнал обычной записью, реже
+PLAIN_PROGRESS_INTERVAL = 10.0
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# Атрибуты LogRecord, которые не считаются дополнительными полями записи
+_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+# Общая консоль процесса: записи журнала и строка прогресса пишутся под одной блокировкой
+_console_lock = threading.RLock()
+_settings = {'stream': None, 'progress': False, 'tty': False, 'interval': DEFAULT_PROGRESS_INTERVAL}
+_active = []
+
+
+def get_logger(name: str = None) -> logging.Logger:
+    """Логгер sdamgia.<имя модуля> (__main__ - просто sdamgia)"""
+    if not name or name == '__main__':
+        return logging.getLogger(LOGGER_NAME)
+    return logging.getLogger(f"{LOGGER_NAME}.{name}")
+
+
+def configure_console():
+    """
+    UTF-8 для stdout/stderr (консоль Windows по умолчанию в cp1251/cp866).
+    reconfigure() меняет кодировку существующего потока, а не оборачивает его заново
+    """
+    for stream in (sys.stdout, sys.stderr):
+        reconfigure = getattr(stream, 'reconfigure', None)
+        if reconfigure is not None and (stream.encoding or '').lower() not in ('utf-8', 'utf8'):
+            try:
+                reconfigure(encoding='utf-8', errors='replace')
+            except (ValueError, OSError):
+                pass
+
+
+def _clear_line():
+    stream = _settings['stream']
+    if _active and _settings['progress'] and _settings['tty'] and _active[-1].drawn:
+        stream.write('\r\x1b[K')
+        _active[-1].drawn = False
+
+
+class ConsoleHandler(logging.Handler):
+    """Вывод записей в консоль поверх строки прогресса (строка стирается и рисуется заново)"""
+
+    PREFIXES = {logging.WARNING: 'WARNING: ', logging.ERROR: 'ERROR: ', logging.CRITICAL: 'ERROR: '}
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = self.PREFIXES.get(record.levelno, '') + record.getMessage()
+        if record.exc_info:
+            text += '\n' + logging.Formatter().formatException(record.exc_info)
+        return text
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            text = self.format(record)
+            with _console_lock:
+                _clear_line()
+                self.stream.write(text + '\n')
+                if _active:
+                    _active[-1].redraw()
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: ts, level, logger, msg, поля из extra=, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                entry[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class Progress:
+    """
+    Строка прогресса: готово/всего, скорость, ETA, ошибки (потокобезопасно).
+    Показывается с создания до finish() (или выхода из with). Без setup_logging
+    или с --no-progress / -q строка не рисуется, итог finish() - запись INFO.
+    initial - уже сделанное до запуска (продолжение по журналу), в скорость не входит
+    """
+
+    def __init__(self, total: int = None, label: str = 'Задачи', logger: logging.Logger = None,
+                 initial: int = 0):
+        self.total = total
+        self.label = label
+        self.log = logger or get_logger('progress')
+        self.initial = initial
+        self.done = initial
+        self.errors = 0
+        self.drawn = False
+        self.started = time.perf_counter()
+        self._last_draw = 0.0
+        self._last_plain = self.started
+        self._lock = threading.Lock()
+        with _console_lock:
+            _active.append(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish()
+        return False
+
+    def advance(self, ok: bool = True, count: int = 1):
+        with self._lock:
+            self.done += count
+            if not ok:
+                self.errors += count
+        self._maybe_draw()
+
+    def error(self, count: int = 1):
+        """Ошибка, которая не продвигает счетчик (например, когда цель - число загруженных задач)"""
+        with self._lock:
+            self.errors += count
+        self._maybe_draw()
+
+    def line(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        rate = (self.done - self.initial) / elapsed if elapsed > 0 else 0.0
+        if self.total:
+            text = f"{self.label}: {self.done}/{self.total} ({self.done / self.total:.0%})"
+            if rate > 0 and self.done < self.total:
+                text += f", {rate:.1f}/с, осталось ~{_duration((self.total - self.done) / rate)}"
+            else:
+                text += f", {rate:.1f}/с"
+        else:
+            text = f"{self.label}: {self.done}, {rate:.1f}/с"
+        return f"{text}, ошибок: {self.errors}"
+
+    def _maybe_draw(self):
+        if not _settings['progress']:
+            return
+        now = time.perf_counter()
+        if _settings['tty']:
+            if now - self._last_draw >= _settings['interval']:
+                with _console_lock:
+                    self._last_draw = now
+                    self.redraw()
+        elif now - self._last_plain >= PLAIN_PROGRESS_INTERVAL:
+            self._last_plain = now
+            self.log.info(self.line())
+
+    def redraw(self):
+        """Рисует строку заново (вызывается под _console_lock)"""
+        if _settings['progress'] and _settings['tty'] and _active and _active[-1] is self:
+            stream = _settings['stream']
+            stream.write('\r' + self.line() + '\x1b[K')
+            stream.flush()
+            self.drawn = True
+
+    def finish(self):
+        """Убирает строку прогресса и пишет итог в журнал"""
+        with _console_lock:
+            if self not in _active:
+                return
+            _clear_line()
+            _active.remove(self)
+        elapsed = time.perf_counter() - self.started
+        self.log.info(f"{self.line()}, за {_duration(elapsed)}",
+                      extra={'done': self.done, 'errors': self.errors, 'seconds': round(elapsed, 3)})
+
+
+def _duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def setup_logging(args=None, level: str = 'INFO', quiet: bool = False, verbose: bool = False,
+                  log_json: str = None, progress: bool = True,
+                  interval: float = DEFAULT_PROGRESS_INTERVAL) -> logging.Logger:
+    """
+    Настраивает журнал процесса (повторный вызов заменяет обработчики).
+    args - результат argparse с параметрами add_logging_arguments (перекрывает остальные аргументы)
+    """
+    if args is not None:
+        level = getattr(args, 'log_level', None) or level
+        quiet = getattr(args, 'quiet', quiet)
+        verbose = getattr(args, 'verbose', verbose)
+        log_json = getattr(args, 'log_json', log_json)
+        progress = not getattr(args, 'no_progress', not progress)
+        interval = getattr(args, 'progress_interval', interval)
+
+    configure_console()
+    stream = sys.stdout
+    if verbose:
+        level = 'DEBUG'
+    elif quiet:
+        level = 'WARNING'
+
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    console = ConsoleHandler(stream)
+    console.setLevel(level)
+    logger.addHandler(console)
+
+    if log_json:
+        file_handler = logging.FileHandler(log_json, mode='a', encoding='utf-8')
+        file_handler.setLevel(logging.DEBUG)
+        file_handler.setFormatter(JsonLinesFormatter())
+        logger.addHandler(file_handler)
+
+    _settings.update({
+        'stream': stream,
+        'progress': progress and not quiet,
+        'tty': bool(getattr(stream, 'isatty', lambda: False)()),
+        'interval': interval,
+    })
+    return logger
+
+
+def add_logging_arguments(parser):
+    """Добавляет в argparse параметры журнала и строки прогресса"""
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Только предупреждения и ошибки (без строки прогресса и итогов)')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Подробный вывод: строка на каждую задачу и изображение')
+    parser.add_argument('--log-level', choices=LEVELS, help='Уровень вывода в консоль (по умолчанию INFO)')
+    parser.add_argument('--log-json', help='Дописывать журнал (все уровни) в файл JSON-lines')
+    parser.add_argument('--no-progress', action='store_true', help='Не показывать строку прогресса')
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL,
+                        help=f'Как часто обновлять строку прогресса, с (по умолчанию {DEFAULT_PROGRESS_INTERVAL:g})')
@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+"""
+Замеры стадий загрузки и машиночитаемый отчет о запуске
+
+Загрузчики печатают по задаче только текст, и по медленному запуску не
+понять, куда ушло время: HTTP, разбор HTML, изображения или коммиты SQLite.
+Горячие функции (load_problem, save_problem, import_problem, save_image /
+download_image, repair_file в reload-images.py, стадии конвейера) оборачивают
+свою работу в run_metrics.stage(...), а HTTP слой считает запросы, байты,
+повторы (Retry urllib3) и попадания в кэш.
+
+Стадии:
+    problem   - задача целиком
+    http      - сетевой GET (страница, изображение)
+    api       - вызов SdamGIA API (промах кэша)
+    parse     - разбор HTML в markdown
+    image     - скачивание изображения в хранилище
+    db_write  - запись задачи в SQLite
+    db_commit - настоящий COMMIT пакетной записи (bulk_ingest)
+
+Стадии считают собственное время: время вложенных стадий того же потока
+вычитается (parse не включает скачивание изображений внутри разбора - оно
+попадает в image и http). Исключение - INCLUSIVE_STAGES (problem).
+
+В конце запуска пишется JSON отчет: по каждой стадии число замеров, сумма,
+p50/p95/p99 и максимум (в секундах), байты, а также счетчики запуска.
+Те же данные можно записать в textfile для node exporter (формат Prometheus,
+файл заменяется атомарно).
+
+Использование:
+    from run_metrics import run_metrics, add_metrics_arguments, write_run_report
+
+    with run_metrics.stage('parse'):
+        data = extract_problem(...)
+    run_metrics.count('requests')
+
+    @run_metrics.timed('db_write')
+    def save_problem(...): ...
+
+    add_metrics_arguments(parser)             # --metrics-json, --metrics-prom, --no-metrics-json
+    write_run_report(args, 'load_html_parser')
+"""
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from run_log import get_logger
+
+log = get_logger(__name__)
+
+REPORTS_DIR = Path(__file__).parent / 'run_reports'
+QUANTILES = (0.5, 0.95, 0.99)
+PROM_PREFIX = 'sdamgia_loader'
+
+# Стадии, которые замеряют блок целиком, вместе с вложенными стадиями
+INCLUSIVE_STAGES = frozenset(('problem',))
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Перцентиль по ближайшему рангу (sorted_values отсортирован по возрастанию)"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RunMetrics:
+    """Длительности стадий, байты и счетчики за весь запуск (потокобезопасно)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Открытые стадии потока: время их вложенных стадий
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self._durations = {}
+            self._bytes = {}
+            self.counters = {}
+
+    # ---------- запись ----------
+
+    def _open_stages(self) -> list:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def observe(self, stage: str, seconds: float, nbytes: int = 0):
+        """Замер, сделанный вызывающим кодом (вычитается из открытой стадии потока)"""
+        stack = self._open_stages()
+        if stack:
+            stack[-1] += seconds
+        self._record(stage, seconds, nbytes)
+
+    def _record(self, stage: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            self._durations.setdefault(stage, []).append(seconds)
+            if nbytes:
+                self._bytes[stage] = self._bytes.get(stage, 0) + nbytes
+
+    def add_bytes(self, stage: str, nbytes: int):
+        if nbytes:
+            with self._lock:
+                self._bytes[stage] = self._bytes.get(stage, 0) + nbytes
+
+    def count(self, name: str, value: int = 1):
+        if value:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Замеряет длительность блока (в том числе завершившегося исключением)
+        без вложенных стадий, кроме INCLUSIVE_STAGES
+        """
+        stack = self._open_stages()
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            self._record(name, elapsed if name in INCLUSIVE_STAGES else elapsed - nested)
+
+    def timed(self, name: str):
+        """Декоратор: каждый вызов функции - замер стадии name"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ---------- отчет ----------
+
+    def stages(self) -> dict:
+        """{стадия: count, sum, p50, p95, p99, max, bytes}"""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._durations.items()}
+            nbytes = dict(self._bytes)
+        result = {}
+        for name in sorted(set(snapshot) | set(nbytes)):
+            values = snapshot.get(name, [])
+            item = {'count': len(values), 'sum': sum(values)}
+            for q in QUANTILES:
+                item[f'p{int(q * 100)}'] = percentile(values, q)
+            item['max'] = values[-1] if values else 0.0
+            item['bytes'] = nbytes.get(name, 0)
+            result[name] = item
+        return result
+
+    def report(self, script: str = None) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {
+            'script': script,
+            'started': datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'seconds': time.time() - self.started,
+            'pid': os.getpid(),
+            'stages': self.stages(),
+            'counters': counters,
+        }
+
+    def summary(self) -> str:
+        parts = [f"{name} {item['count']}x p50 {item['p50'] * 1000:.0f} / p95 {item['p95'] * 1000:.0f} мс"
+                 for name, item in self.stages().items() if item['count']]
+        with self._lock:
+            counters = ', '.join(f"{name}: {value}" for name, value in sorted(self.counters.items()))
+        line = "Стадии: " + ('; '.join(parts) if parts else 'нет замеров')
+        return f"{line}\nСчетчики: {counters}" if counters else line
+
+    def write_json(self, path, script: str = None) -> Path:
+        path = Path(path)
+        _atomic_write(path, json.dumps(self.report(script), ensure_ascii=False, indent=2))
+        return path
+
+    def write_prometheus(self, path, script: str = None) -> Path:
+        """Textfile для node exporter (--collector.textfile.directory), заменяется атомарно"""
+        report = self.report(script)
+        label = f'script="{_escape(script or "")}"'
+        lines = [
+            f'# HELP {PROM_PREFIX}_stage_seconds Длительность стадий загрузки',
+            f'# TYPE {PROM_PREFIX}_stage_seconds summary',
+        ]
+        for name, item in report['stages'].items():
+            stage = f'{label},stage="{_escape(name)}"'
+            for q in QUANTILES:
+                lines.append(f'{PROM_PREFIX}_stage_seconds{{{stage},quantile="{q:g}"}} {item[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f'{PROM_PREFIX}_stage_seconds_sum{{{stage}}} {item["sum"]:.6f}')
+            lines.append(f'{PROM_PREFIX}_stage_seconds_count{{{stage}}} {item["count"]}')
+        lines += [
+            f'# HELP {PROM_PREFIX}_stage_bytes Байт, полученных стадией',
+            f'# TYPE {PROM_PREFIX}_stage_bytes gauge',
+        ]
+        for name, item in report['stages'].items():
+            lines.append(f'{PROM_PREFIX}_stage_bytes{{{label},stage="{_escape(name)}"}} {item["bytes"]}')
+        lines += [
+            f'# HELP {PROM_PREFIX}_events Счетчики запуска (запросы, повторы, попадания в кэш)',
+            f'# TYPE {PROM_PREFIX}_events gauge',
+        ]
+        for name, value in sorted(report['counters'].items()):
+            lines.append(f'{PROM_PREFIX}_events{{{label},event="{_escape(name)}"}} {value}')
+        lines += [
+            f'# HELP {PROM_PREFIX}_run_seconds Длительность запуска',
+            f'# TYPE {PROM_PREFIX}_run_seconds gauge',
+            f'{PROM_PREFIX}_run_seconds{{{label}}} {report["seconds"]:.3f}',
+            f'# HELP {PROM_PREFIX}_last_run_timestamp_seconds Время завершения запуска',
+            f'# TYPE {PROM_PREFIX}_last_run_timestamp_seconds gauge',
+            f'{PROM_PREFIX}_last_run_timestamp_seconds{{{label}}} {time.time():.0f}',
+        ]
+        path = Path(path)
+        _atomic_write(path, '\n'.join(lines) + '\n')
+        return path
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _atomic_write(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def count_retries(response):
+    """Число повторов запроса (Retry urllib3 у requests.Response, иначе 0)"""
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    return len(getattr(retries, 'history', None) or ())
+
+
+# Общие замеры процесса
+run_metrics = RunMetrics()
+
+
+def add_metrics_arguments(parser):
+    """Добавляет в argparse параметры отчета о запуске"""
+    parser.add_argument('--metrics-json',
+                        help='JSON отчет о стадиях запуска (по умолчанию run_reports/<скрипт>_<дата>.json)')
+    parser.add_argument('--no-metrics-json', action='store_true', help='Не писать JSON отчет')
+    parser.add_argument('--metrics-prom',
+                        help='Textfile для node exporter (например /var/lib/node_exporter/sdamgia.prom)')
+
+
+def write_run_report(args, script: str, metrics: RunMetrics = None):
+    """Выводит в журнал итог стадий и пишет отчеты, заданные параметрами add_metrics_arguments"""
+    metrics = metrics or run_metrics
+    log.info(metrics.summary())
+    if not getattr(args, 'no_metrics_json', False):
+        path = getattr(args, 'metrics_json', None) or REPORTS_DIR / f"{script}_{datetime.now():%Y%m%d_%H%M%S}.json"
+        log.info(f"Отчет о запуске: {metrics.write_json(path, script)}")
+    if getattr(args, 'metrics_prom', None):
+        metrics.write_prometheus(args.metrics_prom, script)
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Локальный стенд СДАМ ГИА для офлайн-прогонов загрузчиков
+
+Отдает те же страницы, что и *-oge/ege.sdamgia.ru, но с локальной машины:
+
+    /<host>/prob_catalog                 - каталог (темы и категории)
+    /<host>/test?theme=<id>&page=<n>     - задачи категории (span.prob_nums)
+    /<host>/problem?id=<id>              - страница задачи
+    /<host>/formula/..., /get_file?id=.. - изображения (SVG, одинаковые для одного пути)
+    /__stats                             - статистика стенда в JSON
+
+Страницы задач берутся из корпуса bench_fixtures/*.html (номер задачи, тип и
+аналоги подставляются) или, с --synthetic, генерируются. Каталог и категории
+генерируются детерминированно: категория <тема * 100 + n>, задачи категории -
+<категория * 100 + i>.
+
+Загрузчики направляются на стенд переменной SDAMGIA_BASE_URL (http_client.py):
+
+    python sdamgia_mock_server.py --port 8765 --latency 80 --jitter 40 --error-rate 0.01 --throttle 20
+    SDAMGIA_BASE_URL=http://127.0.0.1:8765 SDAMGIA_RATE=50 python load_tasks.py --subject bio --count 200 --db /tmp/bench.db
+
+По Ctrl+C (или kill) стенд печатает число запросов по классам, ошибки, 429 и p95 времени ответа.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qs
+
+sys.path.insert(0, str(Path(__file__).parent))
+from rate_limiter import TokenBucket
+
+FIXTURES_DIR = Path(__file__).parent / 'bench_fixtures'
+IMAGE_PATH_RE = re.compile(r'^/(formula/|get_file)|\.(svg|png|jpe?g|gif|webp)$')
+PROB_NUMS_RE = re.compile(r'<span class="prob_nums">.*?</span>', re.S)
+MINOR_RE = re.compile(r'<div class="minor">.*?</div>', re.S)
+PROBLEM_ID_RE = re.compile(r'data-id="\d+"')
+
+
+class MockCorpus:
+    """Детерминированные каталог, категории, задачи и изображения стенда"""
+
+    def __init__(self, fixtures_dir: Path = FIXTURES_DIR, synthetic: bool = False, topics: int = 20,
+                 categories: int = 5, problems: int = 30):
+        self.topics = topics
+        self.categories = categories
+        self.problems = problems
+        self.pages = []
+        if not synthetic:
+            self.pages = [path.read_text(encoding='utf-8') for path in sorted(Path(fixtures_dir).glob('*.html'))]
+
+    # ---------- каталог ----------
+
+    def catalog_html(self) -> str:
+        topics = []
+        for topic in range(1, self.topics + 1):
+            children = ''.join(
+                f'<div class="cat_category" data-id="{topic * 100 + n}">'
+                f'<span class="cat_name">Категория {topic}.{n}</span></div>'
+                for n in range(1, self.categories + 1)
+            )
+            topics.append(f'<div class="cat_category"><span class="cat_name">{topic}. Тема {topic}</span>'
+                          f'<div class="cat_children">{children}</div></div>')
+        # Первый блок cat_category на сайте - заголовок каталога
+        return ('<html><body><div class="cat_category"><span class="cat_name">Каталог заданий</span></div>'
+                + ''.join(topics) + '</body></html>')
+
+    def category_problem_ids(self, category_id: int) -> list:
+        topic, n = divmod(category_id, 100)
+        if not (1 <= topic <= self.topics and 1 <= n <= self.categories):
+            return []
+        return [category_id * 100 + i for i in range(1, self.problems + 1)]
+
+    def category_html(self, category_id: int, page: int = 1) -> str:
+        ids = self.category_problem_ids(category_id) if page == 1 else []
+        topic = category_id // 100
+        items = ''.join(f'<div class="prob_maindiv"><span class="prob_nums">Тип {topic} № {pid}</span></div>'
+                        for pid in ids)
+        return f'<html><body>{items}</body></html>'
+
+    # ---------- задачи ----------
+
+    def problem_html(self, problem_id: int) -> str:
+        category_id = problem_id // 100
+        topic = category_id // 100
+        analogs = [pid for pid in self.category_problem_ids(category_id) if pid != problem_id][:4]
+        prob_nums = (f'<span class="prob_nums">Тип {topic} № '
+                     f'<a href="/problem?id={problem_id}">{problem_id}</a></span>')
+        minor = ('<div class="minor">Аналоги к заданию № ' + str(problem_id) + ': '
+                 + ' '.join(f'<a href="/problem?id={pid}">{pid}</a>' for pid in analogs)
+                 + f' <a href="/test?likes={problem_id}">Все</a></div>')
+
+        if not self.pages:
+            return self._synthetic_problem(problem_id, prob_nums, minor)
+
+        html = self.pages[problem_id % len(self.pages)]
+        html = PROB_NUMS_RE.sub(lambda m: prob_nums, html, count=1)
+        html = MINOR_RE.sub(lambda m: minor, html, count=1)
+        return PROBLEM_ID_RE.sub(f'data-id="{problem_id}"', html, count=1)
+
+    @staticmethod
+    def _synthetic_problem(problem_id: int, prob_nums: str, minor: str) -> str:
+        rnd = random.Random(problem_id)
+        formulas = [f'<img class="tex" src="/formula/{rnd.getrandbits(64):016x}.svg">' for _ in range(rnd.randint(1, 12))]
+        condition = f'<p class="left_margin">Найдите значение выражения {formulas[0]} при x = {problem_id % 97}.</p>'
+        solution = ''.join(f'<p class="left_margin">Шаг {i + 1}: {formula}</p>' for i, formula in enumerate(formulas))
+        return (f'<html><body><div class="prob_maindiv" data-id="{problem_id}"><div class="nobreak">{prob_nums}</div>'
+                f'<div class="pbody">{condition}</div>'
+                f'<div class="solution"><div class="pbody"><p><b>Решение.</b></p>{solution}'
+                f'<p>Ответ: {problem_id % 100}.</p></div></div>'
+                f'<div class="answer"><span>Ответ: {problem_id % 100}</span></div>{minor}</div></body></html>')
+
+    @staticmethod
+    def image(path: str) -> bytes:
+        digest = hashlib.sha256(path.encode('utf-8')).hexdigest()
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" width="40" height="16">'
+                f'<text y="12">{digest[:8]}</text></svg>').encode('utf-8')
+
+
+class MockStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.errors = 0
+        self.throttled = 0
+        self.not_modified = 0
+        self.latencies = []
+
+    def add(self, url_class: str, status: int, seconds: float):
+        with self._lock:
+            self.requests[url_class] = self.requests.get(url_class, 0) + 1
+            if status == 429:
+                self.throttled += 1
+            elif status == 304:
+                self.not_modified += 1
+            elif status >= 500:
+                self.errors += 1
+            self.latencies.append(seconds)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latencies = sorted(self.latencies)
+            total = len(latencies)
+            return {
+                'requests': dict(self.requests),
+                'total': total,
+                'errors': self.errors,
+                'throttled': self.throttled,
+                'not_modified': self.not_modified,
+                'p50_ms': latencies[total // 2] * 1000 if total else 0.0,
+                'p95_ms': latencies[min(total - 1, int(total * 0.95))] * 1000 if total else 0.0,
+            }
+
+    def summary(self) -> str:
+        s = self.snapshot()
+        by_class = ', '.join(f"{name}: {count}" for name, count in sorted(s['requests'].items()))
+        return (f"Запросов: {s['total']} ({by_class}); ошибок 5xx: {s['errors']}, 429: {s['throttled']}, "
+                f"304: {s['not_modified']}; p50 {s['p50_ms']:.1f} мс, p95 {s['p95_ms']:.1f} мс")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = 'sdamgia-mock/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.options.verbose:
+            super().log_message(format, *args)
+
+    def _send(self, status: int, body: bytes = b'', content_type: str = 'text/html; charset=utf-8', headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _route(self, path: str, query: dict):
+        """(класс URL, тело, тип содержимого) или None"""
+        corpus = self.server.corpus
+        if path == '/prob_catalog':
+            return 'catalog', corpus.catalog_html().encode('utf-8'), 'text/html; charset=utf-8'
+        if path == '/test' and 'theme' in query:
+            page = int(query.get('page', ['1'])[0] or 1)
+            body = corpus.category_html(int(query['theme'][0]), page)
+            return 'category', body.encode('utf-8'), 'text/html; charset=utf-8'
+        if path == '/problem' and 'id' in query:
+            return 'problem', corpus.problem_html(int(query['id'][0])).encode('utf-8'), 'text/html; charset=utf-8'
+        if IMAGE_PATH_RE.search(path):
+            return 'image', corpus.image(path + '?' + '&'.join(f'{k}={v[0]}' for k, v in sorted(query.items()))), 'image/svg+xml'
+        return None
+
+    def do_GET(self):
+        started = time.perf_counter()
+        options = self.server.options
+        parts = urlsplit(self.path)
+        segments = parts.path.split('/', 2)
+
+        if parts.path == '/__stats':
+            body = json.dumps(self.server.stats.snapshot(), ensure_ascii=False).encode('utf-8')
+            self._send(200, body, 'application/json')
+            return
+
+        # /<host>/<путь> (SDAMGIA_BASE_URL) или просто /<путь>
+        if len(segments) > 2 and segments[1].endswith('sdamgia.ru'):
+            host, path = segments[1], '/' + segments[2]
+        else:
+            host, path = self.headers.get('Host', 'localhost'), parts.path
+
+        try:
+            route = self._route(path, parse_qs(parts.query))
+        except ValueError:
+            route = None
+        url_class = route[0] if route else 'other'
+
+        if options.latency or options.jitter:
+            delay = max(0.0, options.latency + random.uniform(-options.jitter, options.jitter)) / 1000
+            time.sleep(delay)
+
+        status = self._respond(host, route)
+        self.server.stats.add(url_class, status, time.perf_counter() - started)
+
+    do_HEAD = do_GET
+
+    def _respond(self, host: str, route) -> int:
+        options = self.server.options
+        bucket = self.server.bucket(host)
+        if bucket is not None and bucket.reserve() > 0:
+            # Токен все равно взят в долг - отдаем его обратно, 429 не должен съедать лимит
+            with bucket.lock:
+                bucket.tokens += 1
+            self._send(429, b'Too Many Requests', 'text/plain', {'Retry-After': '1'})
+            return 429
+        if options.error_rate and random.random() < options.error_rate:
+            self._send(503, b'Service Unavailable', 'text/plain')
+            return 503
+        if route is None:
+            self._send(404, b'Not Found', 'text/plain')
+            return 404
+
+        _, body, content_type = route
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self._send(304, headers={'ETag': etag})
+            return 304
+        self._send(200, body, content_type, {'ETag': etag, 'Cache-Control': 'max-age=0'})
+        return 200
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, options, corpus: MockCorpus):
+        super().__init__(address, MockHandler)
+        self.options = options
+        self.corpus = corpus
+        self.stats = MockStats()
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+
+    def bucket(self, host: str):
+        """Ведро 429 хоста (None - без ограничения)"""
+        if not self.options.throttle:
+            return None
+        with self._buckets_lock:
+            bucket = self._buckets.get(host)
+            if bucket is None:
+                bucket = self._buckets[host] = TokenBucket(self.options.throttle, self.options.throttle_burst)
+            return bucket
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный стенд СДАМ ГИА для офлайн-прогонов загрузчиков')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', default=str(FIXTURES_DIR), help='Страницы задач *.html')
+    parser.add_argument('--synthetic', action='store_true', help='Генерировать страницы задач вместо корпуса')
+    parser.add_argument('--topics', type=int, default=20, help='Тем в каталоге')
+    parser.add_argument('--categories', type=int, default=5, help='Категорий в теме')
+    parser.add_argument('--problems', type=int, default=30, help='Задач в категории')
+    parser.add_argument('--latency', type=float, default=0.0, help='Задержка ответа, мс')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Разброс задержки, ± мс')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 503 (0..1)')
+    parser.add_argument('--throttle', type=float, default=0.0,
+                        help='Запросов в секунду на хост, сверх которых отвечать 429 (0 - без ограничения)')
+    parser.add_argument('--throttle-burst', type=int, default=10, help='Запас запросов сверх --throttle')
+    parser.add_argument('--seed', type=int, default=None, help='Зерно случайных задержек и ошибок')
+    parser.add_argument('--verbose', action='store_true', help='Печатать каждый запрос')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    # Ctrl+C и kill (в том числе из фонового запуска) завершают стенд со статистикой
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    corpus = MockCorpus(args.fixtures, args.synthetic, args.topics, args.categories, args.problems)
+    server = MockServer((args.host, args.port), args, corpus)
+    source = 'генерируются' if not corpus.pages else f'из корпуса ({len(corpus.pages)} страниц)'
+    print(f"Стенд СДАМ ГИА: http://{args.host}:{args.port} (страницы задач {source}, "
+          f"{args.topics * args.categories * args.problems} задач)")
+    print(f"Загрузчики: SDAMGIA_BASE_URL=http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n{server.stats.summary()}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
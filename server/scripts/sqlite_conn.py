@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Общая фабрика подключений к SQLite для Python-скриптов
+
+tasksbd.db одновременно читает NestJS (tasks.service.ts), поэтому connect()
+настраивает подключение одинаково для всех скриптов:
+- journal_mode=WAL         - читатели не блокируют писателя и наоборот;
+- synchronous=NORMAL       - при загрузке (ingest=True); в WAL это безопасно
+                             для целостности, теряется только последний коммит
+                             при отключении питания. Иначе FULL;
+- mmap_size, cache_size    - чтение страниц через mmap и кэш страниц побольше;
+- temp_store=MEMORY        - временные таблицы и индексы в памяти;
+- foreign_keys=ON          - работают ON DELETE CASCADE из init.sql;
+- busy_timeout             - ожидание блокировки вместо "database is locked".
+
+Использование:
+    conn = connect(db_path)                                 # утилиты
+    conn = connect(db_path, ingest=True)                    # загрузчики
+    conn = connect(db_path, ingest=True, factory=IngestConnection)
+"""
+
+import sqlite3
+
+BUSY_TIMEOUT_MS = 30000
+MMAP_SIZE = 256 * 1024 * 1024       # 256 МБ
+CACHE_SIZE_KB = 64 * 1024           # 64 МБ (отрицательное cache_size - в килобайтах)
+
+
+def apply_pragmas(conn: sqlite3.Connection, ingest: bool = False, wal: bool = True):
+    """Применяет к подключению общие настройки"""
+    conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+    if wal:
+        # Режим WAL сохраняется в файле БД, но включать его можно и повторно
+        conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute(f"PRAGMA synchronous = {'NORMAL' if ingest else 'FULL'}")
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA foreign_keys = ON")
+
+
+def connect(db_path, ingest: bool = False, wal: bool = True, **kwargs) -> sqlite3.Connection:
+    """
+    Открывает настроенное подключение к SQLite
+
+    Args:
+        db_path: Путь к файлу БД
+        ingest: Подключение загрузчика (synchronous=NORMAL)
+        wal: Включать ли журнал WAL
+        **kwargs: Передаются в sqlite3.connect (factory, check_same_thread, ...)
+    """
+    kwargs.setdefault('timeout', BUSY_TIMEOUT_MS / 1000)
+    conn = sqlite3.connect(str(db_path), **kwargs)
+    apply_pragmas(conn, ingest, wal)
+    return conn
@@ -486,10 +486,10 @@ export class TasksService {
   async getCategories() {
     const rows = this.db
       .prepare(`
-        SELECT DISTINCT c.id, c.category_id, c.category_name 
+        SELECT c.id, c.category_id, c.category_name 
         FROM categories c
-        INNER JOIN category_problems cp ON c.id = cp.category_id
         WHERE c.category_name IS NOT NULL 
+          AND EXISTS (SELECT 1 FROM category_problems cp WHERE cp.category_id = c.id)
         ORDER BY c.category_name
       `)
       .all() as any[]